@@ -2,8 +2,12 @@
 # AUTH.PY - Autenticación y autorización
 # ============================================
 
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
@@ -12,15 +16,84 @@ from supabase import Client
 
 from .config import settings
 from .models import TokenData, UsuarioResponse, RolUsuario
-from .database import get_supabase
+from .database import get_supabase, get_supabase_client, ejecutar
+from .cache import TTLCache
 
 # ============================================
 # CONFIGURACIÓN DE SEGURIDAD
 # ============================================
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min/max iguales al costo configurado: los hashes con otro costo quedan
+# marcados para re-hash (ver verify_and_update_password)
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS
+)
 security = HTTPBearer()
 
+# ============================================
+# EJECUTOR DE HASHING
+# ============================================
+
+class EjecutorHash:
+    """
+    Pool acotado de hilos para bcrypt
+    
+    Cada hash/verificación toma cientos de milisegundos de CPU; ejecutarlos
+    aquí evita bloquear el event loop. Registra la cola y el tiempo de espera.
+    """
+    
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self.en_cola = 0
+        self.en_ejecucion = 0
+        self.completadas = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+    
+    async def ejecutar(self, funcion: Callable, *args) -> Any:
+        encolada = time.monotonic()
+        with self._lock:
+            self.en_cola += 1
+        
+        def tarea():
+            espera = time.monotonic() - encolada
+            with self._lock:
+                self.en_cola -= 1
+                self.en_ejecucion += 1
+                self.espera_total += espera
+                self.espera_max = max(self.espera_max, espera)
+            try:
+                return funcion(*args)
+            finally:
+                with self._lock:
+                    self.en_ejecucion -= 1
+                    self.completadas += 1
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, tarea)
+    
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+                "en_cola": self.en_cola,
+                "en_ejecucion": self.en_ejecucion,
+                "completadas": self.completadas,
+                "espera_promedio_ms": round(self.espera_total / self.completadas * 1000, 1) if self.completadas else 0.0,
+                "espera_max_ms": round(self.espera_max * 1000, 1)
+            }
+
+
+# Instancia global del ejecutor de hashing
+ejecutor_hash = EjecutorHash(workers=settings.PASSWORD_HASH_WORKERS)
+
 # ============================================
 # FUNCIONES DE HASHING
 # ============================================
@@ -33,6 +106,23 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verificar contraseña contra hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    """Hash de contraseña en el ejecutor de hashing"""
+    return await ejecutor_hash.ejecutar(pwd_context.hash, password)
+
+async def verify_and_update_password(
+    plain_password: str,
+    hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Verificar contraseña en el ejecutor de hashing
+    Retorna (válida, nuevo_hash); nuevo_hash viene cuando el hash guardado
+    usa un costo distinto a BCRYPT_ROUNDS
+    """
+    return await ejecutor_hash.ejecutar(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
 # ============================================
 # FUNCIONES JWT
 # ============================================
@@ -85,6 +175,73 @@ def decode_access_token(token: str) -> TokenData:
     except JWTError:
         raise credentials_exception
 
+# ============================================
+# CACHÉ DE USUARIOS Y ÚLTIMO ACCESO
+# ============================================
+
+# Usuarios resueltos recientemente, por user_id. Los endpoints de /api/usuarios
+# invalidan la entrada al modificar o eliminar; el TTL corto acota el desfase
+# entre workers distintos.
+cache_usuarios = TTLCache(max_entradas=settings.AUTH_USER_CACHE_MAX_ENTRIES)
+
+def invalidar_usuario(user_id: str) -> None:
+    """Descartar el usuario cacheado tras modificarlo o eliminarlo"""
+    cache_usuarios.invalidar(user_id)
+
+class RegistroAccesos:
+    """
+    Acumula los accesos de usuarios en memoria y los escribe por lotes
+    
+    Cada flush hace un único UPDATE para todos los usuarios vistos desde el
+    anterior, con la hora del acceso más reciente del lote (el error máximo
+    es el intervalo de flush).
+    """
+    
+    def __init__(self):
+        self._accesos: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._tarea: Optional[asyncio.Task] = None
+    
+    def registrar(self, user_id: str) -> None:
+        with self._lock:
+            self._accesos[user_id] = datetime.utcnow()
+    
+    async def flush(self) -> None:
+        with self._lock:
+            accesos, self._accesos = self._accesos, {}
+        if not accesos:
+            return
+        
+        supabase = get_supabase_client()
+        try:
+            await ejecutar(
+                supabase.table("usuarios").update({
+                    "ultimo_acceso": max(accesos.values()).isoformat()
+                }).in_("id", list(accesos))
+            )
+        except Exception as e:
+            print(f"❌ Error al actualizar último acceso: {e}")
+    
+    async def _loop(self, intervalo: float) -> None:
+        while True:
+            await asyncio.sleep(intervalo)
+            await self.flush()
+    
+    def iniciar(self, intervalo: float) -> None:
+        """Lanzar el flush periódico (llamar en el startup)"""
+        self._tarea = asyncio.create_task(self._loop(intervalo))
+    
+    async def detener(self) -> None:
+        """Detener el flush periódico y escribir lo pendiente"""
+        if self._tarea:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+        await self.flush()
+
+
+# Instancia global del registro de accesos
+registro_accesos = RegistroAccesos()
+
 # ============================================
 # DEPENDENCIAS DE AUTENTICACIÓN
 # ============================================
@@ -99,16 +256,19 @@ async def get_current_user(
     token = credentials.credentials
     token_data = decode_access_token(token)
     
-    # Buscar usuario en la base de datos
-    response = supabase.table("usuarios").select("*").eq("id", token_data.user_id).execute()
-    
-    if not response.data or len(response.data) == 0:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Usuario no encontrado"
-        )
-    
-    usuario = response.data[0]
+    # Buscar usuario en caché y, si no está, en la base de datos
+    usuario = cache_usuarios.get(token_data.user_id)
+    if usuario is None:
+        response = await ejecutar(supabase.table("usuarios").select("*").eq("id", token_data.user_id))
+        
+        if not response.data or len(response.data) == 0:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Usuario no encontrado"
+            )
+        
+        usuario = response.data[0]
+        cache_usuarios.set(token_data.user_id, usuario, settings.AUTH_USER_CACHE_TTL)
     
     if not usuario.get("activo", False):
         raise HTTPException(
@@ -116,10 +276,8 @@ async def get_current_user(
             detail="Usuario inactivo"
         )
     
-    # Actualizar último acceso
-    supabase.table("usuarios").update({
-        "ultimo_acceso": datetime.utcnow().isoformat()
-    }).eq("id", usuario["id"]).execute()
+    # Actualizar último acceso (se escribe por lotes)
+    registro_accesos.registrar(usuario["id"])
     
     return UsuarioResponse(**usuario)
 
@@ -162,7 +320,7 @@ async def authenticate_user(
     Autenticar usuario con email y contraseña
     """
     # Buscar usuario por email
-    response = supabase.table("usuarios").select("*").eq("email", email).execute()
+    response = await ejecutar(supabase.table("usuarios").select("*").eq("email", email))
     
     if not response.data or len(response.data) == 0:
         return None
@@ -170,13 +328,24 @@ async def authenticate_user(
     usuario = response.data[0]
     
     # Verificar contraseña
-    if not verify_password(password, usuario["password_hash"]):
+    valida, nuevo_hash = await verify_and_update_password(password, usuario["password_hash"])
+    if not valida:
         return None
     
     # Verificar que esté activo
     if not usuario.get("activo", False):
         return None
     
+    # Re-hash transparente si cambió el costo de bcrypt
+    if nuevo_hash:
+        try:
+            await ejecutar(supabase.table("usuarios").update({
+                "password_hash": nuevo_hash
+            }).eq("id", usuario["id"]))
+            invalidar_usuario(usuario["id"])
+        except Exception as e:
+            print(f"❌ Error al actualizar hash de {email}: {e}")
+    
     return usuario
 
 async def crear_usuario_inicial(supabase: Client) -> None:
@@ -185,9 +354,9 @@ async def crear_usuario_inicial(supabase: Client) -> None:
     """
     try:
         # Verificar si ya existe
-        response = supabase.table("usuarios").select("id").eq(
+        response = await ejecutar(supabase.table("usuarios").select("id").eq(
             "email", settings.ADMIN_EMAIL
-        ).execute()
+        ))
         
         if response.data and len(response.data) > 0:
             print(f"✅ Usuario admin {settings.ADMIN_EMAIL} ya existe")
@@ -196,13 +365,13 @@ async def crear_usuario_inicial(supabase: Client) -> None:
         # Crear usuario admin
         usuario_data = {
             "email": settings.ADMIN_EMAIL,
-            "password_hash": hash_password(settings.ADMIN_PASSWORD),
+            "password_hash": await hash_password_async(settings.ADMIN_PASSWORD),
             "nombre": settings.ADMIN_NAME,
             "rol": RolUsuario.ADMIN.value,
             "activo": True
         }
         
-        supabase.table("usuarios").insert(usuario_data).execute()
+        await ejecutar(supabase.table("usuarios").insert(usuario_data))
         print(f"✅ Usuario admin {settings.ADMIN_EMAIL} creado exitosamente")
         
     except Exception as e:
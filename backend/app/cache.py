@@ -0,0 +1,81 @@
+# ============================================
+# CACHE.PY - Caché en memoria con TTL y LRU
+# ============================================
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# ============================================
+# CACHÉ TTL + LRU
+# ============================================
+
+class TTLCache:
+    """
+    Caché acotada en memoria, segura entre hilos
+
+    Cada entrada expira según su propio TTL y, al superar el máximo de
+    entradas, se desaloja la usada hace más tiempo (LRU).
+    """
+
+    def __init__(self, max_entradas: int):
+        self.max_entradas = max_entradas
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expirados = 0
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        """Retornar el valor vigente o None si no existe o expiró"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                del self._datos[clave]
+                self.expirados += 1
+                self.fallos += 1
+                return None
+
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def set(self, clave: Hashable, valor: Any, ttl: float) -> None:
+        """Guardar un valor por ttl segundos"""
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, clave: Hashable) -> None:
+        """Eliminar una entrada si existe"""
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        """Eliminar todas las entradas"""
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché"""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "expirados": self.expirados,
+                "tasa_aciertos": round(self.aciertos / consultas, 3) if consultas else 0.0
+            }
@@ -0,0 +1,213 @@
+# ============================================
+# CAPTURA_NCE.PY - Grabación y reproducción de respuestas de NCE
+# ============================================
+
+import gzip
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict
+from http import HTTPStatus
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .config import settings
+
+# ============================================
+# FORMATO DEL CORPUS
+# ============================================
+# Un objeto JSON por intento HTTP, comprimido con gzip (cada registro es un
+# miembro gzip propio: el archivo se puede seguir ampliando y un proceso que
+# se corta no deja el resto ilegible). Campos:
+#   t            epoch de la respuesta
+#   metodo       GET / POST
+#   ruta         ruta RESTCONF sin host (el corpus no depende del servidor)
+#   params       query string
+#   payload      cuerpo JSON enviado (POST)
+#   status       status HTTP (null si no hubo respuesta)
+#   content_type tipo del cuerpo recibido
+#   cuerpo       cuerpo recibido tal cual (texto)
+#   latencia_ms  duración del intento
+#   error        null, "timeout" o "conexion"
+#
+# Los cuerpos contienen datos reales de clientes: tratar el corpus como tal.
+
+ERROR_TIMEOUT = "timeout"
+ERROR_CONEXION = "conexion"
+
+def mac_consultada(params: Optional[Dict[str, Any]], payload: Any) -> str:
+    """MAC del gateway consultado, desde el query string o el payload"""
+    if params and params.get("mac"):
+        return str(params["mac"])
+    pendientes = [payload]
+    while pendientes:
+        valor = pendientes.pop()
+        if isinstance(valor, dict):
+            for clave in ("mac", "gateway-mac"):
+                if isinstance(valor.get(clave), str):
+                    return valor[clave]
+            pendientes.extend(valor.values())
+        elif isinstance(valor, list):
+            pendientes.extend(valor)
+    return ""
+
+def leer_corpus(ruta: str) -> Iterator[Dict[str, Any]]:
+    """Registros de un corpus (.jsonl.gz o .jsonl sin comprimir)"""
+    abrir = gzip.open if ruta.endswith(".gz") else open
+    with abrir(ruta, "rt", encoding="utf-8") as archivo:
+        for linea in archivo:
+            if linea.strip():
+                yield json.loads(linea)
+
+# ============================================
+# GRABACIÓN
+# ============================================
+
+class GrabadorNCE:
+    """Agrega cada intento HTTP a NCE (pedido, respuesta y tiempo) al corpus"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self.registros = 0
+
+    def registrar(
+        self,
+        metodo: str,
+        url: str,
+        params: Optional[Dict[str, Any]],
+        payload: Any,
+        latencia_ms: float,
+        respuesta: Optional[requests.Response] = None,
+        error: Optional[str] = None
+    ) -> None:
+        registro = {
+            "t": round(time.time(), 3),
+            "metodo": metodo.upper(),
+            "ruta": urlsplit(url).path,
+            "params": params or {},
+            "payload": payload,
+            "status": respuesta.status_code if respuesta is not None else None,
+            "content_type": respuesta.headers.get("Content-Type") if respuesta is not None else None,
+            "cuerpo": respuesta.text if respuesta is not None else None,
+            "latencia_ms": round(latencia_ms, 1),
+            "error": error
+        }
+        linea = (json.dumps(registro, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            with open(self.ruta, "ab") as archivo:
+                archivo.write(gzip.compress(linea) if self.ruta.endswith(".gz") else linea)
+            self.registros += 1
+
+@lru_cache()
+def get_grabador() -> Optional[GrabadorNCE]:
+    """Grabador del proceso, o None si NCE_CAPTURE_FILE está vacío"""
+    return GrabadorNCE(settings.NCE_CAPTURE_FILE) if settings.NCE_CAPTURE_FILE else None
+
+# ============================================
+# REPRODUCCIÓN
+# ============================================
+
+class CorpusNCE:
+    """
+    Respuestas grabadas indexadas por (método, ruta, banda, MAC)
+
+    Si la MAC consultada no está en el corpus se usa cualquier gateway
+    grabado para el mismo endpoint y banda, de modo que un corpus de pocos
+    gateways reales sirve para cargas con muchas MACs. Las respuestas de una
+    misma clave se entregan en orden circular (los reintentos reciben las
+    respuestas siguientes, como en la grabación).
+    """
+
+    def __init__(self, registros: List[Dict[str, Any]]):
+        por_mac = defaultdict(list)
+        por_endpoint = defaultdict(list)
+        for registro in registros:
+            endpoint = self._endpoint(registro["metodo"], registro["ruta"], registro["params"])
+            por_mac[(*endpoint, mac_consultada(registro["params"], registro["payload"]))].append(registro)
+            por_endpoint[endpoint].append(registro)
+        self._lock = threading.Lock()
+        self._por_mac = {clave: itertools.cycle(lista) for clave, lista in por_mac.items()}
+        self._por_endpoint = {clave: itertools.cycle(lista) for clave, lista in por_endpoint.items()}
+        self.total = len(registros)
+        self.gateways = len({clave[-1] for clave in por_mac})
+
+    @classmethod
+    def desde_archivo(cls, ruta: str) -> "CorpusNCE":
+        return cls(list(leer_corpus(ruta)))
+
+    @staticmethod
+    def _endpoint(metodo: str, ruta: str, params: Dict[str, Any]) -> Tuple[str, str, str]:
+        return metodo.upper(), ruta, str(params.get("radio-type", ""))
+
+    def buscar(self, metodo: str, ruta: str, params: Dict[str, Any], payload: Any) -> Optional[Dict[str, Any]]:
+        endpoint = self._endpoint(metodo, ruta, params)
+        with self._lock:
+            ciclo = self._por_mac.get((*endpoint, mac_consultada(params, payload)))
+            if ciclo is None:
+                ciclo = self._por_endpoint.get(endpoint)
+            return next(ciclo) if ciclo is not None else None
+
+class AdaptadorReproduccion(BaseAdapter):
+    """
+    Transporte de requests que responde desde un corpus en vez de la red
+    Espera la latencia grabada dividida por `velocidad` (0 = sin esperas)
+    """
+
+    def __init__(self, corpus: CorpusNCE, velocidad: float = 1.0):
+        super().__init__()
+        self.corpus = corpus
+        self.velocidad = velocidad
+
+    def send(self, request: requests.PreparedRequest, timeout: Any = None, **kwargs: Any) -> requests.Response:
+        url = urlsplit(request.url)
+        params = dict(parse_qsl(url.query))
+        payload = json.loads(request.body) if request.body else None
+        registro = self.corpus.buscar(request.method, url.path, params, payload)
+
+        if registro is None:
+            return self._respuesta(request, 404, json.dumps({
+                "errors": {"error": [{"error-message": "Sin respuesta grabada para este endpoint"}]}
+            }), "application/json")
+
+        espera = registro["latencia_ms"] / 1000 / self.velocidad if self.velocidad > 0 else 0.0
+        limite = timeout[1] if isinstance(timeout, tuple) else timeout
+        if limite is not None and espera > limite:
+            time.sleep(limite)
+            raise requests.exceptions.ReadTimeout(f"Respuesta grabada tardó {registro['latencia_ms']} ms", request=request)
+        time.sleep(espera)
+
+        if registro["error"] == ERROR_TIMEOUT:
+            raise requests.exceptions.ReadTimeout("Timeout grabado", request=request)
+        if registro["error"] == ERROR_CONEXION:
+            raise requests.exceptions.ConnectionError("Error de conexión grabado", request=request)
+        return self._respuesta(request, registro["status"], registro["cuerpo"], registro["content_type"])
+
+    def _respuesta(self, request: requests.PreparedRequest, status: int, cuerpo: str, content_type: Optional[str]) -> requests.Response:
+        respuesta = requests.Response()
+        respuesta.status_code = status
+        respuesta.reason = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else ""
+        respuesta.headers = CaseInsensitiveDict({"Content-Type": content_type or "application/json"})
+        respuesta._content = (cuerpo or "").encode("utf-8")
+        respuesta.encoding = "utf-8"
+        respuesta.url = request.url
+        respuesta.request = request
+        return respuesta
+
+    def close(self) -> None:
+        pass
+
+@lru_cache()
+def get_adaptador_reproduccion() -> Optional[AdaptadorReproduccion]:
+    """Adaptador compartido (el corpus se carga una vez), o None si NCE_REPLAY_FILE está vacío"""
+    if not settings.NCE_REPLAY_FILE:
+        return None
+    corpus = CorpusNCE.desde_archivo(settings.NCE_REPLAY_FILE)
+    print(f"📼 Reproduciendo NCE desde {settings.NCE_REPLAY_FILE}: {corpus.total} respuestas de {corpus.gateways} gateways")
+    return AdaptadorReproduccion(corpus, settings.NCE_REPLAY_SPEED)
@@ -0,0 +1,235 @@
+# ============================================
+# COMPACTACION.PY - Compactación de datos para prompts
+# ============================================
+
+import logging
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .datos_tecnicos import (
+    CLAVES_METADATA,
+    SECCIONES_POR_BANDA,
+    migrar_datos_tecnicos,
+    renderizar_seccion,
+    renderizar_datos_tecnicos
+)
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONSTANTES
+# ============================================
+
+# Secciones ordenadas por valor diagnóstico (las últimas se recortan primero)
+PRIORIDAD_SECCIONES = [
+    "basic_info",
+    "connected_devices",
+    "wifi_band_info",
+    "performance_data",
+    "neighboring_ssids",
+    "downstream_ports",
+    "guest_wifi_info",
+    "session_info",
+]
+
+# Máximo de elementos por lista en cada pasada (se reduce hasta caber)
+NIVELES_ITEMS_LISTA = [50, 20, 10, 5, 2]
+
+# Campos categóricos con hasta esta cantidad de valores distintos se resumen con conteos
+MAX_VALORES_CATEGORICOS = 6
+
+_SEPARADORES_MAC = re.compile(r"[:\-.]")
+
+# ============================================
+# ESTIMACIÓN DE TOKENS
+# ============================================
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimación aproximada de tokens (~4 caracteres por token)
+    Suficiente para presupuestar sin depender del tokenizador del modelo
+    """
+    return math.ceil(len(texto) / 4)
+
+# ============================================
+# COMPACTACIÓN DE VALORES
+# ============================================
+
+def mac_sin_separadores(mac: Any) -> str:
+    """MAC en mayúsculas sin separadores, para compararla con los valores de NCE"""
+    return _SEPARADORES_MAC.sub("", str(mac)).upper()
+
+def _es_vacio(valor: Any) -> bool:
+    return valor is None or valor == "" or valor == [] or valor == {}
+
+def _como_numero(valor: Any) -> Optional[float]:
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    if isinstance(valor, str):
+        try:
+            return float(valor)
+        except ValueError:
+            return None
+    return None
+
+def resumen_lista(elementos: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Estadísticas por campo de una lista de registros"""
+    resumen = {}
+    campos = {campo for elemento in elementos for campo in elemento}
+
+    for campo in sorted(campos):
+        valores = [e[campo] for e in elementos if campo in e and not isinstance(e[campo], (dict, list))]
+        if not valores:
+            continue
+
+        numeros = [n for n in (_como_numero(v) for v in valores) if n is not None]
+        if numeros and len(numeros) == len(valores):
+            resumen[campo] = {
+                "min": min(numeros),
+                "max": max(numeros),
+                "prom": round(sum(numeros) / len(numeros), 2)
+            }
+            continue
+
+        conteo = Counter(str(v) for v in valores)
+        if len(conteo) <= MAX_VALORES_CATEGORICOS:
+            resumen[campo] = dict(conteo)
+
+    return resumen
+
+def compactar_valor(valor: Any, max_items: int, mac: str) -> Any:
+    """
+    Eliminar campos vacíos y redundantes y recortar listas largas
+    """
+    if isinstance(valor, dict):
+        compacto = {}
+        for clave, sub in valor.items():
+            # La MAC del propio gateway se repite en casi todos los registros
+            if isinstance(sub, str) and mac_sin_separadores(sub) == mac:
+                continue
+            sub = compactar_valor(sub, max_items, mac)
+            if not _es_vacio(sub):
+                compacto[clave] = sub
+        return compacto
+
+    if isinstance(valor, list):
+        elementos = [compactar_valor(v, max_items, mac) for v in valor]
+        elementos = [e for e in elementos if not _es_vacio(e)]
+
+        registros = [e for e in elementos if isinstance(e, dict)]
+        if len(registros) < 2 or len(registros) != len(elementos):
+            return elementos[:max_items] if len(elementos) > max_items else elementos
+
+        # Campos con el mismo valor en todos los registros se informan una sola vez
+        comunes = {
+            clave: sub for clave, sub in registros[0].items()
+            if not isinstance(sub, (dict, list))
+            and all(r.get(clave) == sub for r in registros[1:])
+        }
+        if comunes:
+            registros = [
+                {k: v for k, v in r.items() if k not in comunes}
+                for r in registros
+            ]
+
+        if len(registros) <= max_items and not comunes:
+            return registros
+
+        compacto = {"total": len(registros)}
+        if comunes:
+            compacto["comunes"] = comunes
+        if len(registros) > max_items:
+            compacto["resumen"] = resumen_lista(registros)
+            compacto["mostrados"] = max_items
+        compacto["elementos"] = registros[:max_items]
+        return compacto
+
+    return valor
+
+def _compactar_resultado(resultado: Any, max_items: int, mac: str) -> Any:
+    if not isinstance(resultado, dict) or "estado" not in resultado:
+        return resultado
+    return {
+        "estado": resultado["estado"],
+        "error": resultado.get("error"),
+        "datos": compactar_valor(resultado.get("datos"), max_items, mac)
+    }
+
+def _compactar_seccion(seccion: str, valor: Any, max_items: int, mac: str) -> Any:
+    if seccion in SECCIONES_POR_BANDA and isinstance(valor, dict):
+        return {
+            band: _compactar_resultado(resultado, max_items, mac)
+            for band, resultado in valor.items()
+        }
+    return _compactar_resultado(valor, max_items, mac)
+
+# ============================================
+# COMPACTACIÓN CON PRESUPUESTO
+# ============================================
+
+def _renderizar(secciones: Dict[str, Any]) -> str:
+    return "\n\n".join(renderizar_seccion(s, v) for s, v in secciones.items())
+
+def compactar_datos_tecnicos(
+    datos_tecnicos: Dict[str, Any],
+    presupuesto_tokens: int
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Renderizar los datos técnicos para el prompt dentro de un presupuesto de tokens
+
+    1. Elimina campos nulos/vacíos y valores redundantes (MAC del gateway,
+       campos repetidos en todos los registros de una lista).
+    2. Recorta listas largas dejando estadísticas de resumen, reduciendo el
+       máximo de elementos hasta que el texto cabe en el presupuesto.
+    3. Si aún no cabe, omite secciones de menor valor diagnóstico.
+
+    Retorna (texto, estadísticas de tokens antes/después)
+    """
+    original = renderizar_datos_tecnicos(datos_tecnicos)
+    datos = migrar_datos_tecnicos(datos_tecnicos)
+    mac = mac_sin_separadores(datos.get("mac_address", ""))
+
+    secciones = [s for s in PRIORIDAD_SECCIONES if s in datos] + [
+        s for s in datos if s not in PRIORIDAD_SECCIONES and s not in CLAVES_METADATA
+    ]
+
+    for max_items in NIVELES_ITEMS_LISTA:
+        compactas = {
+            s: _compactar_seccion(s, datos[s], max_items, mac)
+            for s in secciones
+        }
+        texto = _renderizar(compactas)
+        if estimar_tokens(texto) <= presupuesto_tokens:
+            break
+
+    omitidas = []
+    while estimar_tokens(texto) > presupuesto_tokens and len(compactas) > 1:
+        seccion = list(compactas)[-1]
+        del compactas[seccion]
+        omitidas.append(seccion)
+        texto = _renderizar(compactas)
+
+    if omitidas:
+        texto += f"\n\n[Secciones omitidas por límite de contexto: {', '.join(omitidas)}]"
+
+    estadisticas = {
+        "tokens_originales": estimar_tokens(original),
+        "tokens_compactados": estimar_tokens(texto),
+        "presupuesto_tokens": presupuesto_tokens,
+        "max_items_lista": max_items,
+        "secciones_omitidas": omitidas
+    }
+    logger.info(
+        "Compactación de prompt %s: %d -> %d tokens (presupuesto %d, omitidas: %s)",
+        datos.get("mac_address"),
+        estadisticas["tokens_originales"],
+        estadisticas["tokens_compactados"],
+        presupuesto_tokens,
+        omitidas or "ninguna"
+    )
+
+    return texto, estadisticas
@@ -16,11 +16,42 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_KEY: str
     SUPABASE_SERVICE_KEY: str
+    DB_POOL_SIZE: int = 16
+    DB_QUERY_TIMEOUT: int = 10
     
     # Gateway API (Huawei)
     GATEWAY_BASE_URL: str
     GATEWAY_USERNAME: str
     GATEWAY_PASSWORD: str
+    NCE_SECTION_TIMEOUT: int = 20
+    NCE_ANALYSIS_TIMEOUT: int = 30
+    NCE_CACHE_ENABLED: bool = True
+    NCE_CACHE_MAX_ENTRIES: int = 2000
+    NCE_MAX_RETRIES: int = 2
+    NCE_RETRY_BASE_SECONDS: float = 0.5
+    NCE_RETRY_MAX_SECONDS: float = 4.0
+    NCE_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    NCE_CIRCUIT_RESET_SECONDS: int = 30
+    # Grabación de respuestas de NCE (vacío = desactivada) y reproducción sin NCE
+    NCE_CAPTURE_FILE: str = ""
+    NCE_REPLAY_FILE: str = ""
+    NCE_REPLAY_SPEED: float = 1.0
+    
+    # Poller de la flota: KPIs de PM de los gateways vigilados
+    # MACs separadas por coma; si FLEET_WATCHLIST_FILE existe (una MAC por línea) tiene prioridad
+    FLEET_WATCHLIST: str = ""
+    FLEET_WATCHLIST_FILE: str = ""
+    # Cada consulta trae la última hora de PM: intervalos mayores dejan huecos
+    FLEET_POLL_INTERVAL_SECONDS: int = 900
+    FLEET_POLL_CONCURRENCY: int = 4
+    # KPIs a guardar separados por coma (vacío = todos los numéricos salvo identificadores)
+    FLEET_KPIS: str = ""
+    FLEET_MAX_KPIS_PER_GATEWAY: int = 64
+    FLEET_RETENTION_5M_DAYS: int = 2
+    FLEET_RETENTION_1H_DAYS: int = 30
+    FLEET_RETENTION_1D_DAYS: int = 365
+    # Instantánea de las series (vacío = solo en memoria, se pierden al reiniciar)
+    FLEET_STORE_FILE: str = ""
     
     # Google Gemini
     GOOGLE_API_KEY: str
@@ -29,6 +60,11 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 24
+    AUTH_USER_CACHE_TTL: int = 30
+    AUTH_USER_CACHE_MAX_ENTRIES: int = 1000
+    LAST_ACCESS_FLUSH_SECONDS: int = 30
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
     
     # Admin inicial
     ADMIN_EMAIL: str
@@ -43,12 +79,27 @@ class Settings(BaseSettings):
     DEBUG: bool = False
     LOG_LEVEL: str = "INFO"
     
+    # Trazas (none | console | jsonl)
+    TRACING_EXPORTER: str = "none"
+    TRACING_FILE: str = "trazas.jsonl"
+    
     # CORS
     ALLOWED_ORIGINS: str = "*"
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
     MAX_CONCURRENT_REQUESTS: int = 10
+    NCE_MAX_CONCURRENT: int = 32
+    LLM_MAX_CONCURRENT: int = 8
+    
+    # Análisis asíncrono
+    ANALYSIS_WORKERS: int = 4
+    ANALYSIS_QUEUE_MAX: int = 200
+    # Por debajo del plazo de SIGTERM de la plataforma (~30s en Render)
+    ANALYSIS_SHUTDOWN_TIMEOUT: int = 20
+    
+    # Análisis masivo
+    BULK_INSERT_BATCH_SIZE: int = 10
     
     # File Upload
     MAX_FILE_SIZE_MB: int = 10
@@ -57,8 +108,20 @@ class Settings(BaseSettings):
     # AI Configuration
     DEFAULT_PROMPT_TEMPLATE: str = "default"
     MAX_CHAT_HISTORY: int = 20
+    CHAT_HISTORIAL_TOKEN_BUDGET: int = 3000
+    CHAT_RESUMEN_MAX_TOKENS: int = 600
     AI_MODEL: str = "gemini-1.5-flash"
     AI_TEMPERATURE: float = 0.7
+    AI_CHAT_TEMPERATURE: float = 0.5
+    AI_REPORT_TOKEN_BUDGET: int = 12000
+    AI_CHAT_TOKEN_BUDGET: int = 8000
+    AI_CHAT_RETRIEVAL_ENABLED: bool = True
+    AI_CHAT_RETRIEVAL_TOKEN_BUDGET: int = 3000
+    AI_CHAT_INDEX_CACHE_MAX_ENTRIES: int = 200
+    AI_CHAT_INDEX_CACHE_TTL: int = 1800
+    AI_REPORT_CACHE_ENABLED: bool = True
+    AI_REPORT_CACHE_MAX_ENTRIES: int = 500
+    AI_REPORT_CACHE_TTL: int = 900
     
     class Config:
         env_file = ".env"
@@ -70,6 +133,11 @@ class Settings(BaseSettings):
         if self.ALLOWED_ORIGINS == "*":
             return ["*"]
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
+    
+    @property
+    def fleet_kpis_list(self) -> List[str]:
+        """KPIs de la flota como lista (vacía = todos)"""
+        return [kpi.strip() for kpi in self.FLEET_KPIS.split(",") if kpi.strip()]
 
 
 @lru_cache()
@@ -2,9 +2,16 @@
 # DATABASE.PY - Conexión con Supabase
 # ============================================
 
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
 from functools import lru_cache
+from typing import Any, Optional
 from .config import settings
+from .metricas import DB_CONSULTA_SEGUNDOS, DB_ERRORES, etiquetas_consulta
+from .trazas import span
 
 # ============================================
 # CLIENTE SUPABASE
@@ -18,7 +25,10 @@ def get_supabase_client() -> Client:
     """
     return create_client(
         settings.SUPABASE_URL,
-        settings.SUPABASE_KEY
+        settings.SUPABASE_KEY,
+        options=ClientOptions(
+            postgrest_client_timeout=settings.DB_QUERY_TIMEOUT
+        )
     )
 
 def get_supabase() -> Client:
@@ -28,6 +38,44 @@ def get_supabase() -> Client:
     """
     return get_supabase_client()
 
+# ============================================
+# EJECUCIÓN NO BLOQUEANTE DE CONSULTAS
+# ============================================
+
+class TimeoutConsultaDB(Exception):
+    """La consulta a Supabase superó su tiempo límite"""
+    pass
+
+# supabase-py es síncrono: las consultas se ejecutan en un pool de hilos
+# acotado, que a su vez reutiliza las conexiones HTTP del cliente cacheado
+_db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_POOL_SIZE,
+    thread_name_prefix="supabase"
+)
+
+async def ejecutar(query: Any, timeout: Optional[float] = None) -> Any:
+    """
+    Ejecutar un query builder de Supabase sin bloquear el event loop
+    Lanza TimeoutConsultaDB si no responde dentro de timeout (o DB_QUERY_TIMEOUT)
+    """
+    loop = asyncio.get_running_loop()
+    tabla, metodo = etiquetas_consulta(query)
+    inicio = time.monotonic()
+    with span(f"supabase.{tabla}", tabla=tabla, metodo=metodo):
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(_db_executor, query.execute),
+                timeout=timeout or settings.DB_QUERY_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            DB_ERRORES.labels(tabla, "timeout").inc()
+            raise TimeoutConsultaDB("La base de datos no respondió a tiempo")
+        except Exception:
+            DB_ERRORES.labels(tabla, "error").inc()
+            raise
+        finally:
+            DB_CONSULTA_SEGUNDOS.labels(tabla, metodo).observe(time.monotonic() - inicio)
+
 # ============================================
 # FUNCIONES DE UTILIDAD
 # ============================================
@@ -39,7 +87,7 @@ async def verificar_conexion() -> bool:
     try:
         supabase = get_supabase_client()
         # Hacer una consulta simple para verificar
-        response = supabase.table("usuarios").select("id").limit(1).execute()
+        await ejecutar(supabase.table("usuarios").select("id").limit(1))
         return True
     except Exception as e:
         print(f"❌ Error de conexión con Supabase: {e}")
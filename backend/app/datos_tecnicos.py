@@ -0,0 +1,166 @@
+# ============================================
+# DATOS_TECNICOS.PY - Formato de datos técnicos
+# ============================================
+
+import json
+import re
+from typing import Any, Dict, Optional
+
+# ============================================
+# CONSTANTES
+# ============================================
+
+# Versión del formato estructurado de datos_tecnicos
+# (las filas sin la clave "formato" guardan las secciones como texto)
+FORMATO_DATOS = 2
+
+BANDAS_WIFI = ["2.4G", "5G"]
+
+# Claves de datos_tecnicos que no son secciones del gateway
+CLAVES_METADATA = ["formato", "mac_address", "timestamp", "secciones_faltantes"]
+
+# Títulos de cada sección al renderizar los datos como texto
+TITULOS_SECCIONES = {
+    "basic_info": "INFORMACIÓN BÁSICA DEL GATEWAY",
+    "connected_devices": "DISPOSITIVOS CONECTADOS",
+    "performance_data": "DATOS DE RENDIMIENTO",
+    "wifi_band_info": "CONFIGURACIÓN WIFI",
+    "guest_wifi_info": "WIFI INVITADOS",
+    "downstream_ports": "PUERTOS LAN",
+    "neighboring_ssids": "REDES VECINAS",
+    "session_info": "SESIONES ACTIVAS",
+}
+
+# Secciones que se consultan por separado para cada banda
+SECCIONES_POR_BANDA = ["wifi_band_info", "neighboring_ssids"]
+
+# Estados posibles de una consulta
+ESTADO_OK = "ok"
+ESTADO_ERROR = "error"
+ESTADO_TIMEOUT = "timeout"
+
+# ============================================
+# RESULTADO DE UNA CONSULTA
+# ============================================
+
+def resultado_consulta(
+    estado: str,
+    datos: Any = None,
+    error: Optional[str] = None,
+    http_status: Optional[int] = None,
+    latencia_ms: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Representación estructurada de una consulta a NCE
+    "datos" guarda el JSON ya parseado (o el detalle del error si NCE lo envió)
+    """
+    return {
+        "estado": estado,
+        "http_status": http_status,
+        "latencia_ms": round(latencia_ms, 1) if latencia_ms is not None else None,
+        "error": error,
+        "datos": datos
+    }
+
+# ============================================
+# RENDERIZADO A TEXTO (SOLO PARA PROMPTS)
+# ============================================
+
+def _renderizar_resultado(resultado: Dict[str, Any]) -> str:
+    if resultado.get("estado") == ESTADO_OK:
+        return json.dumps(resultado.get("datos"), ensure_ascii=False)
+
+    texto = f"[i] No disponible: {resultado.get('error') or resultado.get('estado')}"
+    if resultado.get("datos") is not None:
+        texto += f"\nDetalles: {json.dumps(resultado['datos'], ensure_ascii=False)}"
+    return texto
+
+def renderizar_seccion(seccion: str, valor: Any) -> str:
+    """Renderizar una sección de datos_tecnicos como texto"""
+    # Filas antiguas: la sección ya es texto
+    if isinstance(valor, str):
+        return valor
+
+    titulo = TITULOS_SECCIONES.get(seccion, seccion.upper())
+    if seccion in SECCIONES_POR_BANDA:
+        cuerpo = "\n".join(
+            f"--- Banda {band} ---\n{_renderizar_resultado(resultado)}"
+            for band, resultado in valor.items()
+        )
+    else:
+        cuerpo = _renderizar_resultado(valor)
+
+    return f"===== {titulo} =====\n{cuerpo}"
+
+def renderizar_datos_tecnicos(datos_tecnicos: Dict[str, Any]) -> str:
+    """Convertir datos técnicos a texto para el prompt"""
+    return "\n\n".join([
+        renderizar_seccion(key, value)
+        for key, value in datos_tecnicos.items()
+        if key not in CLAVES_METADATA
+    ])
+
+# ============================================
+# MIGRACIÓN DE FILAS ANTIGUAS
+# ============================================
+
+_ENCABEZADO_LEGADO = re.compile(r"^\s*=+\n=+ .* =+\n=+")
+_BANDA_LEGADO = re.compile(r"\n--- Banda (\S+) ---")
+_HTTP_STATUS_LEGADO = re.compile(r"consulta: (\d{3})\b")
+
+def _migrar_texto(texto: str) -> Dict[str, Any]:
+    """Convertir el texto de una consulta (formato antiguo) a resultado estructurado"""
+    texto = texto.strip()
+
+    if texto.startswith("[i] No disponible"):
+        primera_linea, _, resto = texto.partition("\nDetalles: ")
+        detalles = None
+        if resto:
+            try:
+                detalles = json.loads(resto)
+            except json.JSONDecodeError:
+                detalles = resto
+        codigo = _HTTP_STATUS_LEGADO.search(primera_linea)
+        return resultado_consulta(
+            ESTADO_ERROR,
+            datos=detalles,
+            error=primera_linea.split(": ", 1)[-1],
+            http_status=int(codigo.group(1)) if codigo else None
+        )
+
+    if texto.startswith("[!]"):
+        estado = ESTADO_TIMEOUT if "tiempo límite" in texto else ESTADO_ERROR
+        return resultado_consulta(estado, error=texto.split(": ", 1)[-1])
+
+    try:
+        return resultado_consulta(ESTADO_OK, datos=json.loads(texto))
+    except json.JSONDecodeError:
+        return resultado_consulta(ESTADO_ERROR, error="Texto no interpretable", datos=texto)
+
+def migrar_datos_tecnicos(datos_tecnicos: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convertir datos_tecnicos guardados como texto al formato estructurado
+    Las filas que ya están en el formato actual se retornan sin cambios
+    """
+    if datos_tecnicos.get("formato") == FORMATO_DATOS:
+        return datos_tecnicos
+
+    migrados = {"formato": FORMATO_DATOS}
+    for key, value in datos_tecnicos.items():
+        if key in CLAVES_METADATA or not isinstance(value, str):
+            migrados[key] = value
+            continue
+
+        cuerpo = _ENCABEZADO_LEGADO.sub("", value, count=1)
+        if key in SECCIONES_POR_BANDA:
+            # ["", "2.4G", "<texto>", "5G", "<texto>"]
+            partes = _BANDA_LEGADO.split(cuerpo)
+            migrados[key] = {
+                band: _migrar_texto(texto)
+                for band, texto in zip(partes[1::2], partes[2::2])
+            }
+        else:
+            migrados[key] = _migrar_texto(cuerpo)
+
+    migrados.setdefault("secciones_faltantes", [])
+    return migrados
@@ -0,0 +1,182 @@
+# ============================================
+# FLOTA.PY - Poller periódico de KPIs de PM de los gateways vigilados
+# ============================================
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+from .datos_tecnicos import ESTADO_OK
+from .gateway_analyzer import GatewayAnalyzer
+from .metricas import FLOTA_CICLO_SEGUNDOS, FLOTA_CONSULTAS
+from .models import normalizar_mac
+from .series_kpi import AlmacenKPI, NIVEL_1D, NIVEL_1H, NIVEL_5M, extraer_muestras
+from .trazas import span
+
+# ============================================
+# WATCHLIST
+# ============================================
+
+def leer_watchlist() -> List[str]:
+    """MACs vigiladas: FLEET_WATCHLIST_FILE si existe, si no FLEET_WATCHLIST"""
+    if settings.FLEET_WATCHLIST_FILE and os.path.exists(settings.FLEET_WATCHLIST_FILE):
+        with open(settings.FLEET_WATCHLIST_FILE) as f:
+            entradas = [linea.strip() for linea in f]
+    else:
+        entradas = settings.FLEET_WATCHLIST.split(",")
+
+    macs = []
+    for entrada in entradas:
+        if not entrada.strip() or entrada.startswith("#"):
+            continue
+        try:
+            macs.append(normalizar_mac(entrada.strip()))
+        except ValueError:
+            print(f"⚠️ MAC inválida en la watchlist de la flota: {entrada!r}")
+    return list(dict.fromkeys(macs))
+
+def guardar_watchlist(macs: List[str]) -> None:
+    """Persistir la watchlist en FLEET_WATCHLIST_FILE (si está configurado)"""
+    if not settings.FLEET_WATCHLIST_FILE:
+        return
+    temporal = f"{settings.FLEET_WATCHLIST_FILE}.tmp"
+    with open(temporal, "w") as f:
+        f.write("".join(f"{mac}\n" for mac in macs))
+    os.replace(temporal, settings.FLEET_WATCHLIST_FILE)
+
+# ============================================
+# POLLER
+# ============================================
+
+class PollerFlota:
+    """
+    Consulta la última hora de PM (QUALITY_ANALYSIS) de cada gateway vigilado
+    cada FLEET_POLL_INTERVAL_SECONDS y la guarda en el almacén de series, de
+    modo que las tendencias de semanas se responden sin volver a NCE.
+
+    Las consultas pasan por los mismos límites, reintentos y circuit breaker
+    que los análisis, y dejan la respuesta en la caché de NCE. Con varios
+    procesos de la API cada uno consultaría la flota: ejecutar un solo worker.
+    """
+
+    def __init__(self, almacen: AlmacenKPI):
+        self.almacen = almacen
+        self.macs: List[str] = []
+        self.estado: Dict[str, Dict[str, Any]] = {}
+        self.ciclos = 0
+        self.ultimo_ciclo: Optional[datetime] = None
+        self.duracion_ultimo_ciclo: Optional[float] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def configurar(self, macs: List[str]) -> None:
+        """Reemplazar la watchlist (las series de MACs retiradas se conservan)"""
+        self.macs = list(dict.fromkeys(macs))
+        self.estado = {mac: self.estado.get(mac, {}) for mac in self.macs}
+
+    async def consultar(self, analyzer: GatewayAnalyzer, mac: str) -> None:
+        """Una consulta de PM de un gateway, registrada en el almacén"""
+        estado = self.estado.setdefault(mac, {})
+        with span("flota.consulta", mac=mac) as actual:
+            resultado = await asyncio.to_thread(analyzer.get_performance_data, mac)
+            FLOTA_CONSULTAS.labels(resultado["estado"]).inc()
+            actual.atributos["estado"] = resultado["estado"]
+
+            if resultado["estado"] != ESTADO_OK:
+                estado.update(ultimo_error=datetime.now(timezone.utc), error=resultado["error"])
+                return
+
+            muestras = extraer_muestras(resultado["datos"], settings.fleet_kpis_list)
+            guardadas = self.almacen.registrar(mac, muestras, settings.FLEET_MAX_KPIS_PER_GATEWAY)
+            actual.atributos.update(kpis=len(muestras), muestras=guardadas)
+            estado.update(ultimo_ok=datetime.now(timezone.utc), error=None, ultimas_muestras=guardadas)
+
+    async def ciclo(self) -> None:
+        """Consultar toda la watchlist (FLEET_POLL_CONCURRENCY a la vez) y guardar la instantánea"""
+        inicio = time.monotonic()
+        # Sin caché de lectura: siempre la última hora; la sesión HTTP se comparte en el ciclo
+        # y se crea antes de repartirla entre los hilos
+        analyzer = GatewayAnalyzer(forzar_actualizacion=True)
+        analyzer._get_session()
+        semaforo = asyncio.Semaphore(settings.FLEET_POLL_CONCURRENCY)
+        # La watchlist puede cambiar durante el ciclo: consultar y reportar sobre la misma lista
+        macs = list(self.macs)
+
+        async def consultar_con_cupo(mac: str) -> None:
+            async with semaforo:
+                await self.consultar(analyzer, mac)
+
+        with span("flota.ciclo", gateways=len(macs)):
+            resultados = await asyncio.gather(
+                *(consultar_con_cupo(mac) for mac in macs),
+                return_exceptions=True
+            )
+        for mac, resultado in zip(macs, resultados):
+            if isinstance(resultado, Exception):
+                print(f"⚠️ Error consultando PM de {mac}: {resultado}")
+
+        self.ciclos += 1
+        self.ultimo_ciclo = datetime.now(timezone.utc)
+        self.duracion_ultimo_ciclo = round(time.monotonic() - inicio, 2)
+        FLOTA_CICLO_SEGUNDOS.observe(self.duracion_ultimo_ciclo)
+
+        if settings.FLEET_STORE_FILE and self.almacen.cambios:
+            await asyncio.to_thread(self.almacen.guardar, settings.FLEET_STORE_FILE)
+
+    async def _loop(self, intervalo: float) -> None:
+        while True:
+            inicio = time.monotonic()
+            if self.macs:
+                try:
+                    await self.ciclo()
+                except Exception as e:
+                    print(f"⚠️ Error en el ciclo de la flota: {e}")
+            await asyncio.sleep(max(intervalo - (time.monotonic() - inicio), 1))
+
+    def iniciar(self, intervalo: float) -> None:
+        """Cargar la instantánea y la watchlist y lanzar el ciclo periódico (llamar en el startup)"""
+        if settings.FLEET_STORE_FILE and os.path.exists(settings.FLEET_STORE_FILE):
+            try:
+                series = self.almacen.cargar(settings.FLEET_STORE_FILE)
+                print(f"📈 Series de KPIs cargadas: {series} desde {settings.FLEET_STORE_FILE}")
+            except Exception as e:
+                print(f"⚠️ No se pudo cargar {settings.FLEET_STORE_FILE}: {e}")
+        self.configurar(leer_watchlist())
+        self._tarea = asyncio.create_task(self._loop(intervalo))
+
+    async def detener(self) -> None:
+        """Detener el ciclo periódico y escribir la instantánea"""
+        if self._tarea:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+        if settings.FLEET_STORE_FILE and self.almacen.cambios:
+            await asyncio.to_thread(self.almacen.guardar, settings.FLEET_STORE_FILE)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "intervalo_segundos": settings.FLEET_POLL_INTERVAL_SECONDS,
+            "ciclos": self.ciclos,
+            "ultimo_ciclo": self.ultimo_ciclo,
+            "duracion_ultimo_ciclo": self.duracion_ultimo_ciclo,
+            "gateways": [
+                {
+                    "mac_address": mac,
+                    **self.estado.get(mac, {}),
+                    "ultima_muestra": self.almacen.ultimo(mac),
+                    "kpis": self.almacen.kpis(mac)
+                }
+                for mac in self.macs
+            ],
+            "almacen": self.almacen.estadisticas()
+        }
+
+
+# Almacén de series y poller globales
+almacen_kpi = AlmacenKPI({
+    NIVEL_5M: settings.FLEET_RETENTION_5M_DAYS,
+    NIVEL_1H: settings.FLEET_RETENTION_1H_DAYS,
+    NIVEL_1D: settings.FLEET_RETENTION_1D_DAYS
+})
+poller_flota = PollerFlota(almacen_kpi)
@@ -3,13 +3,37 @@
 # ============================================
 
 import requests
+import hashlib
 import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from contextvars import ContextVar
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional
-from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import AsyncIterator, Dict, Any, Optional, Tuple
 
 from .config import settings
+from .datos_tecnicos import (
+    FORMATO_DATOS,
+    BANDAS_WIFI,
+    SECCIONES_POR_BANDA,
+    TITULOS_SECCIONES,
+    ESTADO_OK,
+    ESTADO_ERROR,
+    ESTADO_TIMEOUT,
+    CLAVES_METADATA,
+    resultado_consulta
+)
+from .compactacion import compactar_datos_tecnicos, estimar_tokens
+from .cache import TTLCache
+from .llm import get_chain
+from .recuperacion import obtener_indice, seleccionar_contexto
+from .limites import limite_nce, limite_llm
+from .resiliencia import espera_reintento, obtener_circuito
+from .metricas import LLM_ERRORES, observar_llm, observar_nce
+from .trazas import anotar, con_contexto, span
+from .captura_nce import ERROR_CONEXION, ERROR_TIMEOUT, get_adaptador_reproduccion, get_grabador
 
 # Ignorar advertencias SSL
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
@@ -72,45 +96,319 @@ PROBLEMAS DETECTADOS Y SOLUCIONES
 {contenido}
 """
 
+# ============================================
+# PROMPT DE CHAT
+# ============================================
+
+CHAT_PROMPT = """
+Eres un asistente experto en análisis de redes WiFi. 
+Responde a la siguiente pregunta basándote ÚNICAMENTE en los datos técnicos proporcionados.
+
+{historial}
+
+--- DATOS TÉCNICOS DEL GATEWAY ---
+{contenido}
+
+--- PREGUNTA DEL USUARIO ---
+{pregunta}
+
+Proporciona una respuesta clara, técnica pero entendible, basada SOLO en los datos disponibles.
+Si la información no está disponible en los datos, indícalo claramente.
+"""
+
+# ============================================
+# PROMPT DE RESUMEN DE CONVERSACIÓN
+# ============================================
+
+RESUMEN_CHAT_PROMPT = """
+Mantienes la memoria de una conversación entre un agente de soporte y un asistente experto en redes WiFi sobre el diagnóstico de un gateway.
+
+Actualiza el resumen incorporando los nuevos turnos. Conserva las preguntas relevantes, los datos técnicos citados, los problemas detectados y las recomendaciones ya entregadas. Omite saludos y repeticiones.
+Responde SOLO con el resumen actualizado, en texto plano y en no más de {max_palabras} palabras.
+
+--- RESUMEN ACTUAL ---
+{resumen}
+
+--- NUEVOS TURNOS ---
+{turnos}
+"""
+
+# ============================================
+# CONSTANTES
+# ============================================
+
+# Temperatura para resumir conversaciones (se busca fidelidad, no creatividad)
+TEMPERATURA_RESUMEN = 0.2
+
+# Conexiones HTTP simultáneas hacia NCE por sesión (una por sub-consulta)
+MAX_CONEXIONES_NCE = 16
+
+# Segundos que se reutiliza la respuesta de cada sección: la configuración
+# cambia poco, el rendimiento y las sesiones cambian constantemente
+TTL_CACHE_SECCIONES = {
+    "basic_info": 300,
+    "wifi_band_info": 300,
+    "guest_wifi_info": 300,
+    "neighboring_ssids": 120,
+    "downstream_ports": 60,
+    "connected_devices": 30,
+    "performance_data": 30,
+    "session_info": 15,
+}
+
+# Respuestas HTTP de NCE que indican un problema pasajero (se reintentan)
+HTTP_STATUS_TRANSITORIOS = {429, 502, 503, 504}
+
+_FAMILIA_ENDPOINT = re.compile(r"/restconf/v1/(?:data|operations)/([^:/]+)")
+
+def familia_endpoint(url: str) -> str:
+    """Módulo RESTCONF de la URL; cada módulo de NCE tiene su propio circuit breaker"""
+    coincidencia = _FAMILIA_ENDPOINT.search(url)
+    return coincidencia.group(1) if coincidencia else "nce"
+
+def es_idempotente(method: str, url: str) -> bool:
+    """GET y operaciones RESTCONF de solo lectura (query-*) pueden reintentarse"""
+    return method == 'get' or ("/operations/" in url and ":query-" in url)
+
+# Caché de respuestas NCE compartida por todo el proceso
+# Clave: (MAC, sección, parámetros)
+cache_nce = TTLCache(max_entradas=settings.NCE_CACHE_MAX_ENTRIES)
+
+# Caché de informes IA por contenido: datos normalizados + prompt + modelo
+cache_informes = TTLCache(max_entradas=settings.AI_REPORT_CACHE_MAX_ENTRIES)
+
+# Campos de cada consulta que no afectan al informe
+CAMPOS_VOLATILES = {"latencia_ms", "desde_cache", "http_status"}
+
+def _normalizar_para_hash(valor: Any) -> Any:
+    """Eliminar campos volátiles (latencias, marcas de caché) recursivamente"""
+    if isinstance(valor, dict):
+        return {
+            k: _normalizar_para_hash(v)
+            for k, v in valor.items()
+            if k not in CAMPOS_VOLATILES
+        }
+    if isinstance(valor, list):
+        return [_normalizar_para_hash(v) for v in valor]
+    return valor
+
+def clave_informe(datos_tecnicos: Dict[str, Any], template: str) -> str:
+    """
+    Hash estable del contenido que determina un informe
+    Dos análisis con los mismos datos (salvo timestamp y latencias) comparten clave
+    """
+    secciones = {
+        k: v for k, v in datos_tecnicos.items()
+        if k not in CLAVES_METADATA
+    }
+    material = json.dumps({
+        "datos": _normalizar_para_hash(secciones),
+        "template": template,
+        "modelo": settings.AI_MODEL,
+        "temperatura": settings.AI_TEMPERATURE,
+        "presupuesto": settings.AI_REPORT_TOKEN_BUDGET
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
 # ============================================
 # CLASE ANALIZADOR DE GATEWAY
 # ============================================
 
+# Plazo del análisis en curso (instante de time.monotonic) y aviso de abandono.
+# Lo fija _consultar_secciones y lo ven las secciones que corren en el executor
+# (con_contexto copia las ContextVar): ninguna sigue reintentando ni ocupando
+# cupos de NCE después de que el análisis dejó de esperarla.
+_plazo_analisis: ContextVar[Optional[Tuple[float, threading.Event]]] = ContextVar(
+    "plazo_analisis", default=None
+)
+
 class GatewayAnalyzer:
     """
     Clase para analizar gateways WiFi Huawei
     """
     
-    def __init__(self):
+    def __init__(self, forzar_actualizacion: bool = False):
+        """
+        forzar_actualizacion: ignorar la caché de NCE y consultar todo de nuevo
+        (las respuestas nuevas sí se guardan en caché)
+        """
+        self.forzar_actualizacion = forzar_actualizacion
         self.base_url = settings.GATEWAY_BASE_URL
         self.username = settings.GATEWAY_USERNAME
         self.password = settings.GATEWAY_PASSWORD
         self.session = None
         self.headers = None
+        # Tokens antes/después de compactar el último prompt generado
+        self.ultima_compactacion: Optional[Dict[str, Any]] = None
+        # Fragmentos elegidos para la última pregunta de chat (None si se usaron todos los datos)
+        self.ultima_recuperacion: Optional[Dict[str, Any]] = None
+        # Si el último informe se sirvió desde la caché de informes
+        self.informe_desde_cache = False
+        # Aviso de abandono de las consultas en curso (ver cancelar)
+        self._cancelado = threading.Event()
+        self._abandono: Optional[threading.Event] = None
         
     def _get_session(self) -> requests.Session:
-        """Crear sesión HTTP con autenticación"""
+        """
+        Crear sesión HTTP con autenticación
+        La sesión se publica al final, ya completa: un hilo que la ve asignada
+        también ve los headers
+        """
         if self.session is None:
-            self.session = requests.Session()
-            self.session.auth = (self.username, self.password)
+            session = requests.Session()
+            session.auth = (self.username, self.password)
+            # Pool dimensionado para las consultas concurrentes de analyze_gateway
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=MAX_CONEXIONES_NCE)
+            # Con NCE_REPLAY_FILE se responde desde respuestas grabadas, sin red
+            adapter = get_adaptador_reproduccion() or adapter
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
             self.headers = {
                 "Content-Type": "application/yang-data+json",
                 "Accept": "application/yang-data+json"
             }
+            self.session = session
         return self.session
     
     def _api_call(
         self, 
         mac: str, 
         url: str, 
+        seccion: str,
         method: str = 'get', 
         params: Optional[Dict] = None, 
         json_payload: Optional[Dict] = None, 
         timeout: int = 15
-    ) -> str:
+    ) -> Dict[str, Any]:
+        """
+        Realizar llamada a la API del gateway usando la caché por sección
+        Retorna el resultado estructurado (ver datos_tecnicos.resultado_consulta)
+        """
+        usar_cache = settings.NCE_CACHE_ENABLED and seccion in TTL_CACHE_SECCIONES
+        clave = (mac, seccion, json.dumps(params, sort_keys=True))
+        banda = (params or {}).get("radio-type")
+        
+        with span(f"nce.{seccion}", mac=mac, seccion=seccion, banda=banda) as actual:
+            if usar_cache and not self.forzar_actualizacion:
+                resultado = cache_nce.get(clave)
+                if resultado is not None:
+                    observar_nce(seccion, resultado, desde_cache=True)
+                    actual.atributos.update(desde_cache=True, estado=resultado["estado"])
+                    return {**resultado, "desde_cache": True}
+            
+            resultado = self._consultar_nce(url, method, params, json_payload, timeout)
+            observar_nce(seccion, resultado)
+            actual.atributos.update(
+                desde_cache=False,
+                estado=resultado["estado"],
+                http_status=resultado.get("http_status")
+            )
+            
+            # Solo se guardan respuestas exitosas
+            if usar_cache and resultado["estado"] == ESTADO_OK:
+                cache_nce.set(clave, resultado, TTL_CACHE_SECCIONES[seccion])
+            
+            return resultado
+    
+    def _consultar_nce(
+        self, 
+        url: str, 
+        method: str, 
+        params: Optional[Dict], 
+        json_payload: Optional[Dict], 
+        timeout: int
+    ) -> Dict[str, Any]:
+        """
+        Realizar llamada HTTP a NCE
+        Las consultas idempotentes se reintentan ante errores transitorios con
+        backoff exponencial, sin exceder NCE_SECTION_TIMEOUT en total (ni el
+        plazo del análisis en curso, ver _plazo_analisis). Si la
+        familia de endpoints está fallando, el circuit breaker responde de
+        inmediato sin llamar a NCE.
+        """
+        circuito = obtener_circuito(familia_endpoint(url))
+        reintentos = settings.NCE_MAX_RETRIES if es_idempotente(method, url) else 0
+        inicio = time.monotonic()
+        fin = inicio + settings.NCE_SECTION_TIMEOUT
+        plazo = _plazo_analisis.get()
+        abandonado = None
+        if plazo is not None:
+            fin = min(fin, plazo[0])
+            abandonado = plazo[1]
+        timeout_intento = min(timeout, fin - inicio)
+        intento = 0
+        
+        while True:
+            if (abandonado is not None and abandonado.is_set()) or time.monotonic() >= fin:
+                return resultado_consulta(
+                    ESTADO_TIMEOUT,
+                    error="Se excedió el tiempo límite de consulta",
+                    latencia_ms=(time.monotonic() - inicio) * 1000
+                )
+            # Con el circuito abierto se responde sin ocupar un cupo de NCE
+            if not circuito.permitir():
+                return resultado_consulta(
+                    ESTADO_ERROR,
+                    error=f"NCE no disponible ({circuito.nombre}): circuito abierto",
+                    latencia_ms=(time.monotonic() - inicio) * 1000
+                )
+            try:
+                # Cupo global de llamadas simultáneas a NCE (compartido entre análisis)
+                with limite_nce.cupo(timeout=timeout_intento):
+                    with span("nce.intento", intento=intento) as actual:
+                        resultado, transitorio = self._peticion_nce(
+                            url, method, params, json_payload, timeout_intento, inicio
+                        )
+                        actual.atributos.update(
+                            estado=resultado["estado"],
+                            http_status=resultado.get("http_status"),
+                            transitorio=transitorio
+                        )
+                    circuito.registrar(exito=not transitorio)
+            except TimeoutError as e:
+                # Sin cupo: la llamada permitida no se hizo (libera la prueba del semiabierto)
+                circuito.devolver()
+                return resultado_consulta(
+                    ESTADO_ERROR,
+                    error=str(e),
+                    latencia_ms=(time.monotonic() - inicio) * 1000
+                )
+            
+            if not transitorio or intento >= reintentos:
+                return resultado
+            
+            espera = espera_reintento(
+                intento, settings.NCE_RETRY_BASE_SECONDS, settings.NCE_RETRY_MAX_SECONDS
+            )
+            restante = fin - time.monotonic() - espera
+            if restante < 1:
+                return resultado
+            
+            # Despierta antes si el análisis abandona la sección
+            if abandonado is not None:
+                if abandonado.wait(espera):
+                    return resultado
+            else:
+                time.sleep(espera)
+            intento += 1
+            timeout_intento = min(timeout, restante)
+    
+    def _peticion_nce(
+        self, 
+        url: str, 
+        method: str, 
+        params: Optional[Dict], 
+        json_payload: Optional[Dict], 
+        timeout: float,
+        inicio: float
+    ) -> Tuple[Dict[str, Any], bool]:
         """
-        Realizar llamada a la API del gateway
+        Un intento de llamada HTTP a NCE
+        Retorna (resultado, si el error es transitorio y vale la pena reintentar)
+        Con NCE_CAPTURE_FILE cada intento queda grabado (ver captura_nce)
         """
+        grabador = get_grabador()
+        inicio_intento = time.monotonic()
         try:
             session = self._get_session()
             
@@ -131,33 +429,72 @@ class GatewayAnalyzer:
                     timeout=timeout
                 )
             
+            if grabador:
+                grabador.registrar(
+                    method, url, params, json_payload,
+                    (time.monotonic() - inicio_intento) * 1000, respuesta=r
+                )
             r.raise_for_status()
-            return "\n" + json.dumps(r.json(), indent=4)
+            return resultado_consulta(
+                ESTADO_OK,
+                datos=r.json(),
+                http_status=r.status_code,
+                latencia_ms=(time.monotonic() - inicio) * 1000
+            ), False
         
         except requests.exceptions.HTTPError as e:
             try:
                 error_details = e.response.json()
-                return f"\n[i] No disponible o error en la consulta: {e.response.status_code} {e.response.reason}\nDetalles: {json.dumps(error_details, indent=2)}"
-            except json.JSONDecodeError:
-                return f"\n[i] No disponible o error en la consulta: {e}"
+            except ValueError:
+                error_details = None
+            return resultado_consulta(
+                ESTADO_ERROR,
+                datos=error_details,
+                error=f"{e.response.status_code} {e.response.reason}",
+                http_status=e.response.status_code,
+                latencia_ms=(time.monotonic() - inicio) * 1000
+            ), e.response.status_code in HTTP_STATUS_TRANSITORIOS
+        except requests.exceptions.Timeout as e:
+            if grabador:
+                grabador.registrar(
+                    method, url, params, json_payload,
+                    (time.monotonic() - inicio_intento) * 1000, error=ERROR_TIMEOUT
+                )
+            return resultado_consulta(
+                ESTADO_TIMEOUT,
+                error=f"Tiempo de espera agotado: {e}",
+                latencia_ms=(time.monotonic() - inicio) * 1000
+            ), True
+        except requests.exceptions.ConnectionError as e:
+            if grabador:
+                grabador.registrar(
+                    method, url, params, json_payload,
+                    (time.monotonic() - inicio_intento) * 1000, error=ERROR_CONEXION
+                )
+            return resultado_consulta(
+                ESTADO_ERROR,
+                error=f"Error de conexión: {e}",
+                latencia_ms=(time.monotonic() - inicio) * 1000
+            ), True
         except Exception as e:
-            return f"\n[!] Error general: {e}"
+            return resultado_consulta(
+                ESTADO_ERROR,
+                error=f"Error general: {e}",
+                latencia_ms=(time.monotonic() - inicio) * 1000
+            ), False
     
-    def get_basic_info(self, mac: str) -> str:
+    def get_basic_info(self, mac: str) -> Dict[str, Any]:
         """Obtener información básica del gateway"""
-        output = "\n" + "="*80 + "\n===== INFORMACIÓN BÁSICA DEL GATEWAY =====\n" + "="*80
         url = f"{self.base_url}/restconf/v1/data/huawei-nce-resource-activation-configuration-home-gateway:home-gateway/home-gateway-info"
-        return output + self._api_call(mac, url, params={"mac": mac})
+        return self._api_call(mac, url, "basic_info", params={"mac": mac})
     
-    def get_connected_devices(self, mac: str) -> str:
+    def get_connected_devices(self, mac: str) -> Dict[str, Any]:
         """Obtener dispositivos conectados"""
-        output = "\n" + "="*80 + "\n===== DISPOSITIVOS CONECTADOS =====\n" + "="*80
         url = f"{self.base_url}/restconf/v1/data/huawei-nce-resource-activation-configuration-home-gateway:home-gateway/sub-devices"
-        return output + self._api_call(mac, url, params={"mac": mac})
+        return self._api_call(mac, url, "connected_devices", params={"mac": mac})
     
-    def get_performance_data(self, mac: str) -> str:
+    def get_performance_data(self, mac: str) -> Dict[str, Any]:
         """Obtener datos de rendimiento"""
-        output = "\n" + "="*80 + "\n===== DATOS DE RENDIMIENTO =====\n" + "="*80
         url = f"{self.base_url}/restconf/v1/operations/huawei-nce-homeinsight-performance-management:query-history-pm-datas"
         
         end = datetime.now(timezone.utc)
@@ -176,168 +513,380 @@ class GatewayAnalyzer:
             }
         }
         
-        return output + self._api_call(mac, url, method='post', json_payload=payload, timeout=20)
+        return self._api_call(mac, url, "performance_data", method='post', json_payload=payload, timeout=20)
     
-    def get_wifi_band_info(self, mac: str) -> str:
-        """Obtener configuración WiFi por banda"""
-        output = "\n" + "="*80 + "\n===== CONFIGURACIÓN WIFI =====\n" + "="*80
+    def get_wifi_band(self, mac: str, band: str) -> Dict[str, Any]:
+        """Obtener configuración WiFi de una banda"""
         url = f"{self.base_url}/restconf/v1/data/huawei-nce-resource-activation-configuration-home-gateway:home-gateway/wifi-band"
-        
-        for band in ["2.4G", "5G"]:
-            output += f"\n--- Banda {band} ---"
-            output += self._api_call(mac, url, params={"mac": mac, "radio-type": band})
-        
-        return output
+        return self._api_call(mac, url, "wifi_band_info", params={"mac": mac, "radio-type": band})
     
-    def get_guest_wifi_info(self, mac: str) -> str:
+    def get_wifi_band_info(self, mac: str) -> Dict[str, Any]:
+        """Obtener configuración WiFi por banda"""
+        return {band: self.get_wifi_band(mac, band) for band in BANDAS_WIFI}
+    
+    def get_guest_wifi_info(self, mac: str) -> Dict[str, Any]:
         """Obtener información de WiFi invitados"""
-        output = "\n" + "="*80 + "\n===== WIFI INVITADOS =====\n" + "="*80
         url = f"{self.base_url}/restconf/v1/operations/huawei-nce-resource-activation-configuration-home-gateway:query-gateway-guest-ssid"
         payload = {
             "huawei-nce-resource-activation-configuration-home-gateway:input": {"mac": mac}
         }
-        return output + self._api_call(mac, url, method='post', json_payload=payload)
+        return self._api_call(mac, url, "guest_wifi_info", method='post', json_payload=payload)
     
-    def get_downstream_ports(self, mac: str) -> str:
+    def get_downstream_ports(self, mac: str) -> Dict[str, Any]:
         """Obtener estado de puertos LAN"""
-        output = "\n" + "="*80 + "\n===== PUERTOS LAN =====\n" + "="*80
         url = f"{self.base_url}/restconf/v1/operations/huawei-nce-resource-activation-configuration-home-gateway:query-gateway-downstream-port"
         payload = {
             "huawei-nce-resource-activation-configuration-home-gateway:input": {"mac": mac}
         }
-        return output + self._api_call(mac, url, method='post', json_payload=payload)
+        return self._api_call(mac, url, "downstream_ports", method='post', json_payload=payload)
     
-    def get_neighboring_ssids(self, mac: str) -> str:
-        """Obtener redes WiFi vecinas"""
-        output = "\n" + "="*80 + "\n===== REDES VECINAS =====\n" + "="*80
+    def get_neighboring_ssids_band(self, mac: str, band: str) -> Dict[str, Any]:
+        """Obtener redes WiFi vecinas de una banda"""
         url = f"{self.base_url}/restconf/v1/data/huawei-nce-resource-activation-configuration-home-gateway:home-gateway/neighbor-ssids"
-        
-        for band in ["2.4G", "5G"]:
-            output += f"\n--- Banda {band} ---"
-            output += self._api_call(mac, url, params={"mac": mac, "radio-type": band}, timeout=20)
-        
-        return output
+        return self._api_call(mac, url, "neighboring_ssids", params={"mac": mac, "radio-type": band}, timeout=20)
     
-    def get_session_info(self, mac: str) -> str:
+    def get_neighboring_ssids(self, mac: str) -> Dict[str, Any]:
+        """Obtener redes WiFi vecinas"""
+        return {band: self.get_neighboring_ssids_band(mac, band) for band in BANDAS_WIFI}
+    
+    def get_session_info(self, mac: str) -> Dict[str, Any]:
         """Obtener sesiones activas"""
-        output = "\n" + "="*80 + "\n===== SESIONES ACTIVAS =====\n" + "="*80
         url = f"{self.base_url}/restconf/v1/operations/huawei-nce-resource-activation-configuration-home-gateway:query-session-info"
         payload = {
             "huawei-nce-resource-activation-configuration-home-gateway:input": {"mac": mac}
         }
-        return output + self._api_call(mac, url, method='post', json_payload=payload)
+        return self._api_call(mac, url, "session_info", method='post', json_payload=payload)
     
     def analyze_gateway(self, mac: str, incluir_eventos: bool = True) -> Dict[str, Any]:
         """
         Realizar análisis completo del gateway
         Retorna un diccionario con todos los datos técnicos
+        
+        Todas las consultas a NCE (incluidas las de cada banda) se lanzan en
+        paralelo. Cada sección tiene un tiempo límite propio
+        (NCE_SECTION_TIMEOUT, reintentos incluidos) y el análisis completo uno
+        global (NCE_ANALYSIS_TIMEOUT); las que no responden a tiempo quedan en
+        estado "timeout" y listadas en "secciones_faltantes" sin bloquear al resto.
+        """
+        # Sub-consultas independientes: (sección, banda) -> (método, argumentos)
+        tareas = {
+            ("basic_info", None): (self.get_basic_info, (mac,)),
+            ("connected_devices", None): (self.get_connected_devices, (mac,)),
+            ("performance_data", None): (self.get_performance_data, (mac,)),
+            ("guest_wifi_info", None): (self.get_guest_wifi_info, (mac,)),
+            ("downstream_ports", None): (self.get_downstream_ports, (mac,)),
+            ("session_info", None): (self.get_session_info, (mac,)),
+        }
+        for band in BANDAS_WIFI:
+            tareas[("wifi_band_info", band)] = (self.get_wifi_band, (mac, band))
+            tareas[("neighboring_ssids", band)] = (self.get_neighboring_ssids_band, (mac, band))
+        
+        with span("nce.analisis", mac=mac, secciones=len(tareas)) as actual:
+            datos_tecnicos = self._consultar_secciones(mac, tareas)
+            actual.atributos["secciones_faltantes"] = datos_tecnicos["secciones_faltantes"]
+        return datos_tecnicos
+    
+    def cancelar(self) -> None:
         """
+        Abandonar el análisis en curso desde otro hilo: las secciones dejan de
+        reintentar y de pedir cupos de NCE
+        """
+        self._cancelado.set()
+        if self._abandono is not None:
+            self._abandono.set()
+    
+    def _consultar_secciones(self, mac: str, tareas: Dict[Tuple[str, Optional[str]], Any]) -> Dict[str, Any]:
+        """Lanzar las sub-consultas en paralelo y armar los datos técnicos"""
+        # Inicializar la sesión antes de repartirla entre hilos
+        self._get_session()
+        
+        # Cada sección respeta NCE_SECTION_TIMEOUT dentro de _consultar_nce; aquí
+        # solo se espera hasta el plazo del análisis completo
+        inicio = time.monotonic()
+        limite = inicio + settings.NCE_ANALYSIS_TIMEOUT
+        abandonado = self._abandono = threading.Event()
+        if self._cancelado.is_set():
+            abandonado.set()
+        token = _plazo_analisis.set((limite, abandonado))
+        
+        executor = ThreadPoolExecutor(max_workers=len(tareas), thread_name_prefix="nce")
+        resultados = {}
+        secciones_faltantes = []
+        try:
+            futuros = {
+                clave: executor.submit(con_contexto(metodo), *args)
+                for clave, (metodo, args) in tareas.items()
+            }
+            for (seccion, band), futuro in futuros.items():
+                try:
+                    resultados[(seccion, band)] = futuro.result(
+                        timeout=max(0.0, limite - time.monotonic())
+                    )
+                except FuturesTimeoutError:
+                    resultados[(seccion, band)] = resultado_consulta(
+                        ESTADO_TIMEOUT,
+                        error="Se excedió el tiempo límite de consulta"
+                    )
+                # Vencida por el plazo del análisis o por el de la propia sección
+                if resultados[(seccion, band)]["estado"] == ESTADO_TIMEOUT:
+                    secciones_faltantes.append(f"{seccion}[{band}]" if band else seccion)
+        finally:
+            # No esperar a las consultas que excedieron el tiempo límite: dejan de
+            # reintentar y de pedir cupos apenas ven el aviso
+            abandonado.set()
+            _plazo_analisis.reset(token)
+            executor.shutdown(wait=False, cancel_futures=True)
+        
         datos_tecnicos = {
+            "formato": FORMATO_DATOS,
             "mac_address": mac,
-            "timestamp": datetime.now().isoformat(),
-            "basic_info": self.get_basic_info(mac),
-            "connected_devices": self.get_connected_devices(mac),
-            "performance_data": self.get_performance_data(mac),
-            "wifi_band_info": self.get_wifi_band_info(mac),
-            "guest_wifi_info": self.get_guest_wifi_info(mac),
-            "downstream_ports": self.get_downstream_ports(mac),
-            "neighboring_ssids": self.get_neighboring_ssids(mac),
-            "session_info": self.get_session_info(mac)
+            "timestamp": datetime.now().isoformat()
         }
+        for seccion in TITULOS_SECCIONES:
+            if seccion in SECCIONES_POR_BANDA:
+                datos_tecnicos[seccion] = {
+                    band: resultados[(seccion, band)] for band in BANDAS_WIFI
+                }
+            else:
+                datos_tecnicos[seccion] = resultados[(seccion, None)]
+        datos_tecnicos["secciones_faltantes"] = secciones_faltantes
         
         return datos_tecnicos
     
-    def generate_ai_report(
-        self, 
-        datos_tecnicos: Dict[str, Any], 
-        prompt_template: Optional[str] = None
+    def _contenido_datos(self, datos_tecnicos: Dict[str, Any], presupuesto_tokens: int) -> str:
+        """Convertir datos técnicos a texto compacto para el prompt"""
+        with span("prompt.compactacion", presupuesto_tokens=presupuesto_tokens):
+            contenido, self.ultima_compactacion = compactar_datos_tecnicos(
+                datos_tecnicos, presupuesto_tokens
+            )
+            anotar(
+                tokens_originales=self.ultima_compactacion["tokens_originales"],
+                tokens_compactados=self.ultima_compactacion["tokens_compactados"]
+            )
+        return contenido
+    
+    def _contenido_chat(
+        self,
+        pregunta: str,
+        datos_tecnicos: Dict[str, Any],
+        historial: Optional[list],
+        analisis_id: Optional[str]
     ) -> str:
         """
-        Generar informe con IA usando los datos técnicos
+        Datos relevantes para la pregunta (índice BM25 por análisis) o, si la
+        pregunta es general y no coincide con ningún fragmento, todos los datos
         """
-        # Convertir datos técnicos a texto
-        contenido = "\n\n".join([
-            f"{key.upper()}:\n{value}" 
-            for key, value in datos_tecnicos.items() 
-            if key not in ["mac_address", "timestamp"]
-        ])
-        
-        # Usar prompt por defecto si no se proporciona uno
-        template_str = prompt_template or DEFAULT_PROMPT
+        self.ultima_recuperacion = None
+        if settings.AI_CHAT_RETRIEVAL_ENABLED:
+            # La pregunta anterior da contexto a seguimientos como "¿y en la otra banda?"
+            anteriores = [l for l in (historial or []) if l.startswith("Humano: ")]
+            consulta = " ".join(anteriores[-1:] + [pregunta])
+            
+            with span("prompt.recuperacion", analisis_id=analisis_id):
+                indice = obtener_indice(datos_tecnicos, analisis_id)
+                seleccion = seleccionar_contexto(
+                    indice, consulta, settings.AI_CHAT_RETRIEVAL_TOKEN_BUDGET
+                )
+                anotar(
+                    fragmentos_elegidos=seleccion[1]["fragmentos_elegidos"] if seleccion else 0,
+                    fragmentos_totales=len(indice.fragmentos)
+                )
+            if seleccion is not None:
+                contenido, self.ultima_recuperacion = seleccion
+                return contenido
         
-        # Configurar modelo de IA
-        llm = ChatGoogleGenerativeAI(
-            model=settings.AI_MODEL,
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=settings.AI_TEMPERATURE
+        return self._contenido_datos(datos_tecnicos, settings.AI_CHAT_TOKEN_BUDGET)
+    
+    async def _ainvocar(self, chain, entradas: Dict[str, Any], operacion: str) -> str:
+        """Invocar una cadena del LLM de forma asíncrona, dentro del límite de concurrencia"""
+        with span(f"llm.{operacion}", modo="invoke"):
+            async with limite_llm.cupo():
+                inicio = time.monotonic()
+                try:
+                    mensaje = await chain.ainvoke(entradas)
+                except Exception:
+                    LLM_ERRORES.labels(operacion).inc()
+                    raise
+            self._registrar_llm(operacion, "invoke", inicio, entradas, mensaje.content, mensaje)
+        return mensaje.content
+    
+    async def _astream(self, chain, entradas: Dict[str, Any], operacion: str) -> AsyncIterator[str]:
+        """
+        Emitir el texto generado por fragmentos, dentro del límite de concurrencia
+        La latencia registrada va hasta el último fragmento (o hasta que se corta el stream)
+        """
+        partes = []
+        with span(f"llm.{operacion}", modo="stream"):
+            async with limite_llm.cupo():
+                inicio = time.monotonic()
+                try:
+                    async for fragmento in chain.astream(entradas):
+                        if fragmento.content:
+                            partes.append(fragmento.content)
+                            yield fragmento.content
+                except Exception:
+                    LLM_ERRORES.labels(operacion).inc()
+                    raise
+                finally:
+                    self._registrar_llm(operacion, "stream", inicio, entradas, "".join(partes))
+    
+    def _registrar_llm(
+        self,
+        operacion: str,
+        modo: str,
+        inicio: float,
+        entradas: Dict[str, Any],
+        respuesta: str,
+        mensaje: Any = None
+    ) -> None:
+        """Registrar métricas de la llamada y anotar los tokens en el span actual"""
+        tokens_prompt, tokens_completion = observar_llm(
+            operacion, modo, time.monotonic() - inicio, entradas, respuesta, mensaje
         )
-        
-        # Crear prompt
-        prompt = PromptTemplate(
-            input_variables=["contenido"],
-            template=template_str
+        anotar(tokens_prompt=tokens_prompt, tokens_completion=tokens_completion)
+    
+    def _report_chain(self, prompt_template: Optional[str] = None):
+        """Obtener la cadena prompt | modelo compartida para el informe"""
+        # Usar prompt por defecto si no se proporciona uno
+        return get_chain(
+            prompt_template or DEFAULT_PROMPT,
+            ("contenido",),
+            settings.AI_TEMPERATURE
         )
+    
+    def _informe_cacheado(
+        self, 
+        datos_tecnicos: Dict[str, Any], 
+        prompt_template: Optional[str]
+    ) -> tuple:
+        """
+        Buscar el informe en la caché de contenido
+        Retorna (clave, informe o None)
+        """
+        clave = clave_informe(datos_tecnicos, prompt_template or DEFAULT_PROMPT)
+        informe = cache_informes.get(clave) if settings.AI_REPORT_CACHE_ENABLED else None
+        self.informe_desde_cache = informe is not None
+        return clave, informe
+    
+    def _guardar_informe(self, clave: str, informe: str) -> None:
+        if settings.AI_REPORT_CACHE_ENABLED and informe:
+            cache_informes.set(clave, informe, settings.AI_REPORT_CACHE_TTL)
+    
+    async def stream_ai_report(
+        self, 
+        datos_tecnicos: Dict[str, Any], 
+        prompt_template: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Generar informe con IA emitiendo los fragmentos de texto a medida
+        que el modelo los produce (un único fragmento si está en caché)
+        """
+        clave, informe = self._informe_cacheado(datos_tecnicos, prompt_template)
+        if informe is not None:
+            yield informe
+            return
         
-        # Generar informe
-        chain = prompt | llm
-        resultado = chain.invoke({"contenido": contenido})
+        partes = []
+        chain = self._report_chain(prompt_template)
+        contenido = self._contenido_datos(datos_tecnicos, settings.AI_REPORT_TOKEN_BUDGET)
+        async for fragmento in self._astream(chain, {"contenido": contenido}, "informe"):
+            partes.append(fragmento)
+            yield fragmento
         
-        return resultado.content
+        self._guardar_informe(clave, "".join(partes))
     
-    def chat_with_data(
+    def _chat_chain(
         self, 
         pregunta: str, 
         datos_tecnicos: Dict[str, Any], 
-        historial: Optional[list] = None
-    ) -> str:
+        historial: Optional[list] = None,
+        resumen: Optional[str] = None,
+        analisis_id: Optional[str] = None
+    ):
         """
-        Hacer preguntas sobre los datos del análisis
+        Obtener la cadena de chat compartida y sus variables de entrada
+        Los datos y el historial se pasan como variables (no dentro del
+        template) para que las llaves del JSON no se interpreten como campos
         """
         # Preparar contexto
-        contenido = "\n\n".join([
-            f"{key.upper()}:\n{value}" 
-            for key, value in datos_tecnicos.items() 
-            if key not in ["mac_address", "timestamp"]
-        ])
+        contenido = self._contenido_chat(pregunta, datos_tecnicos, historial, analisis_id)
         
-        # Construir historial si existe
+        # Resumen de turnos antiguos + turnos recientes dentro del presupuesto
         historial_str = ""
+        if resumen:
+            historial_str += "\n\n--- RESUMEN DE LA CONVERSACIÓN ANTERIOR ---\n"
+            historial_str += resumen
         if historial and len(historial) > 0:
-            historial_str = "\n\n--- HISTORIAL DE CONVERSACIÓN ---\n"
-            historial_str += "\n".join(historial[-settings.MAX_CHAT_HISTORY:])
-        
-        # Template de chat
-        template_chat = f"""
-Eres un asistente experto en análisis de redes WiFi. 
-Responde a la siguiente pregunta basándote ÚNICAMENTE en los datos técnicos proporcionados.
-
-{historial_str}
-
---- DATOS TÉCNICOS DEL GATEWAY ---
-{contenido}
-
---- PREGUNTA DEL USUARIO ---
-{{pregunta}}
-
-Proporciona una respuesta clara, técnica pero entendible, basada SOLO en los datos disponibles.
-Si la información no está disponible en los datos, indícalo claramente.
-"""
+            recientes = []
+            tokens = 0
+            for linea in reversed(historial):
+                tokens += estimar_tokens(linea)
+                if recientes and tokens > settings.CHAT_HISTORIAL_TOKEN_BUDGET:
+                    break
+                recientes.insert(0, linea)
+            historial_str += "\n\n--- HISTORIAL DE CONVERSACIÓN ---\n"
+            historial_str += "\n".join(recientes)
         
-        # Configurar modelo
-        llm = ChatGoogleGenerativeAI(
-            model=settings.AI_MODEL,
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=0.5
+        chain = get_chain(
+            CHAT_PROMPT,
+            ("historial", "contenido", "pregunta"),
+            settings.AI_CHAT_TEMPERATURE
         )
-        
-        # Crear prompt
-        prompt = PromptTemplate(
-            input_variables=["pregunta"],
-            template=template_chat
+        entradas = {
+            "historial": historial_str,
+            "contenido": contenido,
+            "pregunta": pregunta
+        }
+        return chain, entradas
+    
+    async def achat_with_data(
+        self, 
+        pregunta: str, 
+        datos_tecnicos: Dict[str, Any], 
+        historial: Optional[list] = None,
+        resumen: Optional[str] = None,
+        analisis_id: Optional[str] = None
+    ) -> str:
+        """
+        Hacer preguntas sobre los datos del análisis sin bloquear el event loop
+        """
+        chain, entradas = self._chat_chain(pregunta, datos_tecnicos, historial, resumen, analisis_id)
+        return await self._ainvocar(chain, entradas, "chat")
+    
+    async def stream_chat_with_data(
+        self, 
+        pregunta: str, 
+        datos_tecnicos: Dict[str, Any], 
+        historial: Optional[list] = None,
+        resumen: Optional[str] = None,
+        analisis_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Responder preguntas sobre el análisis emitiendo la respuesta por
+        fragmentos a medida que el modelo la genera
+        """
+        chain, entradas = self._chat_chain(pregunta, datos_tecnicos, historial, resumen, analisis_id)
+        async for fragmento in self._astream(chain, entradas, "chat"):
+            yield fragmento
+    
+    async def aresumir_conversacion(self, resumen: str, turnos: list) -> str:
+        """
+        Incorporar turnos antiguos de una conversación a su resumen
+        El resultado se recorta a CHAT_RESUMEN_MAX_TOKENS
+        """
+        chain = get_chain(
+            RESUMEN_CHAT_PROMPT,
+            ("max_palabras", "resumen", "turnos"),
+            TEMPERATURA_RESUMEN
         )
+        resultado = await self._ainvocar(chain, {
+            # ~0.75 palabras por token
+            "max_palabras": settings.CHAT_RESUMEN_MAX_TOKENS * 3 // 4,
+            "resumen": resumen or "(sin resumen previo)",
+            "turnos": "\n".join(turnos)
+        }, "resumen")
         
-        # Generar respuesta
-        chain = prompt | llm
-        resultado = chain.invoke({"pregunta": pregunta})
-        
-        return resultado.content
+        nuevo = resultado.strip()
+        if estimar_tokens(nuevo) > settings.CHAT_RESUMEN_MAX_TOKENS:
+            nuevo = nuevo[:settings.CHAT_RESUMEN_MAX_TOKENS * 4]
+        return nuevo
@@ -0,0 +1,437 @@
+# ============================================
+# JOBS.PY - Procesamiento asíncrono de análisis
+# ============================================
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .config import settings
+from .database import get_supabase_client, ejecutar
+from .gateway_analyzer import GatewayAnalyzer
+from .metricas import ANALISIS_SINGLEFLIGHT
+from .models import EstadoAnalisis
+from .trazas import Span, anotar, span
+
+# ============================================
+# TRABAJO DE ANÁLISIS
+# ============================================
+
+@dataclass
+class TrabajoAnalisis:
+    """Análisis ya registrado en estado pendiente, a la espera de un worker"""
+    analisis_id: str
+    mac_address: str
+    incluir_eventos: bool = True
+    forzar_actualizacion: bool = False
+    # Span de la solicitud que lo encoló (el worker continúa esa traza)
+    traza: Optional[Span] = None
+
+# ============================================
+# DEDUPLICACIÓN DE ANÁLISIS EN CURSO
+# ============================================
+
+@dataclass
+class ResultadoAnalisis:
+    """Datos técnicos e informe IA de un gateway"""
+    datos_tecnicos: Dict[str, Any]
+    informe_ia: str
+    informe_desde_cache: bool
+
+class TransmisionInforme:
+    """
+    Fragmentos de un informe en generación
+    
+    El análisis los agrega a medida que el LLM los produce y cualquier número
+    de streams los sigue en vivo (primero lo ya generado, luego lo nuevo).
+    """
+    
+    def __init__(self):
+        self.partes: List[str] = []
+        self.terminado = False
+        self.error: Optional[str] = None
+        self.desde_cache = False
+        self._cambio = asyncio.Event()
+    
+    @property
+    def texto(self) -> str:
+        return "".join(self.partes)
+    
+    def agregar(self, fragmento: str) -> None:
+        self.partes.append(fragmento)
+        self._notificar()
+    
+    def terminar(self, error: Optional[str] = None, desde_cache: bool = False) -> None:
+        self.terminado = True
+        self.error = error
+        self.desde_cache = desde_cache
+        self._notificar()
+    
+    def _notificar(self) -> None:
+        self._cambio.set()
+        self._cambio = asyncio.Event()
+    
+    async def seguir(self) -> AsyncIterator[str]:
+        """Emitir los fragmentos hasta el final (RuntimeError si la generación falló)"""
+        enviados = 0
+        while True:
+            while enviados < len(self.partes):
+                enviados += 1
+                yield self.partes[enviados - 1]
+            if self.terminado:
+                if self.error is not None:
+                    raise RuntimeError(self.error)
+                return
+            await self._cambio.wait()
+
+class EtapasAnalisis:
+    """Resultados intermedios de un análisis en curso, compartidos con quienes se unen"""
+    
+    def __init__(self):
+        # Datos técnicos apenas termina NCE (cancelado si el análisis falla antes)
+        self.datos: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.informe = TransmisionInforme()
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave en una sola ejecución
+    
+    La primera llamada lanza el trabajo como tarea; las que llegan mientras
+    sigue en curso esperan esa misma tarea. Cancelar a un llamador no cancela
+    el trabajo compartido mientras quede otro esperándolo; si se cancela el
+    último, el trabajo se cancela también.
+    """
+    
+    def __init__(self):
+        self._en_vuelo: Dict[Hashable, Tuple[asyncio.Task, Any]] = {}
+        # Llamadores que todavía esperan cada tarea
+        self._interesados: Dict[asyncio.Task, int] = {}
+        self.ejecutadas = 0
+        self.compartidas = 0
+        self.canceladas = 0
+    
+    def lanzar(
+        self, 
+        clave: Hashable, 
+        funcion: Callable[[Any], Awaitable[Any]],
+        crear_estado: Callable[[], Any] = lambda: None
+    ) -> Tuple[asyncio.Task, Any, bool]:
+        """
+        Lanzar funcion(estado) o unirse a la ejecución en curso con la misma clave
+        El estado (crear_estado()) lo comparten todos los llamadores, para
+        exponer avances antes de que termine la tarea
+        Retorna (tarea, estado, si fue compartida) sin esperar el resultado
+        Cada llamada a lanzar() debe cerrarse con soltar()
+        """
+        en_vuelo = self._en_vuelo.get(clave)
+        if en_vuelo is not None:
+            self.compartidas += 1
+            self._interesados[en_vuelo[0]] += 1
+            return (*en_vuelo, True)
+        
+        self.ejecutadas += 1
+        estado = crear_estado()
+        tarea = asyncio.create_task(funcion(estado))
+        self._en_vuelo[clave] = (tarea, estado)
+        self._interesados[tarea] = 1
+        tarea.add_done_callback(lambda t: self._terminar(clave, t))
+        return tarea, estado, False
+    
+    def soltar(self, tarea: asyncio.Task, cancelado: bool = False) -> None:
+        """
+        Un llamador dejó de esperar la tarea
+        Si fue cancelado y era el último interesado, se cancela el trabajo
+        """
+        restantes = self._interesados.get(tarea, 1) - 1
+        if restantes > 0:
+            self._interesados[tarea] = restantes
+            return
+        self._interesados.pop(tarea, None)
+        if cancelado and not tarea.done():
+            self.canceladas += 1
+            tarea.cancel()
+    
+    async def ejecutar(
+        self, 
+        clave: Hashable, 
+        funcion: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        Ejecutar funcion() o unirse a la ejecución en curso con la misma clave
+        Retorna (resultado, si fue compartido con una ejecución previa)
+        """
+        tarea, _, compartida = self.lanzar(clave, lambda estado: funcion())
+        cancelado = False
+        try:
+            return await asyncio.shield(tarea), compartida
+        except asyncio.CancelledError:
+            cancelado = True
+            raise
+        finally:
+            self.soltar(tarea, cancelado)
+    
+    def _terminar(self, clave: Hashable, tarea: asyncio.Task) -> None:
+        if self._en_vuelo.get(clave, (None,))[0] is tarea:
+            del self._en_vuelo[clave]
+        # Marcar la excepción como recuperada aunque ya no quede nadie esperando
+        if not tarea.cancelled():
+            tarea.exception()
+    
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "en_curso": len(self._en_vuelo),
+            "ejecutadas": self.ejecutadas,
+            "compartidas": self.compartidas,
+            "canceladas": self.canceladas
+        }
+
+# Análisis en curso por (MAC, incluir_eventos, forzar_actualizacion)
+analisis_en_vuelo = SingleFlight()
+
+# Informes en generación por id de análisis (los sigue el endpoint de stream)
+informes_en_curso: Dict[str, TransmisionInforme] = {}
+
+async def analizar_gateway(
+    mac_address: str,
+    incluir_eventos: bool,
+    forzar_actualizacion: bool,
+    al_obtener_datos: Optional[Callable[[Dict[str, Any], TransmisionInforme], Awaitable[None]]] = None
+) -> Tuple[ResultadoAnalisis, bool]:
+    """
+    Consultar NCE y generar el informe IA de un gateway, compartiendo el
+    trabajo con análisis idénticos que ya estén en curso
+    al_obtener_datos(datos_tecnicos, transmision) se llama apenas están los
+    datos técnicos, antes de que termine el informe
+    Retorna (resultado, si fue compartido)
+    """
+    async def ejecutar(etapas: EtapasAnalisis) -> ResultadoAnalisis:
+        # La tarea compartida queda en la traza del primer llamador
+        with span("analisis.gateway", mac=mac_address):
+            analyzer = GatewayAnalyzer(forzar_actualizacion=forzar_actualizacion)
+            try:
+                datos_tecnicos = await asyncio.to_thread(
+                    analyzer.analyze_gateway,
+                    mac_address,
+                    incluir_eventos
+                )
+            except BaseException as e:
+                if isinstance(e, asyncio.CancelledError):
+                    # El hilo no se puede interrumpir: que deje de consultar NCE
+                    analyzer.cancelar()
+                etapas.datos.cancel()
+                raise
+            etapas.datos.set_result(datos_tecnicos)
+            
+            with span("informe.generar"):
+                try:
+                    async for fragmento in analyzer.stream_ai_report(datos_tecnicos):
+                        etapas.informe.agregar(fragmento)
+                except BaseException as e:
+                    etapas.informe.terminar(error=str(e) or type(e).__name__)
+                    raise
+                etapas.informe.terminar(desde_cache=analyzer.informe_desde_cache)
+                anotar(desde_cache=analyzer.informe_desde_cache)
+            return ResultadoAnalisis(datos_tecnicos, etapas.informe.texto, analyzer.informe_desde_cache)
+    
+    tarea, etapas, compartido = analisis_en_vuelo.lanzar(
+        (mac_address, incluir_eventos, forzar_actualizacion),
+        ejecutar,
+        EtapasAnalisis
+    )
+    anotar(compartido=compartido)
+    ANALISIS_SINGLEFLIGHT.labels("compartido" if compartido else "ejecutado").inc()
+    
+    cancelado = False
+    try:
+        if al_obtener_datos is not None:
+            try:
+                datos_tecnicos = await asyncio.shield(etapas.datos)
+            except asyncio.CancelledError:
+                # Cancelado por la tarea (falló antes de tener datos): el error sale abajo
+                if not etapas.datos.cancelled():
+                    raise
+            else:
+                await al_obtener_datos(datos_tecnicos, etapas.informe)
+        
+        return await asyncio.shield(tarea), compartido
+    except asyncio.CancelledError:
+        cancelado = True
+        raise
+    finally:
+        # Si nadie más lo espera, el trabajo compartido se cancela con el último llamador
+        analisis_en_vuelo.soltar(tarea, cancelado)
+
+# ============================================
+# POOL DE WORKERS
+# ============================================
+
+class ColaAnalisis:
+    """
+    Cola de análisis atendida por un pool de workers del event loop
+    
+    Cada trabajo recorre el ciclo de EstadoAnalisis:
+    pendiente -> procesando -> completado | error.
+    El trabajo bloqueante (NCE, Supabase) se ejecuta en hilos y Gemini se
+    invoca de forma asíncrona, para que la API siga respondiendo mientras hay
+    análisis en curso.
+    """
+    
+    def __init__(self, workers: int, max_pendientes: int):
+        self.num_workers = workers
+        self.max_pendientes = max_pendientes
+        self.cola: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.aceptando = False
+    
+    @property
+    def pendientes(self) -> int:
+        return self.cola.qsize() if self.cola else 0
+    
+    async def iniciar(self) -> None:
+        """Crear la cola y lanzar los workers (llamar en el startup)"""
+        self.cola = asyncio.Queue(maxsize=self.max_pendientes)
+        self.workers = [
+            asyncio.create_task(self._worker(), name=f"analisis-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        self.aceptando = True
+    
+    def encolar(self, trabajo: TrabajoAnalisis) -> None:
+        """
+        Agregar un trabajo a la cola
+        Lanza RuntimeError si la cola está cerrada o llena
+        """
+        if not self.aceptando or self.cola is None:
+            raise RuntimeError("La cola de análisis no está aceptando trabajos")
+        try:
+            self.cola.put_nowait(trabajo)
+        except asyncio.QueueFull:
+            raise RuntimeError("La cola de análisis está llena")
+    
+    async def recuperar_huerfanos(self) -> int:
+        """
+        Cerrar los análisis que quedaron pendientes o procesando de un proceso anterior
+        (la cola vive en memoria: nadie más los va a terminar). Llamar en el startup,
+        antes de aceptar trabajos; con varios procesos de la API ejecutar un solo worker.
+        """
+        supabase = get_supabase_client()
+        response = await ejecutar(
+            supabase.table("analisis_gateways")
+                .update({
+                    "estado": EstadoAnalisis.ERROR.value,
+                    "error_detalle": "El servidor se reinició antes de terminar el análisis"
+                })
+                .in_("estado", [EstadoAnalisis.PENDIENTE.value, EstadoAnalisis.PROCESANDO.value])
+        )
+        return len(response.data or [])
+    
+    async def detener(self, timeout: float) -> None:
+        """
+        Dejar de aceptar trabajos y esperar a que terminen los que están en curso
+        Al vencer el timeout se cancelan los workers: los análisis en curso y los
+        que seguían en la cola quedan en error
+        """
+        self.aceptando = False
+        if self.cola is None:
+            return
+        
+        try:
+            await asyncio.wait_for(self.cola.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Se cancelan los análisis en curso ({self.pendientes} aún en cola)")
+        
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        
+        # Cerrar los trabajos que quedaron sin procesar
+        while not self.cola.empty():
+            trabajo = self.cola.get_nowait()
+            await self._actualizar(trabajo.analisis_id, {
+                "estado": EstadoAnalisis.ERROR.value,
+                "error_detalle": "El servidor se detuvo antes de procesar el análisis"
+            })
+            self.cola.task_done()
+    
+    async def _worker(self) -> None:
+        while True:
+            trabajo = await self.cola.get()
+            try:
+                await self._procesar(trabajo)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error inesperado en análisis {trabajo.analisis_id}: {e}")
+            finally:
+                self.cola.task_done()
+    
+    async def _procesar(self, trabajo: TrabajoAnalisis) -> None:
+        with span(
+            "analisis.procesar",
+            padre=trabajo.traza,
+            analisis_id=trabajo.analisis_id,
+            mac=trabajo.mac_address
+        ):
+            await self._procesar_trabajo(trabajo)
+    
+    async def _procesar_trabajo(self, trabajo: TrabajoAnalisis) -> None:
+        await self._actualizar(trabajo.analisis_id, {
+            "estado": EstadoAnalisis.PROCESANDO.value
+        })
+        
+        async def guardar_datos(datos_tecnicos: Dict[str, Any], transmision: TransmisionInforme) -> None:
+            # El stream del informe se engancha a esta generación en vez de lanzar otra
+            informes_en_curso[trabajo.analisis_id] = transmision
+            await self._actualizar(trabajo.analisis_id, {"datos_tecnicos": datos_tecnicos})
+        
+        try:
+            try:
+                resultado, _ = await analizar_gateway(
+                    trabajo.mac_address,
+                    trabajo.incluir_eventos,
+                    trabajo.forzar_actualizacion,
+                    al_obtener_datos=guardar_datos
+                )
+            except asyncio.CancelledError:
+                # Worker cancelado al apagar: no dejar la fila en procesando
+                try:
+                    await asyncio.shield(self._actualizar(trabajo.analisis_id, {
+                        "estado": EstadoAnalisis.ERROR.value,
+                        "error_detalle": "El servidor se detuvo durante el análisis"
+                    }))
+                except Exception as e:
+                    print(f"⚠️ No se pudo cerrar el análisis {trabajo.analisis_id}: {e}")
+                raise
+            except Exception as e:
+                await self._actualizar(trabajo.analisis_id, {
+                    "estado": EstadoAnalisis.ERROR.value,
+                    "error_detalle": f"Error al realizar análisis: {str(e)}"
+                })
+                anotar(error=str(e))
+                return
+            
+            # Cada análisis guarda su propia fila aunque el trabajo haya sido compartido
+            # (informe_desde_cache indica solo un acierto de la caché de informes)
+            await self._actualizar(trabajo.analisis_id, {
+                "estado": EstadoAnalisis.COMPLETADO.value,
+                "informe_ia": resultado.informe_ia,
+                "informe_desde_cache": resultado.informe_desde_cache
+            })
+        finally:
+            # Recién con el informe guardado el stream puede leerlo de la fila
+            informes_en_curso.pop(trabajo.analisis_id, None)
+    
+    async def _actualizar(self, analisis_id: str, datos: dict) -> None:
+        supabase = get_supabase_client()
+        await ejecutar(
+            supabase.table("analisis_gateways")
+                .update(datos)
+                .eq("id", analisis_id)
+        )
+
+
+# Instancia global del pool de análisis
+cola_analisis = ColaAnalisis(
+    workers=settings.ANALYSIS_WORKERS,
+    max_pendientes=settings.ANALYSIS_QUEUE_MAX
+)
@@ -0,0 +1,208 @@
+# ============================================
+# LIMITES.PY - Límites de tasa y de concurrencia
+# ============================================
+
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Hashable, Iterator, Optional
+
+from fastapi import HTTPException, Request, status
+
+from .config import settings
+from .auth import decode_access_token
+
+# ============================================
+# LÍMITE DE TASA (TOKEN BUCKET)
+# ============================================
+
+class LimitadorTasa:
+    """
+    Token bucket por clave (usuario o IP + ruta), seguro entre hilos
+
+    Cada clave dispone de `capacidad` solicitudes que se recargan de forma
+    continua a razón de `capacidad` por minuto: se permiten ráfagas cortas
+    pero el promedio queda acotado.
+    """
+
+    def __init__(self, capacidad: int, max_claves: int = 10000):
+        self.capacidad = capacidad
+        self.recarga_por_segundo = capacidad / 60
+        self.max_claves = max_claves
+        self._buckets: Dict[Hashable, list] = {}
+        self._lock = threading.Lock()
+        self.permitidas = 0
+        self.rechazadas = 0
+
+    def consumir(self, clave: Hashable) -> float:
+        """
+        Consumir un token de la clave
+        Retorna 0 si se permite o los segundos a esperar hasta el próximo token
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(clave)
+            if bucket is None:
+                if len(self._buckets) >= self.max_claves:
+                    self._purgar(ahora)
+                bucket = self._buckets[clave] = [float(self.capacidad), ahora]
+
+            tokens, ultimo = bucket
+            tokens = min(self.capacidad, tokens + (ahora - ultimo) * self.recarga_por_segundo)
+            bucket[1] = ahora
+
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                self.permitidas += 1
+                return 0.0
+
+            bucket[0] = tokens
+            self.rechazadas += 1
+            return (1 - tokens) / self.recarga_por_segundo
+
+    def _purgar(self, ahora: float) -> None:
+        """Eliminar los buckets que ya se recargaron por completo (equivalen a uno nuevo)"""
+        llenado = self.capacidad / self.recarga_por_segundo
+        for clave in [c for c, (_, ultimo) in self._buckets.items() if ahora - ultimo >= llenado]:
+            del self._buckets[clave]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacidad_por_minuto": self.capacidad,
+                "claves_activas": len(self._buckets),
+                "permitidas": self.permitidas,
+                "rechazadas": self.rechazadas
+            }
+
+# Límite global por usuario y ruta
+limitador_tasa = LimitadorTasa(settings.RATE_LIMIT_PER_MINUTE)
+
+# Rutas consultadas por balanceadores y monitoreo externo
+RUTAS_SIN_LIMITE = {"/", "/health", "/metrics"}
+
+def _cliente(request: Request) -> str:
+    """Identificar al usuario por su token o, si no tiene uno válido, por IP"""
+    autorizacion = request.headers.get("authorization", "")
+    if autorizacion.lower().startswith("bearer "):
+        try:
+            return f"usuario:{decode_access_token(autorizacion[7:]).user_id}"
+        except HTTPException:
+            pass
+    return f"ip:{request.client.host if request.client else 'desconocido'}"
+
+async def limitar_tasa(request: Request) -> None:
+    """
+    Dependencia global: aplicar RATE_LIMIT_PER_MINUTE por usuario y ruta
+    Responde 429 con Retry-After cuando se agota el bucket
+    """
+    ruta = getattr(request.scope.get("route"), "path", request.url.path)
+    if ruta in RUTAS_SIN_LIMITE:
+        return
+    clave = (_cliente(request), request.method, ruta)
+
+    espera = limitador_tasa.consumir(clave)
+    if espera > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas solicitudes, intenta nuevamente en unos segundos",
+            headers={"Retry-After": str(math.ceil(espera))}
+        )
+
+# ============================================
+# LÍMITES DE CONCURRENCIA HACIA BACKENDS
+# ============================================
+
+class LimiteConcurrenciaHilos:
+    """
+    Máximo de llamadas simultáneas desde hilos (consultas a NCE)
+    Si no se obtiene un cupo dentro del timeout se lanza TimeoutError
+    """
+
+    def __init__(self, nombre: str, maximo: int):
+        self.nombre = nombre
+        self.maximo = maximo
+        self._semaforo = threading.BoundedSemaphore(maximo)
+        self._lock = threading.Lock()
+        self.en_curso = 0
+        self.esperando = 0
+        self.rechazadas = 0
+
+    @contextmanager
+    def cupo(self, timeout: Optional[float] = None) -> Iterator[None]:
+        with self._lock:
+            self.esperando += 1
+        obtenido = self._semaforo.acquire(timeout=timeout)
+        with self._lock:
+            self.esperando -= 1
+            if obtenido:
+                self.en_curso += 1
+            else:
+                self.rechazadas += 1
+        if not obtenido:
+            raise TimeoutError(f"Sin cupo disponible para {self.nombre}")
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.en_curso -= 1
+            self._semaforo.release()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "maximo": self.maximo,
+                "en_curso": self.en_curso,
+                "esperando": self.esperando,
+                "rechazadas": self.rechazadas
+            }
+
+class LimiteConcurrenciaAsync:
+    """Máximo de llamadas simultáneas desde el event loop (llamadas al LLM)"""
+
+    def __init__(self, nombre: str, maximo: int):
+        self.nombre = nombre
+        self.maximo = maximo
+        self._semaforo = asyncio.Semaphore(maximo)
+        self.en_curso = 0
+        self.esperando = 0
+
+    @asynccontextmanager
+    async def cupo(self) -> AsyncIterator[None]:
+        self.esperando += 1
+        try:
+            await self._semaforo.acquire()
+        finally:
+            self.esperando -= 1
+
+        self.en_curso += 1
+        try:
+            yield
+        finally:
+            self.en_curso -= 1
+            self._semaforo.release()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "maximo": self.maximo,
+            "en_curso": self.en_curso,
+            "esperando": self.esperando
+        }
+
+# Límites compartidos por todo el proceso
+limite_nce = LimiteConcurrenciaHilos("NCE", settings.NCE_MAX_CONCURRENT)
+limite_llm = LimiteConcurrenciaAsync("LLM", settings.LLM_MAX_CONCURRENT)
+# Gateways de análisis bulk en curso, sumando todas las solicitudes
+limite_bulk = LimiteConcurrenciaAsync("bulk", settings.MAX_CONCURRENT_REQUESTS)
+
+def estadisticas_limites() -> Dict[str, Any]:
+    """Estado de todos los limitadores (para monitoreo)"""
+    return {
+        "tasa": limitador_tasa.estadisticas(),
+        "nce": limite_nce.estadisticas(),
+        "llm": limite_llm.estadisticas(),
+        "bulk": limite_bulk.estadisticas()
+    }
@@ -0,0 +1,37 @@
+# ============================================
+# LLM.PY - Cliente de IA compartido
+# ============================================
+
+from functools import lru_cache
+from langchain_core.prompts import PromptTemplate
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from .config import settings
+
+# ============================================
+# MODELO Y CADENAS
+# ============================================
+
+@lru_cache()
+def get_llm(temperature: float) -> ChatGoogleGenerativeAI:
+    """
+    Crear y cachear el cliente de Gemini para una temperatura
+    Se crea una sola vez por proceso y se reutiliza entre requests
+    """
+    return ChatGoogleGenerativeAI(
+        model=settings.AI_MODEL,
+        google_api_key=settings.GOOGLE_API_KEY,
+        temperature=temperature
+    )
+
+@lru_cache(maxsize=32)
+def get_chain(template: str, input_variables: tuple, temperature: float):
+    """
+    Crear y cachear la cadena prompt | modelo para un template
+    Los templates personalizados también quedan compilados (hasta 32)
+    """
+    prompt = PromptTemplate(
+        input_variables=list(input_variables),
+        template=template
+    )
+    return prompt | get_llm(temperature)
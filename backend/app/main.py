@@ -2,22 +2,33 @@
 # MAIN.PY - API Principal
 # ============================================
 
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import json
+import logging
+import time
+import uuid
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from datetime import timedelta, datetime
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.background import BackgroundTask
+from datetime import timedelta, datetime, timezone
 from supabase import Client
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
 from .config import settings
-from .database import get_supabase, verificar_conexion
+from .database import get_supabase, verificar_conexion, ejecutar, TimeoutConsultaDB
 from .auth import (
     authenticate_user, 
     create_access_token, 
-    hash_password,
+    hash_password_async,
     get_current_user,
     get_current_admin_user,
-    crear_usuario_inicial
+    crear_usuario_inicial,
+    cache_usuarios,
+    invalidar_usuario,
+    registro_accesos,
+    ejecutor_hash
 )
 from .models import (
     UsuarioCreate,
@@ -29,15 +40,42 @@ from .models import (
     ErrorResponse,
     AnalisisGatewayRequest,
     AnalisisBulkRequest,
+    AnalisisBulkResultado,
     AnalisisGatewayResponse,
+    AnalisisGatewayPagina,
     AnalisisCompletoResponse,
+    AnalisisEstadoResponse,
     ChatRequest,
     ChatResponse,
+    ChatHistorialPagina,
     EstadisticasUsuario,
     EstadisticasGlobales,
-    RolUsuario
+    RolUsuario,
+    EstadoAnalisis,
+    FlotaWatchlistRequest,
+    TendenciaKPIResponse,
+    normalizar_mac
+)
+from .gateway_analyzer import GatewayAnalyzer, cache_nce, cache_informes
+from .jobs import cola_analisis, TrabajoAnalisis, analizar_gateway, analisis_en_vuelo, informes_en_curso
+from .paginacion import paginar, separar_pagina
+from .memoria_chat import cargar_memoria, actualizar_memoria
+from .recuperacion import cache_indices
+from .limites import limitar_tasa, estadisticas_limites, limite_nce, limite_llm, limite_bulk
+from .metricas import ANALISIS_PENDIENTES, HTTP_SOLICITUD_SEGUNDOS, LLAMADAS_EN_CURSO, SERIES_KPI
+from .trazas import anotar, span, span_actual
+from .resiliencia import estado_circuitos
+from .flota import almacen_kpi, guardar_watchlist, poller_flota
+from .series_kpi import resumir
+
+# ============================================
+# LOGGING
+# ============================================
+
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
 )
-from .gateway_analyzer import GatewayAnalyzer
 
 # ============================================
 # INICIALIZACIÓN DE FASTAPI
@@ -48,7 +86,9 @@ app = FastAPI(
     description=settings.API_DESCRIPTION,
     version=settings.API_VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    # Límite de solicitudes por usuario (o IP) y ruta
+    dependencies=[Depends(limitar_tasa)]
 )
 
 # ============================================
@@ -63,6 +103,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ============================================
+# MÉTRICAS
+# ============================================
+
+@app.middleware("http")
+async def medir_solicitudes(request: Request, call_next):
+    """
+    Registrar la duración de cada solicitud por plantilla de ruta y status
+    Cada solicitud inicia una traza; su id se devuelve en X-Trace-Id
+    """
+    inicio = time.monotonic()
+    status_code = 500
+    with span("http", metodo=request.method) as actual:
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            response.headers["X-Trace-Id"] = actual.traza_id
+            return response
+        finally:
+            # Plantilla (/api/analisis/{analisis_id}) para no crear una serie por id
+            ruta = getattr(request.scope.get("route"), "path", "sin_ruta")
+            actual.nombre = f"http {request.method} {ruta}"
+            actual.atributos["status"] = status_code
+            HTTP_SOLICITUD_SEGUNDOS.labels(request.method, ruta, str(status_code)).observe(
+                time.monotonic() - inicio
+            )
+
+# Valores que se leen del estado interno al momento de exportar
+ANALISIS_PENDIENTES.set_function(lambda: cola_analisis.pendientes)
+LLAMADAS_EN_CURSO.labels("nce").set_function(lambda: limite_nce.en_curso)
+LLAMADAS_EN_CURSO.labels("llm").set_function(lambda: limite_llm.en_curso)
+SERIES_KPI.set_function(lambda: almacen_kpi.estadisticas()["series"])
+
 # ============================================
 # EVENTOS DE INICIO Y CIERRE
 # ============================================
@@ -83,8 +156,27 @@ async def startup_event():
         # Crear usuario administrador inicial
         supabase = get_supabase()
         await crear_usuario_inicial(supabase)
+        
+        # Cerrar los análisis que el proceso anterior dejó a medias
+        try:
+            huerfanos = await cola_analisis.recuperar_huerfanos()
+            if huerfanos:
+                print(f"⚠️ Análisis interrumpidos por el reinicio marcados en error: {huerfanos}")
+        except Exception as e:
+            print(f"⚠️ No se pudieron recuperar los análisis interrumpidos: {e}")
     else:
         print("❌ Error de conexión con Supabase")
+    
+    # Iniciar workers de análisis
+    await cola_analisis.iniciar()
+    print(f"⚙️ Workers de análisis: {settings.ANALYSIS_WORKERS}")
+    
+    # Escritura periódica de último acceso
+    registro_accesos.iniciar(settings.LAST_ACCESS_FLUSH_SECONDS)
+    
+    # Poller de KPIs de la flota
+    poller_flota.iniciar(settings.FLEET_POLL_INTERVAL_SECONDS)
+    print(f"📡 Gateways vigilados: {len(poller_flota.macs)} (cada {settings.FLEET_POLL_INTERVAL_SECONDS}s)")
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -92,6 +184,15 @@ async def shutdown_event():
     Ejecutar al cerrar la aplicación
     """
     print("👋 Cerrando API WiFi Gateway Analyzer...")
+    
+    # Terminar los análisis en curso antes de salir
+    await cola_analisis.detener(settings.ANALYSIS_SHUTDOWN_TIMEOUT)
+    
+    # Escribir los últimos accesos pendientes
+    await registro_accesos.detener()
+    
+    # Detener el poller y guardar las series
+    await poller_flota.detener()
 
 # ============================================
 # ENDPOINTS DE SALUD Y ESTADO
@@ -116,10 +217,13 @@ async def health_check():
     Health check - Verificar estado de la API
     """
     db_ok = await verificar_conexion()
+    circuitos = estado_circuitos()
+    nce_ok = all(c["estado"] == "cerrado" for c in circuitos.values())
     
     return {
-        "status": "healthy" if db_ok else "unhealthy",
+        "status": ("healthy" if nce_ok else "degraded") if db_ok else "unhealthy",
         "database": "connected" if db_ok else "disconnected",
+        "nce_circuitos": circuitos,
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -195,7 +299,7 @@ async def listar_usuarios(
     """
     Listar todos los usuarios (solo admin)
     """
-    response = supabase.table("usuarios").select("*").order("created_at", desc=True).execute()
+    response = await ejecutar(supabase.table("usuarios").select("*").order("created_at", desc=True))
     return [UsuarioResponse(**usuario) for usuario in response.data]
 
 @app.post("/api/usuarios", response_model=UsuarioResponse, tags=["Usuarios"])
@@ -208,7 +312,7 @@ async def crear_usuario(
     Crear nuevo usuario (solo admin)
     """
     # Verificar si el email ya existe
-    existing = supabase.table("usuarios").select("id").eq("email", usuario.email).execute()
+    existing = await ejecutar(supabase.table("usuarios").select("id").eq("email", usuario.email))
     if existing.data and len(existing.data) > 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -218,13 +322,13 @@ async def crear_usuario(
     # Crear usuario
     usuario_data = {
         "email": usuario.email,
-        "password_hash": hash_password(usuario.password),
+        "password_hash": await hash_password_async(usuario.password),
         "nombre": usuario.nombre,
         "rol": usuario.rol.value,
         "activo": usuario.activo
     }
     
-    response = supabase.table("usuarios").insert(usuario_data).execute()
+    response = await ejecutar(supabase.table("usuarios").insert(usuario_data))
     
     if not response.data or len(response.data) == 0:
         raise HTTPException(
@@ -254,7 +358,7 @@ async def actualizar_usuario(
     if usuario_update.activo is not None:
         update_data["activo"] = usuario_update.activo
     if usuario_update.password is not None:
-        update_data["password_hash"] = hash_password(usuario_update.password)
+        update_data["password_hash"] = await hash_password_async(usuario_update.password)
     
     if not update_data:
         raise HTTPException(
@@ -263,7 +367,8 @@ async def actualizar_usuario(
         )
     
     # Actualizar usuario
-    response = supabase.table("usuarios").update(update_data).eq("id", usuario_id).execute()
+    response = await ejecutar(supabase.table("usuarios").update(update_data).eq("id", usuario_id))
+    invalidar_usuario(usuario_id)
     
     if not response.data or len(response.data) == 0:
         raise HTTPException(
@@ -289,7 +394,8 @@ async def eliminar_usuario(
             detail="No puedes eliminar tu propio usuario"
         )
     
-    response = supabase.table("usuarios").delete().eq("id", usuario_id).execute()
+    response = await ejecutar(supabase.table("usuarios").delete().eq("id", usuario_id))
+    invalidar_usuario(usuario_id)
     
     if not response.data or len(response.data) == 0:
         raise HTTPException(
@@ -299,11 +405,29 @@ async def eliminar_usuario(
     
     return MessageResponse(message="Usuario eliminado exitosamente")
 
+# ============================================
+# UTILIDADES DE STREAMING (SSE)
+# ============================================
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+def _evento_sse(evento: str, datos: dict) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
 # ============================================
 # ENDPOINTS DE ANÁLISIS DE GATEWAYS
 # ============================================
 
-@app.post("/api/analisis", response_model=AnalisisCompletoResponse, tags=["Análisis"])
+@app.post(
+    "/api/analisis",
+    response_model=AnalisisCompletoResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Análisis"]
+)
 async def crear_analisis(
     request: AnalisisGatewayRequest,
     current_user: UsuarioResponse = Depends(get_current_user),
@@ -311,67 +435,206 @@ async def crear_analisis(
 ):
     """
     Crear nuevo análisis de gateway
+    Retorna de inmediato el análisis en estado pendiente; un worker lo procesa
+    en segundo plano (consultar /api/analisis/{id}/estado)
     """
+    if not cola_analisis.aceptando:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El servicio de análisis no está disponible"
+        )
+    
+    # Registrar análisis pendiente
+    analisis_data = {
+        "usuario_id": current_user.id,
+        "mac_address": request.mac_address,
+        "datos_tecnicos": {},
+        "estado": EstadoAnalisis.PENDIENTE.value
+    }
+    
+    response = await ejecutar(supabase.table("analisis_gateways").insert(analisis_data))
+    
+    if not response.data or len(response.data) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al guardar análisis"
+        )
+    
+    resultado = response.data[0]
+    anotar(analisis_id=resultado["id"], mac=request.mac_address)
+    
+    # Encolar para procesamiento en segundo plano
     try:
-        # Crear analizador
-        analyzer = GatewayAnalyzer()
-        
-        # Obtener datos técnicos
-        datos_tecnicos = analyzer.analyze_gateway(
-            request.mac_address,
-            request.incluir_eventos
+        cola_analisis.encolar(TrabajoAnalisis(
+            analisis_id=resultado["id"],
+            mac_address=request.mac_address,
+            incluir_eventos=request.incluir_eventos,
+            forzar_actualizacion=request.forzar_actualizacion,
+            traza=span_actual()
+        ))
+    except RuntimeError as e:
+        await ejecutar(supabase.table("analisis_gateways").update({
+            "estado": EstadoAnalisis.ERROR.value,
+            "error_detalle": str(e)
+        }).eq("id", resultado["id"]))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
         )
-        
-        # Generar informe con IA
-        informe_ia = analyzer.generate_ai_report(datos_tecnicos)
-        
-        # Guardar en base de datos
-        analisis_data = {
-            "usuario_id": current_user.id,
-            "mac_address": request.mac_address,
-            "datos_tecnicos": datos_tecnicos,
-            "informe_ia": informe_ia,
-            "estado": "completado"
-        }
-        
-        response = supabase.table("analisis_gateways").insert(analisis_data).execute()
-        
-        if not response.data or len(response.data) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al guardar análisis"
+    
+    # Agregar email del usuario
+    resultado["usuario_email"] = current_user.email
+    
+    return AnalisisCompletoResponse(**resultado)
+
+async def _analizar_mac(
+    mac: str,
+    incluir_eventos: bool,
+    forzar_actualizacion: bool
+) -> tuple:
+    """
+    Obtener datos técnicos e informe IA de un gateway sin bloquear el event loop
+    El cupo de limite_bulk es global: varias solicitudes bulk no suman concurrencia
+    Retorna (mac, datos_tecnicos, informe_ia, informe_desde_cache, compartido, error)
+    """
+    async with limite_bulk.cupo():
+        try:
+            resultado, compartido = await analizar_gateway(
+                mac, incluir_eventos, forzar_actualizacion
             )
+            return (
+                mac,
+                resultado.datos_tecnicos,
+                resultado.informe_ia,
+                resultado.informe_desde_cache,
+                compartido,
+                None
+            )
+        except Exception as e:
+            return mac, None, None, False, False, str(e)
+
+async def _stream_analisis_bulk(
+    request: AnalisisBulkRequest,
+    current_user: UsuarioResponse,
+    supabase: Client
+) -> AsyncIterator[str]:
+    """
+    Ejecutar los análisis en paralelo y emitir una línea NDJSON por evento:
+    - "resultado": un gateway terminó (en el orden en que van terminando)
+    - "guardado" / "error_guardado": un lote de filas fue insertado (o no)
+    - "resumen": totales al finalizar
+    """
+    tareas = [
+        asyncio.create_task(_analizar_mac(
+            mac, request.incluir_eventos, request.forzar_actualizacion
+        ))
+        for mac in request.mac_addresses
+    ]
+    
+    lote = []
+    completados = 0
+    errores = 0
+    
+    def evento(tipo: str, **datos) -> str:
+        return json.dumps({"tipo": tipo, **datos}, default=str) + "\n"
+    
+    async def guardar_lote() -> str:
+        ids = [fila["id"] for fila in lote]
+        try:
+            await ejecutar(supabase.table("analisis_gateways").insert(lote))
+            return evento("guardado", analisis_ids=ids)
+        except Exception as e:
+            return evento("error_guardado", analisis_ids=ids, error=str(e))
+        finally:
+            lote.clear()
+    
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            mac, datos_tecnicos, informe_ia, informe_desde_cache, compartido, error = await siguiente
+            
+            if error is not None:
+                errores += 1
+                resultado = AnalisisBulkResultado(
+                    mac_address=mac,
+                    estado=EstadoAnalisis.ERROR,
+                    error=error
+                )
+            else:
+                completados += 1
+                # El id se asigna aquí para poder informarlo antes del insert por lotes
+                fila = {
+                    "id": str(uuid.uuid4()),
+                    "usuario_id": current_user.id,
+                    "mac_address": mac,
+                    "datos_tecnicos": datos_tecnicos,
+                    "informe_ia": informe_ia,
+                    "informe_desde_cache": informe_desde_cache,
+                    "estado": EstadoAnalisis.COMPLETADO.value
+                }
+                lote.append(fila)
+                resultado = AnalisisBulkResultado(
+                    mac_address=mac,
+                    estado=EstadoAnalisis.COMPLETADO,
+                    analisis_id=fila["id"],
+                    compartido=compartido
+                )
+            
+            yield evento("resultado", **resultado.dict())
+            
+            if len(lote) >= settings.BULK_INSERT_BATCH_SIZE:
+                yield await guardar_lote()
         
-        # Agregar email del usuario
-        resultado = response.data[0]
-        resultado["usuario_email"] = current_user.email
-        
-        return AnalisisCompletoResponse(**resultado)
+        if lote:
+            yield await guardar_lote()
         
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al realizar análisis: {str(e)}"
+        yield evento(
+            "resumen",
+            total=len(tareas),
+            completados=completados,
+            errores=errores
         )
+    finally:
+        # Si el cliente se desconecta, no seguir consultando NCE ni el LLM:
+        # los análisis que nadie más espera se cancelan (ver SingleFlight.soltar)
+        for tarea in tareas:
+            tarea.cancel()
 
-@app.get("/api/analisis", response_model=List[AnalisisGatewayResponse], tags=["Análisis"])
+@app.post("/api/analisis/bulk", tags=["Análisis"])
+async def crear_analisis_bulk(
+    request: AnalisisBulkRequest,
+    current_user: UsuarioResponse = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase)
+):
+    """
+    Analizar varios gateways en paralelo (máximo 50 MACs)
+    Retorna un stream NDJSON con el resultado de cada MAC a medida que termina
+    """
+    return StreamingResponse(
+        _stream_analisis_bulk(request, current_user, supabase),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/api/analisis", response_model=AnalisisGatewayPagina, tags=["Análisis"])
 async def listar_analisis(
     current_user: UsuarioResponse = Depends(get_current_user),
     supabase: Client = Depends(get_supabase),
-    limit: int = 50,
-    offset: int = 0
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
 ):
     """
-    Listar análisis del usuario actual
+    Listar análisis del usuario actual, del más reciente al más antiguo
+    Para la página siguiente enviar el next_cursor de la respuesta
     """
-    response = supabase.table("analisis_gateways")\
+    query = supabase.table("analisis_gateways")\
         .select("id, usuario_id, mac_address, estado, created_at")\
-        .eq("usuario_id", current_user.id)\
-        .order("created_at", desc=True)\
-        .range(offset, offset + limit - 1)\
-        .execute()
+        .eq("usuario_id", current_user.id)
+    response = await ejecutar(paginar(query, cursor, limit, desc=True))
     
-    return [AnalisisGatewayResponse(**analisis) for analisis in response.data]
+    filas, next_cursor = separar_pagina(response.data, limit)
+    return AnalisisGatewayPagina(
+        items=[AnalisisGatewayResponse(**analisis) for analisis in filas],
+        next_cursor=next_cursor
+    )
 
 @app.get("/api/analisis/{analisis_id}", response_model=AnalisisCompletoResponse, tags=["Análisis"])
 async def obtener_analisis(
@@ -382,11 +645,11 @@ async def obtener_analisis(
     """
     Obtener análisis específico por ID
     """
-    response = supabase.table("analisis_gateways")\
+    query = supabase.table("analisis_gateways")\
         .select("*")\
         .eq("id", analisis_id)\
-        .eq("usuario_id", current_user.id)\
-        .execute()
+        .eq("usuario_id", current_user.id)
+    response = await ejecutar(query)
     
     if not response.data or len(response.data) == 0:
         raise HTTPException(
@@ -399,6 +662,143 @@ async def obtener_analisis(
     
     return AnalisisCompletoResponse(**resultado)
 
+@app.get("/api/analisis/{analisis_id}/estado", response_model=AnalisisEstadoResponse, tags=["Análisis"])
+async def obtener_estado_analisis(
+    analisis_id: str,
+    current_user: UsuarioResponse = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase)
+):
+    """
+    Obtener estado de procesamiento de un análisis
+    """
+    query = supabase.table("analisis_gateways")\
+        .select("id, mac_address, estado, error_detalle, created_at, updated_at")\
+        .eq("id", analisis_id)\
+        .eq("usuario_id", current_user.id)
+    response = await ejecutar(query)
+    
+    if not response.data or len(response.data) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Análisis no encontrado"
+        )
+    
+    return AnalisisEstadoResponse(**response.data[0])
+
+@app.post("/api/analisis/{analisis_id}/informe/stream", tags=["Análisis"])
+async def stream_informe_analisis(
+    analisis_id: str,
+    current_user: UsuarioResponse = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase)
+):
+    """
+    Emitir por SSE el informe IA de un análisis a medida que se genera
+    Eventos: "token" ({texto}), "fin" ({analisis_id, informe_desde_cache})
+    y "error" ({detail}).
+    
+    - Si el worker está generando el informe, el stream se engancha a esa
+      generación (lo ya producido y luego cada token nuevo)
+    - Si el informe ya está guardado, se emite en un único fragmento
+    - Si el análisis terminó (completado o error) con datos técnicos pero
+      sin informe (p. ej. falló el LLM), el endpoint lo genera y lo guarda
+      al terminar el stream
+    """
+    en_curso = (EstadoAnalisis.PENDIENTE.value, EstadoAnalisis.PROCESANDO.value)
+    
+    async def leer_fila() -> dict:
+        query = supabase.table("analisis_gateways")\
+            .select("id, estado, datos_tecnicos, informe_ia, informe_desde_cache")\
+            .eq("id", analisis_id)\
+            .eq("usuario_id", current_user.id)
+        response = await ejecutar(query)
+        
+        if not response.data or len(response.data) == 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Análisis no encontrado"
+            )
+        return response.data[0]
+    
+    fila = await leer_fila()
+    transmision = informes_en_curso.get(analisis_id)
+    if transmision is None and fila["estado"] in en_curso:
+        # El worker pudo guardar el informe y soltar la transmisión entre la
+        # lectura y la consulta: releer antes de decidir
+        fila = await leer_fila()
+        transmision = informes_en_curso.get(analisis_id)
+        if transmision is None and fila["estado"] in en_curso:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="El análisis aún no tiene datos técnicos"
+            )
+    
+    if transmision is None and not fila["informe_ia"] and not fila["datos_tecnicos"]:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="El análisis no tiene datos técnicos"
+        )
+    
+    async def seguir_worker() -> AsyncIterator[str]:
+        try:
+            async for fragmento in transmision.seguir():
+                yield _evento_sse("token", {"texto": fragmento})
+        except Exception as e:
+            yield _evento_sse("error", {"detail": f"Error al generar informe: {str(e)}"})
+            return
+        
+        yield _evento_sse("fin", {
+            "analisis_id": analisis_id,
+            "informe_desde_cache": transmision.desde_cache
+        })
+    
+    async def informe_guardado() -> AsyncIterator[str]:
+        yield _evento_sse("token", {"texto": fila["informe_ia"]})
+        yield _evento_sse("fin", {
+            "analisis_id": analisis_id,
+            "informe_desde_cache": fila.get("informe_desde_cache")
+        })
+    
+    async def generar() -> AsyncIterator[str]:
+        partes = []
+        try:
+            analyzer = GatewayAnalyzer()
+            async for fragmento in analyzer.stream_ai_report(fila["datos_tecnicos"]):
+                partes.append(fragmento)
+                yield _evento_sse("token", {"texto": fragmento})
+            
+            # Guardar informe completo
+            await ejecutar(
+                supabase.table("analisis_gateways")
+                    .update({
+                        "informe_ia": "".join(partes),
+                        "informe_desde_cache": analyzer.informe_desde_cache,
+                        "estado": EstadoAnalisis.COMPLETADO.value,
+                        "error_detalle": None
+                    })
+                    .eq("id", analisis_id)
+            )
+        except Exception as e:
+            yield _evento_sse("error", {"detail": f"Error al generar informe: {str(e)}"})
+            return
+        
+        yield _evento_sse("fin", {
+            "analisis_id": analisis_id,
+            "informe_desde_cache": analyzer.informe_desde_cache
+        })
+    
+    if transmision is not None:
+        eventos = seguir_worker()
+    elif fila["informe_ia"]:
+        eventos = informe_guardado()
+    else:
+        eventos = generar()
+    
+    return StreamingResponse(
+        eventos,
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.delete("/api/analisis/{analisis_id}", response_model=MessageResponse, tags=["Análisis"])
 async def eliminar_analisis(
     analisis_id: str,
@@ -408,11 +808,11 @@ async def eliminar_analisis(
     """
     Eliminar análisis
     """
-    response = supabase.table("analisis_gateways")\
+    query = supabase.table("analisis_gateways")\
         .delete()\
         .eq("id", analisis_id)\
-        .eq("usuario_id", current_user.id)\
-        .execute()
+        .eq("usuario_id", current_user.id)
+    response = await ejecutar(query)
     
     if not response.data or len(response.data) == 0:
         raise HTTPException(
@@ -426,21 +826,23 @@ async def eliminar_analisis(
 # ENDPOINTS DE CHAT
 # ============================================
 
-@app.post("/api/chat", response_model=ChatResponse, tags=["Chat"])
-async def chat_analisis(
+async def _preparar_chat(
     request: ChatRequest,
-    current_user: UsuarioResponse = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
-):
+    current_user: UsuarioResponse,
+    supabase: Client
+) -> tuple:
     """
-    Hacer pregunta sobre un análisis específico
+    Cargar datos técnicos y memoria de conversación de un análisis del usuario
+    Retorna (datos_tecnicos, memoria)
     """
+    anotar(analisis_id=request.analisis_id)
+    
     # Verificar que el análisis existe y pertenece al usuario
-    analisis_response = supabase.table("analisis_gateways")\
-        .select("datos_tecnicos")\
+    query = supabase.table("analisis_gateways")\
+        .select("estado, datos_tecnicos")\
         .eq("id", request.analisis_id)\
-        .eq("usuario_id", current_user.id)\
-        .execute()
+        .eq("usuario_id", current_user.id)
+    analisis_response = await ejecutar(query)
     
     if not analisis_response.data or len(analisis_response.data) == 0:
         raise HTTPException(
@@ -448,46 +850,69 @@ async def chat_analisis(
             detail="Análisis no encontrado"
         )
     
-    # Obtener historial previo
-    historial_response = supabase.table("chat_historial")\
-        .select("pregunta, respuesta")\
-        .eq("analisis_id", request.analisis_id)\
-        .order("created_at", desc=False)\
-        .limit(settings.MAX_CHAT_HISTORY)\
-        .execute()
+    estado = analisis_response.data[0]["estado"]
+    if estado != EstadoAnalisis.COMPLETADO.value:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"El análisis no está completado (estado: {estado})"
+        )
+    
+    # Resumen de la conversación anterior y últimos turnos
+    memoria = await cargar_memoria(request.analisis_id, supabase)
+    
+    return analisis_response.data[0]["datos_tecnicos"], memoria
+
+async def _guardar_mensaje_chat(
+    request: ChatRequest,
+    current_user: UsuarioResponse,
+    respuesta: str,
+    supabase: Client
+) -> ChatResponse:
+    """Guardar pregunta y respuesta en el historial de chat"""
+    chat_data = {
+        "analisis_id": request.analisis_id,
+        "usuario_id": current_user.id,
+        "pregunta": request.pregunta,
+        "respuesta": respuesta
+    }
+    
+    chat_response = await ejecutar(supabase.table("chat_historial").insert(chat_data))
     
-    historial = []
-    if historial_response.data:
-        for msg in historial_response.data:
-            historial.append(f"Humano: {msg['pregunta']}")
-            historial.append(f"Asistente: {msg['respuesta']}")
+    if not chat_response.data or len(chat_response.data) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al guardar mensaje"
+        )
+    
+    return ChatResponse(**chat_response.data[0])
+
+@app.post("/api/chat", response_model=ChatResponse, tags=["Chat"])
+async def chat_analisis(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    current_user: UsuarioResponse = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase)
+):
+    """
+    Hacer pregunta sobre un análisis específico
+    """
+    datos_tecnicos, memoria = await _preparar_chat(request, current_user, supabase)
     
     # Generar respuesta con IA
     try:
         analyzer = GatewayAnalyzer()
-        respuesta = analyzer.chat_with_data(
+        respuesta = await analyzer.achat_with_data(
             request.pregunta,
-            analisis_response.data[0]["datos_tecnicos"],
-            historial
+            datos_tecnicos,
+            memoria.historial(),
+            memoria.resumen,
+            request.analisis_id
         )
         
-        # Guardar en historial
-        chat_data = {
-            "analisis_id": request.analisis_id,
-            "usuario_id": current_user.id,
-            "pregunta": request.pregunta,
-            "respuesta": respuesta
-        }
-        
-        chat_response = supabase.table("chat_historial").insert(chat_data).execute()
-        
-        if not chat_response.data or len(chat_response.data) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al guardar mensaje"
-            )
-        
-        return ChatResponse(**chat_response.data[0])
+        # Guardar en historial y resumir en segundo plano los turnos antiguos
+        mensaje = await _guardar_mensaje_chat(request, current_user, respuesta, supabase)
+        background_tasks.add_task(actualizar_memoria, request.analisis_id)
+        return mensaje
         
     except Exception as e:
         raise HTTPException(
@@ -495,23 +920,157 @@ async def chat_analisis(
             detail=f"Error al procesar pregunta: {str(e)}"
         )
 
-@app.get("/api/chat/{analisis_id}", response_model=List[ChatResponse], tags=["Chat"])
+@app.post("/api/chat/stream", tags=["Chat"])
+async def chat_analisis_stream(
+    request: ChatRequest,
+    http_request: Request,
+    current_user: UsuarioResponse = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase)
+):
+    """
+    Hacer pregunta sobre un análisis recibiendo la respuesta por SSE
+    Eventos: "token" ({texto}), "fin" (mensaje guardado) y "error" ({detail}).
+    Si el cliente se desconecta se cancela la generación y no se guarda nada.
+    """
+    datos_tecnicos, memoria = await _preparar_chat(request, current_user, supabase)
+    
+    async def eventos() -> AsyncIterator[str]:
+        partes = []
+        analyzer = GatewayAnalyzer()
+        stream = analyzer.stream_chat_with_data(
+            request.pregunta, datos_tecnicos, memoria.historial(), memoria.resumen,
+            request.analisis_id
+        )
+        try:
+            async for fragmento in stream:
+                if await http_request.is_disconnected():
+                    return
+                partes.append(fragmento)
+                yield _evento_sse("token", {"texto": fragmento})
+            
+            mensaje = await _guardar_mensaje_chat(
+                request, current_user, "".join(partes), supabase
+            )
+        except HTTPException as e:
+            yield _evento_sse("error", {"detail": e.detail})
+            return
+        except Exception as e:
+            yield _evento_sse("error", {"detail": f"Error al procesar pregunta: {str(e)}"})
+            return
+        finally:
+            # Cerrar el stream cancela la llamada al modelo si sigue en curso
+            await stream.aclose()
+        
+        yield _evento_sse("fin", mensaje.dict())
+    
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(actualizar_memoria, request.analisis_id)
+    )
+
+@app.get("/api/chat/{analisis_id}", response_model=ChatHistorialPagina, tags=["Chat"])
 async def obtener_historial_chat(
     analisis_id: str,
     current_user: UsuarioResponse = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    supabase: Client = Depends(get_supabase),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
 ):
     """
-    Obtener historial de chat de un análisis
+    Obtener historial de chat de un análisis en orden cronológico
+    Para la página siguiente enviar el next_cursor de la respuesta
     """
-    response = supabase.table("chat_historial")\
+    query = supabase.table("chat_historial")\
         .select("*")\
         .eq("analisis_id", analisis_id)\
-        .eq("usuario_id", current_user.id)\
-        .order("created_at", desc=False)\
-        .execute()
+        .eq("usuario_id", current_user.id)
+    response = await ejecutar(paginar(query, cursor, limit, desc=False))
     
-    return [ChatResponse(**msg) for msg in response.data]
+    filas, next_cursor = separar_pagina(response.data, limit)
+    return ChatHistorialPagina(
+        items=[ChatResponse(**msg) for msg in filas],
+        next_cursor=next_cursor
+    )
+
+# ============================================
+# ENDPOINTS DE FLOTA
+# ============================================
+
+@app.get("/api/flota", tags=["Flota"])
+async def estado_flota(
+    current_user: UsuarioResponse = Depends(get_current_admin_user)
+):
+    """
+    Gateways vigilados, resultado de su última consulta y uso del almacén (solo admin)
+    """
+    return poller_flota.estadisticas()
+
+@app.put("/api/flota/watchlist", response_model=MessageResponse, tags=["Flota"])
+async def actualizar_watchlist(
+    request: FlotaWatchlistRequest,
+    current_user: UsuarioResponse = Depends(get_current_admin_user)
+):
+    """
+    Reemplazar la lista de gateways vigilados (solo admin)
+    Se persiste en FLEET_WATCHLIST_FILE si está configurado
+    """
+    poller_flota.configurar(request.mac_addresses)
+    await asyncio.to_thread(guardar_watchlist, poller_flota.macs)
+    
+    return MessageResponse(
+        message="Watchlist actualizada",
+        detail=None if settings.FLEET_WATCHLIST_FILE else "FLEET_WATCHLIST_FILE vacío: el cambio se pierde al reiniciar",
+        data={"gateways": len(poller_flota.macs)}
+    )
+
+@app.get("/api/flota/{mac_address}/tendencia", response_model=TendenciaKPIResponse, tags=["Flota"])
+async def tendencia_kpi(
+    mac_address: str,
+    kpi: str = Query(..., min_length=1),
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    resolucion: Optional[str] = Query(None, pattern="^(5m|1h|1d)$"),
+    current_user: UsuarioResponse = Depends(get_current_user)
+):
+    """
+    Serie de un KPI de un gateway vigilado desde el almacén local (sin consultar NCE)
+    Por defecto los últimos 7 días; sin resolución se elige la más fina disponible
+    """
+    try:
+        mac = normalizar_mac(mac_address)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    hasta = hasta or datetime.now(timezone.utc)
+    desde = desde or hasta - timedelta(days=7)
+    # Fechas sin zona se interpretan como UTC
+    hasta = hasta if hasta.tzinfo else hasta.replace(tzinfo=timezone.utc)
+    desde = desde if desde.tzinfo else desde.replace(tzinfo=timezone.utc)
+    if desde >= hasta:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'desde' debe ser anterior a 'hasta'"
+        )
+    
+    consulta = almacen_kpi.consultar(mac, kpi, desde, hasta, resolucion)
+    if consulta is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sin datos de '{kpi}' para {mac}. KPIs disponibles: {', '.join(almacen_kpi.kpis(mac)) or 'ninguno'}"
+        )
+    nivel, puntos = consulta
+    
+    return TendenciaKPIResponse(
+        mac_address=mac,
+        kpi=kpi,
+        resolucion=nivel,
+        desde=desde,
+        hasta=hasta,
+        puntos=puntos,
+        resumen=resumir(puntos)
+    )
 
 # ============================================
 # ENDPOINTS DE ESTADÍSTICAS (ADMIN)
@@ -525,41 +1084,68 @@ async def estadisticas_globales(
     """
     Obtener estadísticas globales del sistema (solo admin)
     """
-    # Total de usuarios
-    usuarios = supabase.table("usuarios").select("id, activo").execute()
-    total_usuarios = len(usuarios.data)
-    usuarios_activos = len([u for u in usuarios.data if u.get("activo", False)])
-    
-    # Total de análisis
-    analisis = supabase.table("analisis_gateways").select("id, created_at").execute()
-    total_analisis = len(analisis.data)
-    
-    # Análisis hoy
-    hoy = datetime.utcnow().date().isoformat()
-    analisis_hoy = len([a for a in analisis.data if a["created_at"].startswith(hoy)])
-    
-    # Análisis última semana
-    hace_semana = (datetime.utcnow().date() - timedelta(days=7)).isoformat()
-    analisis_semana = len([a for a in analisis.data if a["created_at"] >= hace_semana])
-    
-    # Top usuarios
-    stats_response = supabase.from_("vista_estadisticas_usuario")\
-        .select("*")\
-        .order("total_analisis", desc=True)\
-        .limit(10)\
-        .execute()
-    
-    top_usuarios = [EstadisticasUsuario(**stat) for stat in stats_response.data]
+    # Contadores agregados en la base de datos (mantenidos por trigger)
+    response = await ejecutar(supabase.rpc("estadisticas_globales", {"top_n": 10}))
+    stats = response.data
     
     return EstadisticasGlobales(
-        total_usuarios=total_usuarios,
-        usuarios_activos=usuarios_activos,
-        total_analisis=total_analisis,
-        analisis_hoy=analisis_hoy,
-        analisis_semana=analisis_semana,
-        top_usuarios=top_usuarios
+        total_usuarios=stats["total_usuarios"],
+        usuarios_activos=stats["usuarios_activos"],
+        total_analisis=stats["total_analisis"],
+        analisis_hoy=stats["analisis_hoy"],
+        analisis_semana=stats["analisis_semana"],
+        top_usuarios=[EstadisticasUsuario(**stat) for stat in stats["top_usuarios"]]
     )
 
+# ============================================
+# ENDPOINTS DE CACHÉ (ADMIN)
+# ============================================
+
+@app.get("/api/cache/estadisticas", tags=["Caché"])
+async def estadisticas_cache(
+    current_user: UsuarioResponse = Depends(get_current_admin_user)
+):
+    """
+    Contadores de aciertos, fallos y desalojos de las cachés (solo admin)
+    """
+    return {
+        "nce": cache_nce.estadisticas(),
+        "informes": cache_informes.estadisticas(),
+        "usuarios": cache_usuarios.estadisticas(),
+        "indices_chat": cache_indices.estadisticas(),
+        "analisis_en_vuelo": analisis_en_vuelo.estadisticas()
+    }
+
+# ============================================
+# ENDPOINTS DE MONITOREO (ADMIN)
+# ============================================
+
+@app.get("/api/monitoreo/passwords", tags=["Monitoreo"])
+async def monitoreo_passwords(
+    current_user: UsuarioResponse = Depends(get_current_admin_user)
+):
+    """
+    Cola y tiempos de espera del ejecutor de bcrypt (solo admin)
+    """
+    return ejecutor_hash.estadisticas()
+
+@app.get("/api/monitoreo/limites", tags=["Monitoreo"])
+async def monitoreo_limites(
+    current_user: UsuarioResponse = Depends(get_current_admin_user)
+):
+    """
+    Estado de los límites de tasa y de concurrencia hacia NCE y el LLM (solo admin)
+    """
+    return estadisticas_limites()
+
+@app.get("/metrics", tags=["Monitoreo"], include_in_schema=False)
+async def metricas():
+    """
+    Métricas en formato Prometheus (latencias de NCE, LLM, Supabase y rutas)
+    Sin autenticación para el scraper: restringir el acceso a nivel de red
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # ============================================
 # MANEJO DE ERRORES
 # ============================================
@@ -571,6 +1157,17 @@ async def http_exception_handler(request, exc):
         content=ErrorResponse(
             error=exc.detail,
             code=str(exc.status_code)
+        ).dict(),
+        headers=getattr(exc, "headers", None)
+    )
+
+@app.exception_handler(TimeoutConsultaDB)
+async def db_timeout_exception_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content=ErrorResponse(
+            error=str(exc),
+            code="504"
         ).dict()
     )
 
@@ -0,0 +1,136 @@
+# ============================================
+# MEMORIA_CHAT.PY - Memoria de conversación por análisis
+# ============================================
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+from supabase import Client
+
+from .config import settings
+from .compactacion import estimar_tokens
+from .database import get_supabase_client, ejecutar
+from .gateway_analyzer import GatewayAnalyzer
+from .paginacion import filtrar_posicion
+
+# ============================================
+# MEMORIA DE CONVERSACIÓN
+# ============================================
+# Cada análisis guarda en chat_memoria un resumen de los turnos antiguos y
+# hasta qué turno (created_at, id) llega. El prompt recibe ese resumen más los
+# últimos MAX_CHAT_HISTORY turnos textuales, por lo que su tamaño no crece con
+# la conversación. El resumen se actualiza después de cada respuesta.
+
+@dataclass
+class MemoriaChat:
+    """Resumen de la conversación anterior y turnos recientes (del más antiguo al más nuevo)"""
+    resumen: str = ""
+    turnos: List[Dict[str, Any]] = field(default_factory=list)
+
+    def historial(self) -> List[str]:
+        """Turnos recientes en el formato de líneas del prompt de chat"""
+        return lineas_turnos(self.turnos)
+
+def lineas_turnos(turnos: List[Dict[str, Any]]) -> List[str]:
+    lineas = []
+    for turno in turnos:
+        lineas.append(f"Humano: {turno['pregunta']}")
+        lineas.append(f"Asistente: {turno['respuesta']}")
+    return lineas
+
+async def _leer_resumen(analisis_id: str, supabase: Client) -> Optional[Dict[str, Any]]:
+    response = await ejecutar(
+        supabase.table("chat_memoria")
+            .select("resumen, turnos_resumidos, resumido_hasta, resumido_hasta_id")
+            .eq("analisis_id", analisis_id)
+    )
+    return response.data[0] if response.data else None
+
+def _turnos_posteriores(query: Any, memoria: Optional[Dict[str, Any]]) -> Any:
+    """Excluir los turnos que ya forman parte del resumen"""
+    if memoria and memoria.get("resumido_hasta"):
+        return filtrar_posicion(
+            query, memoria["resumido_hasta"], memoria["resumido_hasta_id"], "gt"
+        )
+    return query
+
+async def cargar_memoria(analisis_id: str, supabase: Client) -> MemoriaChat:
+    """Cargar el resumen y los últimos MAX_CHAT_HISTORY turnos de un análisis"""
+    memoria = await _leer_resumen(analisis_id, supabase)
+
+    query = supabase.table("chat_historial")\
+        .select("id, pregunta, respuesta, created_at")\
+        .eq("analisis_id", analisis_id)
+    query = _turnos_posteriores(query, memoria)\
+        .order("created_at", desc=True)\
+        .order("id", desc=True)\
+        .limit(settings.MAX_CHAT_HISTORY)
+    response = await ejecutar(query)
+
+    return MemoriaChat(
+        resumen=memoria["resumen"] if memoria else "",
+        turnos=list(reversed(response.data or []))
+    )
+
+# ============================================
+# ACTUALIZACIÓN INCREMENTAL DEL RESUMEN
+# ============================================
+
+def _turnos_a_resumir(turnos: List[Dict[str, Any]]) -> int:
+    """
+    Cantidad de turnos (desde el más antiguo) que deben pasar al resumen:
+    los que exceden MAX_CHAT_HISTORY o el presupuesto de tokens del historial
+    """
+    a_resumir = max(len(turnos) - settings.MAX_CHAT_HISTORY, 0)
+    while a_resumir < len(turnos) - 1 and estimar_tokens(
+        "\n".join(lineas_turnos(turnos[a_resumir:]))
+    ) > settings.CHAT_HISTORIAL_TOKEN_BUDGET:
+        a_resumir += 1
+    return a_resumir
+
+# Análisis con un resumen en curso (la siguiente actualización recoge lo pendiente)
+_en_curso: Set[str] = set()
+
+async def actualizar_memoria(analisis_id: str) -> None:
+    """
+    Incorporar al resumen los turnos que salieron de la ventana reciente
+    Pensada para ejecutarse en segundo plano después de guardar un mensaje
+    """
+    if analisis_id in _en_curso:
+        return
+    _en_curso.add(analisis_id)
+
+    try:
+        supabase = get_supabase_client()
+        memoria = await _leer_resumen(analisis_id, supabase)
+
+        query = supabase.table("chat_historial")\
+            .select("id, pregunta, respuesta, created_at")\
+            .eq("analisis_id", analisis_id)
+        query = _turnos_posteriores(query, memoria)\
+            .order("created_at", desc=False)\
+            .order("id", desc=False)
+        response = await ejecutar(query)
+        turnos = response.data or []
+
+        a_resumir = _turnos_a_resumir(turnos)
+        if a_resumir == 0:
+            return
+
+        antiguos = turnos[:a_resumir]
+        resumen = await GatewayAnalyzer().aresumir_conversacion(
+            memoria["resumen"] if memoria else "",
+            lineas_turnos(antiguos)
+        )
+
+        await ejecutar(supabase.table("chat_memoria").upsert({
+            "analisis_id": analisis_id,
+            "resumen": resumen,
+            "turnos_resumidos": (memoria["turnos_resumidos"] if memoria else 0) + a_resumir,
+            "resumido_hasta": antiguos[-1]["created_at"],
+            "resumido_hasta_id": antiguos[-1]["id"]
+        }))
+    except Exception as e:
+        print(f"❌ Error al actualizar memoria de chat {analisis_id}: {e}")
+    finally:
+        _en_curso.discard(analisis_id)
@@ -0,0 +1,193 @@
+# ============================================
+# METRICAS.PY - Métricas Prometheus
+# ============================================
+
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .compactacion import estimar_tokens
+
+# ============================================
+# BUCKETS
+# ============================================
+
+# NCE y Supabase: de decenas de milisegundos hasta el timeout por sección
+BUCKETS_BACKEND = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+
+# LLM y rutas HTTP: un informe puede tardar decenas de segundos
+BUCKETS_LENTOS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# ============================================
+# NCE
+# ============================================
+
+NCE_SECCION_SEGUNDOS = Histogram(
+    "smartwifi_nce_seccion_segundos",
+    "Latencia de las consultas a NCE por sección (sin incluir aciertos de caché)",
+    ["seccion", "estado"],
+    buckets=BUCKETS_BACKEND
+)
+
+NCE_CONSULTAS = Counter(
+    "smartwifi_nce_consultas_total",
+    "Consultas a NCE por sección y resultado (ok, error, timeout, cache)",
+    ["seccion", "resultado"]
+)
+
+def observar_nce(seccion: str, resultado: Dict[str, Any], desde_cache: bool = False) -> None:
+    """Registrar una consulta de sección a NCE (resultado estructurado)"""
+    if desde_cache:
+        NCE_CONSULTAS.labels(seccion, "cache").inc()
+        return
+
+    NCE_CONSULTAS.labels(seccion, resultado["estado"]).inc()
+    if resultado.get("latencia_ms") is not None:
+        NCE_SECCION_SEGUNDOS.labels(seccion, resultado["estado"]).observe(
+            resultado["latencia_ms"] / 1000
+        )
+
+# ============================================
+# LLM
+# ============================================
+
+LLM_SEGUNDOS = Histogram(
+    "smartwifi_llm_segundos",
+    "Latencia de las llamadas al LLM por operación (informe, chat, resumen)",
+    ["operacion", "modo"],
+    buckets=BUCKETS_LENTOS
+)
+
+LLM_TOKENS = Counter(
+    "smartwifi_llm_tokens_total",
+    "Tokens enviados (prompt) y generados (completion) por operación",
+    ["operacion", "tipo"]
+)
+
+LLM_ERRORES = Counter(
+    "smartwifi_llm_errores_total",
+    "Llamadas al LLM que terminaron en excepción",
+    ["operacion"]
+)
+
+def _tokens_reportados(mensaje: Any) -> Optional[Tuple[int, int]]:
+    """Tokens (prompt, completion) informados por el modelo, si los incluye"""
+    uso = getattr(mensaje, "usage_metadata", None)
+    if uso:
+        return uso.get("input_tokens", 0), uso.get("output_tokens", 0)
+    uso = (getattr(mensaje, "response_metadata", None) or {}).get("usage_metadata")
+    if uso:
+        return uso.get("prompt_token_count", 0), uso.get("candidates_token_count", 0)
+    return None
+
+def observar_llm(
+    operacion: str,
+    modo: str,
+    segundos: float,
+    entradas: Dict[str, Any],
+    respuesta: str,
+    mensaje: Any = None
+) -> Tuple[int, int]:
+    """
+    Registrar una llamada al LLM
+    Si el modelo no informa el uso de tokens se estima a partir del texto
+    Retorna los tokens (prompt, completion) registrados
+    """
+    LLM_SEGUNDOS.labels(operacion, modo).observe(segundos)
+
+    tokens = _tokens_reportados(mensaje) if mensaje is not None else None
+    if tokens is None:
+        tokens = (
+            estimar_tokens("".join(str(v) for v in entradas.values())),
+            estimar_tokens(respuesta)
+        )
+    LLM_TOKENS.labels(operacion, "prompt").inc(tokens[0])
+    LLM_TOKENS.labels(operacion, "completion").inc(tokens[1])
+    return tokens
+
+# ============================================
+# SUPABASE
+# ============================================
+
+DB_CONSULTA_SEGUNDOS = Histogram(
+    "smartwifi_db_consulta_segundos",
+    "Latencia de las consultas a Supabase por tabla y método HTTP",
+    ["tabla", "metodo"],
+    buckets=BUCKETS_BACKEND
+)
+
+DB_ERRORES = Counter(
+    "smartwifi_db_errores_total",
+    "Consultas a Supabase fallidas por tabla (timeout o error)",
+    ["tabla", "tipo"]
+)
+
+def etiquetas_consulta(query: Any) -> Tuple[str, str]:
+    """
+    Tabla (o rpc:<función>) y método HTTP de un query builder de postgrest
+    Las versiones recientes de postgrest agrupan path y método en query.request
+    """
+    config = getattr(query, "request", query)
+    ruta = str(getattr(config, "path", "")).rstrip("/")
+    tabla = ruta.rsplit("/", 1)[-1] or "desconocida"
+    if "/rpc/" in ruta:
+        tabla = f"rpc:{tabla}"
+    metodo = getattr(config, "http_method", "")
+    return tabla, str(getattr(metodo, "value", metodo)) or "desconocido"
+
+# ============================================
+# HTTP
+# ============================================
+
+HTTP_SOLICITUD_SEGUNDOS = Histogram(
+    "smartwifi_http_solicitud_segundos",
+    "Duración de las solicitudes por ruta (en streams, hasta enviar los encabezados)",
+    ["metodo", "ruta", "status"],
+    buckets=BUCKETS_LENTOS
+)
+
+# ============================================
+# ANÁLISIS
+# ============================================
+
+ANALISIS_SINGLEFLIGHT = Counter(
+    "smartwifi_analisis_singleflight_total",
+    "Análisis de gateway ejecutados o unidos a uno idéntico en curso (ejecutado, compartido)",
+    ["resultado"]
+)
+
+# ============================================
+# FLOTA
+# ============================================
+
+FLOTA_CONSULTAS = Counter(
+    "smartwifi_flota_consultas_total",
+    "Consultas de PM del poller de la flota por resultado (ok, error, timeout)",
+    ["resultado"]
+)
+
+FLOTA_CICLO_SEGUNDOS = Histogram(
+    "smartwifi_flota_ciclo_segundos",
+    "Duración de cada ciclo del poller de la flota (todos los gateways vigilados)",
+    buckets=BUCKETS_LENTOS
+)
+
+# ============================================
+# ESTADO INTERNO (se leen al exportar)
+# ============================================
+
+ANALISIS_PENDIENTES = Gauge(
+    "smartwifi_analisis_pendientes",
+    "Análisis en cola esperando un worker"
+)
+
+LLAMADAS_EN_CURSO = Gauge(
+    "smartwifi_llamadas_en_curso",
+    "Llamadas en curso hacia cada backend",
+    ["backend"]
+)
+
+SERIES_KPI = Gauge(
+    "smartwifi_series_kpi",
+    "Series de KPIs guardadas en el almacén local de la flota"
+)
@@ -78,24 +78,43 @@ class TokenData(BaseModel):
 # MODELOS DE ANÁLISIS DE GATEWAY
 # ============================================
 
+def normalizar_mac(v: str) -> str:
+    """Validar una MAC y retornarla en formato AA:BB:CC:DD:EE:FF"""
+    # Permitir formato con o sin separadores
+    import re
+    v = v.replace(':', '').replace('-', '').replace('.', '').upper()
+    if not re.match(r'^[0-9A-F]{12}$', v):
+        raise ValueError('MAC address inválida')
+    # Retornar formato con dos puntos
+    return ':'.join([v[i:i+2] for i in range(0, 12, 2)])
+
 class AnalisisGatewayRequest(BaseModel):
     mac_address: str = Field(..., min_length=12, max_length=17)
     modo: str = Field(default="single", pattern="^(single|bulk)$")
     incluir_eventos: bool = True
+    forzar_actualizacion: bool = False
     
     @validator('mac_address')
     def validate_mac(cls, v):
-        # Permitir formato con o sin separadores
-        import re
-        v = v.replace(':', '').replace('-', '').replace('.', '').upper()
-        if not re.match(r'^[0-9A-F]{12}$', v):
-            raise ValueError('MAC address inválida')
-        # Retornar formato con dos puntos
-        return ':'.join([v[i:i+2] for i in range(0, 12, 2)])
+        return normalizar_mac(v)
 
 class AnalisisBulkRequest(BaseModel):
     mac_addresses: List[str] = Field(..., min_items=1, max_items=50)
     incluir_eventos: bool = True
+    forzar_actualizacion: bool = False
+    
+    @validator('mac_addresses')
+    def validate_macs(cls, v):
+        # Normalizar y eliminar duplicados conservando el orden
+        return list(dict.fromkeys(normalizar_mac(mac) for mac in v))
+
+class AnalisisBulkResultado(BaseModel):
+    mac_address: str
+    estado: EstadoAnalisis
+    analisis_id: Optional[str] = None
+    error: Optional[str] = None
+    # Resultado tomado de un análisis idéntico que ya estaba en curso
+    compartido: Optional[bool] = None
 
 class AnalisisGatewayResponse(BaseModel):
     id: str
@@ -103,15 +122,31 @@ class AnalisisGatewayResponse(BaseModel):
     mac_address: str
     estado: EstadoAnalisis
     informe_ia: Optional[str] = None
+    informe_desde_cache: Optional[bool] = None
     created_at: datetime
     
     class Config:
         from_attributes = True
 
+class AnalisisGatewayPagina(BaseModel):
+    items: List[AnalisisGatewayResponse]
+    next_cursor: Optional[str] = None
+
 class AnalisisCompletoResponse(AnalisisGatewayResponse):
     datos_tecnicos: Dict[str, Any]
     usuario_email: Optional[str] = None
 
+class AnalisisEstadoResponse(BaseModel):
+    id: str
+    mac_address: str
+    estado: EstadoAnalisis
+    error_detalle: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 # ============================================
 # MODELOS DE CHAT
 # ============================================
@@ -133,6 +168,10 @@ class ChatHistorialResponse(BaseModel):
     analisis_id: str
     mensajes: List[ChatResponse]
 
+class ChatHistorialPagina(BaseModel):
+    items: List[ChatResponse]
+    next_cursor: Optional[str] = None
+
 # ============================================
 # MODELOS DE RESPUESTA GENÉRICA
 # ============================================
@@ -174,6 +213,40 @@ class EstadisticasGlobales(BaseModel):
     analisis_semana: int
     top_usuarios: List[EstadisticasUsuario]
 
+# ============================================
+# MODELOS DE FLOTA
+# ============================================
+
+class FlotaWatchlistRequest(BaseModel):
+    mac_addresses: List[str] = Field(..., max_items=5000)
+    
+    @validator('mac_addresses')
+    def validate_macs(cls, v):
+        return list(dict.fromkeys(normalizar_mac(mac) for mac in v))
+
+class PuntoKPI(BaseModel):
+    t: datetime
+    muestras: int
+    promedio: float
+    minimo: float
+    maximo: float
+
+class ResumenKPI(BaseModel):
+    muestras: int
+    promedio: Optional[float] = None
+    minimo: Optional[float] = None
+    maximo: Optional[float] = None
+    pendiente_por_dia: Optional[float] = None
+
+class TendenciaKPIResponse(BaseModel):
+    mac_address: str
+    kpi: str
+    resolucion: str
+    desde: datetime
+    hasta: datetime
+    puntos: List[PuntoKPI]
+    resumen: ResumenKPI
+
 # ============================================
 # MODELOS DE PROMPT
 # ============================================
@@ -0,0 +1,72 @@
+# ============================================
+# PAGINACION.PY - Paginación por cursor (keyset)
+# ============================================
+
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+# ============================================
+# CURSORES
+# ============================================
+# El cursor identifica la última fila entregada por (created_at, id), de modo
+# que la página siguiente es un rango del índice compuesto y cuesta lo mismo
+# sin importar cuán profunda sea.
+
+def codificar_cursor(fila: Dict[str, Any]) -> str:
+    """Cursor opaco a partir de la última fila de una página"""
+    contenido = json.dumps({"c": str(fila["created_at"]), "i": str(fila["id"])})
+    return base64.urlsafe_b64encode(contenido.encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> Tuple[str, str]:
+    """Retornar (created_at, id) de un cursor o responder 400 si no es válido"""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        contenido = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        # Validar ambos valores: se interpolan en el filtro de PostgREST
+        created_at = datetime.fromisoformat(contenido["c"]).isoformat()
+        return created_at, str(uuid.UUID(contenido["i"]))
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+
+# ============================================
+# CONSULTAS
+# ============================================
+
+def filtrar_posicion(query: Any, created_at: str, fila_id: str, op: str) -> Any:
+    """
+    Filtrar filas anteriores ("lt") o posteriores ("gt") a la posición
+    (created_at, id), desempatando por id las filas con la misma fecha
+    """
+    return query.or_(
+        f'created_at.{op}."{created_at}",'
+        f'and(created_at.eq."{created_at}",id.{op}.{fila_id})'
+    )
+
+def paginar(query: Any, cursor: Optional[str], limit: int, desc: bool) -> Any:
+    """
+    Aplicar orden (created_at, id), filtro de cursor y límite a un query builder
+    Se pide una fila extra para saber si existe una página siguiente
+    """
+    if cursor:
+        created_at, fila_id = decodificar_cursor(cursor)
+        query = filtrar_posicion(query, created_at, fila_id, "lt" if desc else "gt")
+
+    return query\
+        .order("created_at", desc=desc)\
+        .order("id", desc=desc)\
+        .limit(limit + 1)
+
+def separar_pagina(filas: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Retornar (filas de la página, cursor siguiente o None si es la última)"""
+    if len(filas) <= limit:
+        return filas, None
+    filas = filas[:limit]
+    return filas, codificar_cursor(filas[-1])
@@ -0,0 +1,310 @@
+# ============================================
+# RECUPERACION.PY - Selección de datos relevantes para el chat
+# ============================================
+
+import json
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .cache import TTLCache
+from .compactacion import (
+    PRIORIDAD_SECCIONES,
+    compactar_valor,
+    estimar_tokens,
+    mac_sin_separadores,
+    resumen_lista
+)
+from .datos_tecnicos import (
+    CLAVES_METADATA,
+    ESTADO_OK,
+    SECCIONES_POR_BANDA,
+    TITULOS_SECCIONES,
+    migrar_datos_tecnicos
+)
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONSTANTES
+# ============================================
+
+# Términos con que los agentes suelen referirse a cada sección; se agregan al
+# texto indexado para que una pregunta en lenguaje natural encuentre la sección
+PALABRAS_CLAVE_SECCIONES = {
+    "basic_info": "informacion basica gateway equipo modelo firmware version estado optica fibra potencia senal rx tx dbm uptime encendido",
+    "connected_devices": "dispositivos conectados clientes equipos usuarios celulares telefonos computadores hosts senal rssi velocidad",
+    "performance_data": "rendimiento desempeno cpu memoria trafico velocidad throughput latencia perdida paquetes",
+    "wifi_band_info": "configuracion wifi red ssid canal ancho banda potencia transmision radio",
+    "guest_wifi_info": "wifi invitados red invitado guest ssid",
+    "downstream_ports": "puertos lan ethernet cable fisicos enlace link",
+    "neighboring_ssids": "redes vecinas interferencia canal ocupacion saturacion ssid vecinos",
+    "session_info": "sesiones activas conexiones pppoe wan ip",
+}
+
+STOPWORDS = set("""
+a al algo como con cual cuales cuantos cuantas de del el en es esta estan este hay la las lo los me mi
+mis muy no o para pero por que se si sin son su sus un una uno y ya the of is are on in how many what
+""".split())
+
+# Parámetros de BM25 (valores habituales de Okapi BM25)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Fragmentos con menos de esta fracción del mejor puntaje no se incluyen
+PUNTAJE_RELATIVO_MINIMO = 0.3
+
+# Caché de índices por análisis (los datos técnicos de un análisis no cambian)
+cache_indices = TTLCache(settings.AI_CHAT_INDEX_CACHE_MAX_ENTRIES)
+
+# ============================================
+# TOKENIZACIÓN
+# ============================================
+
+_CAMEL_CASE = re.compile(r"([a-z])([A-Z])")
+_DECIMAL = re.compile(r"(\d)[.,](\d)")
+_FRECUENCIA = re.compile(r"(\d+)\s*ghz\b")
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+def tokenizar(texto: str) -> List[str]:
+    """
+    Normalizar y separar un texto en términos
+    "2.4 GHz", "2,4GHz" y "2.4G" se normalizan a "24g"; "radioType" a "radio type"
+    """
+    texto = _CAMEL_CASE.sub(r"\1 \2", texto)
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = _FRECUENCIA.sub(r"\1g", _DECIMAL.sub(r"\1\2", texto))
+    return [t for t in _NO_ALFANUMERICO.split(texto) if t and t not in STOPWORDS]
+
+# ============================================
+# FRAGMENTOS
+# ============================================
+
+@dataclass
+class Fragmento:
+    """Parte indexable de una sección: resumen de la sección o un registro"""
+    seccion: str
+    banda: Optional[str]
+    texto: str
+    orden: int
+    tokens: int = 0
+    terminos: Counter = field(default_factory=Counter)
+
+def _es_lista_registros(valor: Any) -> bool:
+    return isinstance(valor, list) and len(valor) > 1 and all(isinstance(e, dict) for e in valor)
+
+def _listas_de_registros(datos: Any) -> Tuple[Any, List[Tuple[str, List[dict]]]]:
+    """
+    Separar las listas de registros (hasta un nivel de anidación) del resto
+    Retorna (datos sin esas listas, [(ruta, registros)])
+    """
+    if _es_lista_registros(datos):
+        return None, [("", datos)]
+    if not isinstance(datos, dict):
+        return datos, []
+
+    resto, listas = {}, []
+    for clave, valor in datos.items():
+        if _es_lista_registros(valor):
+            listas.append((clave, valor))
+        elif isinstance(valor, dict):
+            sub_resto = {}
+            for sub_clave, sub_valor in valor.items():
+                if _es_lista_registros(sub_valor):
+                    listas.append((f"{clave}.{sub_clave}", sub_valor))
+                else:
+                    sub_resto[sub_clave] = sub_valor
+            if sub_resto:
+                resto[clave] = sub_resto
+        else:
+            resto[clave] = valor
+    return resto, listas
+
+def _fragmentos_resultado(
+    seccion: str,
+    banda: Optional[str],
+    resultado: Any,
+    mac: str,
+    orden: int
+) -> List[Fragmento]:
+    if not isinstance(resultado, dict) or resultado.get("estado") != ESTADO_OK:
+        error = resultado.get("error") if isinstance(resultado, dict) else resultado
+        return [Fragmento(seccion, banda, f"[i] No disponible: {error}", orden)]
+
+    datos = compactar_valor(resultado.get("datos"), max_items=10 ** 6, mac=mac)
+    resto, listas = _listas_de_registros(datos)
+
+    # Resumen de la sección: campos sueltos + totales y distribución de cada lista
+    resumen = {"datos": resto} if resto not in (None, {}, []) else {}
+    for ruta, registros in listas:
+        resumen[ruta or "registros"] = {
+            "total": len(registros),
+            "resumen": resumen_lista(registros)
+        }
+    fragmentos = [Fragmento(seccion, banda, json.dumps(resumen, ensure_ascii=False), orden)]
+
+    for ruta, registros in listas:
+        for registro in registros:
+            texto = json.dumps(registro, ensure_ascii=False)
+            fragmentos.append(Fragmento(
+                seccion, banda, f"{ruta}: {texto}" if ruta else texto, orden
+            ))
+    return fragmentos
+
+def fragmentar_datos_tecnicos(datos_tecnicos: Dict[str, Any]) -> List[Fragmento]:
+    """Dividir los datos técnicos en fragmentos por sección, banda y registro"""
+    datos = migrar_datos_tecnicos(datos_tecnicos)
+    mac = mac_sin_separadores(datos.get("mac_address", ""))
+
+    secciones = [s for s in PRIORIDAD_SECCIONES if s in datos] + [
+        s for s in datos if s not in PRIORIDAD_SECCIONES and s not in CLAVES_METADATA
+    ]
+
+    fragmentos = []
+    for orden, seccion in enumerate(secciones):
+        valor = datos[seccion]
+        if isinstance(valor, str):
+            fragmentos.append(Fragmento(seccion, None, valor, orden))
+        elif seccion in SECCIONES_POR_BANDA and isinstance(valor, dict):
+            for banda, resultado in valor.items():
+                fragmentos.extend(_fragmentos_resultado(seccion, banda, resultado, mac, orden))
+        else:
+            fragmentos.extend(_fragmentos_resultado(seccion, None, valor, mac, orden))
+
+    for fragmento in fragmentos:
+        contexto = " ".join([
+            fragmento.seccion,
+            TITULOS_SECCIONES.get(fragmento.seccion, ""),
+            PALABRAS_CLAVE_SECCIONES.get(fragmento.seccion, ""),
+            f"banda {fragmento.banda}" if fragmento.banda else ""
+        ])
+        fragmento.terminos = Counter(tokenizar(f"{contexto} {fragmento.texto}"))
+        fragmento.tokens = estimar_tokens(fragmento.texto)
+
+    return fragmentos
+
+# ============================================
+# ÍNDICE BM25
+# ============================================
+
+class IndiceBM25:
+    """Índice Okapi BM25 en memoria sobre los fragmentos de un análisis"""
+
+    def __init__(self, fragmentos: List[Fragmento]):
+        self.fragmentos = fragmentos
+        self.longitudes = [sum(f.terminos.values()) for f in fragmentos]
+        self.longitud_promedio = (sum(self.longitudes) / len(fragmentos)) if fragmentos else 0.0
+        frecuencia_documentos = Counter(t for f in fragmentos for t in f.terminos)
+        total = len(fragmentos)
+        self.idf = {
+            termino: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for termino, df in frecuencia_documentos.items()
+        }
+
+    def puntuar(self, consulta: List[str]) -> List[float]:
+        """Puntaje BM25 de cada fragmento para los términos de la consulta"""
+        terminos = [t for t in set(consulta) if t in self.idf]
+        puntajes = []
+        for fragmento, longitud in zip(self.fragmentos, self.longitudes):
+            puntaje = 0.0
+            normalizacion = BM25_K1 * (1 - BM25_B + BM25_B * longitud / self.longitud_promedio)
+            for termino in terminos:
+                tf = fragmento.terminos.get(termino, 0)
+                if tf:
+                    puntaje += self.idf[termino] * tf * (BM25_K1 + 1) / (tf + normalizacion)
+            puntajes.append(puntaje)
+        return puntajes
+
+def obtener_indice(datos_tecnicos: Dict[str, Any], clave: Optional[str] = None) -> IndiceBM25:
+    """
+    Índice del análisis, construido una sola vez por clave (id del análisis)
+    Un índice sin fragmentos no se guarda: los datos pueden llegar después
+    """
+    indice = cache_indices.get(clave) if clave else None
+    if indice is None:
+        indice = IndiceBM25(fragmentar_datos_tecnicos(datos_tecnicos))
+        if clave and indice.fragmentos:
+            cache_indices.set(clave, indice, settings.AI_CHAT_INDEX_CACHE_TTL)
+    return indice
+
+# ============================================
+# SELECCIÓN DE CONTEXTO
+# ============================================
+
+def _renderizar_fragmentos(fragmentos: List[Fragmento]) -> str:
+    bloques = []
+    actual = None
+    for fragmento in fragmentos:
+        grupo = (fragmento.seccion, fragmento.banda)
+        if grupo != actual:
+            titulo = TITULOS_SECCIONES.get(fragmento.seccion, fragmento.seccion.upper())
+            bloques.append(f"\n===== {titulo} =====" + (f"\n--- Banda {fragmento.banda} ---" if fragmento.banda else ""))
+            actual = grupo
+        bloques.append(fragmento.texto)
+    return "\n".join(bloques).strip()
+
+def seleccionar_contexto(
+    indice: IndiceBM25,
+    consulta: str,
+    presupuesto_tokens: int
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Elegir los fragmentos más relevantes para la consulta dentro del presupuesto
+    Retorna None si ningún fragmento coincide (la pregunta es general)
+    """
+    puntajes = indice.puntuar(tokenizar(consulta))
+    mejor = max(puntajes, default=0.0)
+    if mejor <= 0:
+        return None
+
+    candidatos = sorted(
+        (i for i, p in enumerate(puntajes) if p >= mejor * PUNTAJE_RELATIVO_MINIMO),
+        key=lambda i: puntajes[i],
+        reverse=True
+    )
+    posiciones, usados = [], 0
+    for i in candidatos:
+        fragmento = indice.fragmentos[i]
+        if usados + fragmento.tokens > presupuesto_tokens:
+            continue
+        posiciones.append(i)
+        usados += fragmento.tokens
+
+    if not posiciones:
+        return None
+
+    # Renderizar en el orden original: resumen de cada sección antes que sus registros
+    elegidos = [indice.fragmentos[i] for i in sorted(posiciones)]
+    incluidas = list(dict.fromkeys(f.seccion for f in elegidos))
+    omitidas = list(dict.fromkeys(
+        f.seccion for f in indice.fragmentos if f.seccion not in incluidas
+    ))
+
+    texto = _renderizar_fragmentos(elegidos)
+    if omitidas:
+        texto += (
+            "\n\n[Solo se incluyen los datos relevantes a la pregunta. "
+            f"Secciones no incluidas: {', '.join(omitidas)}]"
+        )
+
+    estadisticas = {
+        "fragmentos_totales": len(indice.fragmentos),
+        "fragmentos_elegidos": len(elegidos),
+        "tokens": estimar_tokens(texto),
+        "presupuesto_tokens": presupuesto_tokens,
+        "secciones": incluidas
+    }
+    logger.info(
+        "Recuperación para chat: %d/%d fragmentos, %d tokens (secciones: %s)",
+        len(elegidos),
+        len(indice.fragmentos),
+        estadisticas["tokens"],
+        ", ".join(incluidas)
+    )
+    return texto, estadisticas
@@ -0,0 +1,127 @@
+# ============================================
+# RESILIENCIA.PY - Reintentos y circuit breaker
+# ============================================
+
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import settings
+
+# ============================================
+# BACKOFF EXPONENCIAL CON JITTER
+# ============================================
+
+def espera_reintento(intento: int, base: float, maximo: float) -> float:
+    """
+    Segundos a esperar antes del reintento número `intento` (desde 0)
+    "Full jitter": aleatorio entre 0 y base * 2^intento, para que los
+    clientes que fallaron juntos no reintenten todos al mismo tiempo
+    """
+    return random.uniform(0, min(maximo, base * (2 ** intento)))
+
+# ============================================
+# CIRCUIT BREAKER
+# ============================================
+
+class CircuitBreaker:
+    """
+    Corta las llamadas a un backend que está fallando
+
+    - cerrado: las llamadas pasan; tras `umbral_fallos` fallos consecutivos se abre
+    - abierto: las llamadas fallan de inmediato durante `segundos_reapertura`
+    - semiabierto: se deja pasar una sola llamada de prueba; si funciona se
+      cierra y si falla vuelve a abrirse
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, nombre: str, umbral_fallos: int, segundos_reapertura: float):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.segundos_reapertura = segundos_reapertura
+        self._lock = threading.Lock()
+        self._estado = self.CERRADO
+        self._fallos_consecutivos = 0
+        self._abierto_desde: Optional[float] = None
+        self._prueba_en_curso = False
+        self.rechazadas = 0
+        self.aperturas = 0
+
+    def permitir(self) -> bool:
+        """Indicar si una llamada puede realizarse ahora"""
+        with self._lock:
+            if self._estado == self.ABIERTO:
+                if time.monotonic() - self._abierto_desde < self.segundos_reapertura:
+                    self.rechazadas += 1
+                    return False
+                self._estado = self.SEMIABIERTO
+
+            if self._estado == self.SEMIABIERTO:
+                if self._prueba_en_curso:
+                    self.rechazadas += 1
+                    return False
+                self._prueba_en_curso = True
+
+            return True
+
+    def devolver(self) -> None:
+        """Devolver un permiso que no llegó a usarse (sin contar éxito ni fallo)"""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def registrar(self, exito: bool) -> None:
+        """Registrar el resultado de una llamada permitida"""
+        with self._lock:
+            self._prueba_en_curso = False
+            if exito:
+                self._estado = self.CERRADO
+                self._fallos_consecutivos = 0
+                return
+
+            self._fallos_consecutivos += 1
+            if self._estado == self.SEMIABIERTO or self._fallos_consecutivos >= self.umbral_fallos:
+                if self._estado != self.ABIERTO:
+                    self.aperturas += 1
+                self._estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            estado = self._estado
+            if estado == self.ABIERTO and time.monotonic() - self._abierto_desde >= self.segundos_reapertura:
+                estado = self.SEMIABIERTO
+            return {
+                "estado": estado,
+                "fallos_consecutivos": self._fallos_consecutivos,
+                "aperturas": self.aperturas,
+                "rechazadas": self.rechazadas
+            }
+
+# ============================================
+# CIRCUITOS DE NCE
+# ============================================
+
+_circuitos: Dict[str, CircuitBreaker] = {}
+_lock_circuitos = threading.Lock()
+
+def obtener_circuito(nombre: str) -> CircuitBreaker:
+    """Circuito compartido por todo el proceso para una familia de endpoints"""
+    with _lock_circuitos:
+        circuito = _circuitos.get(nombre)
+        if circuito is None:
+            circuito = _circuitos[nombre] = CircuitBreaker(
+                nombre,
+                settings.NCE_CIRCUIT_FAILURE_THRESHOLD,
+                settings.NCE_CIRCUIT_RESET_SECONDS
+            )
+        return circuito
+
+def estado_circuitos() -> Dict[str, Dict[str, Any]]:
+    """Estado de cada circuito creado hasta ahora"""
+    with _lock_circuitos:
+        circuitos = dict(_circuitos)
+    return {nombre: c.estadisticas() for nombre, c in circuitos.items()}
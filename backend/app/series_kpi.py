@@ -0,0 +1,483 @@
+# ============================================
+# SERIES_KPI.PY - Almacén compacto de series de tiempo de KPIs
+# ============================================
+
+import base64
+import bisect
+import gzip
+import json
+import math
+import os
+import sys
+import threading
+from array import array
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# ============================================
+# NIVELES DE RESOLUCIÓN
+# ============================================
+# Cada muestra de PM (una cada 5 minutos) se guarda en el nivel "5m" y se
+# agrega en "1h" y "1d". Cada nivel guarda por intervalo la cantidad de
+# muestras, la suma, el mínimo y el máximo, en arrays tipados ordenados por
+# intervalo (columnas de 4 bytes por valor, sin un objeto Python por punto).
+# Los niveles gruesos se recalculan desde el nivel anterior, así que volver a
+# registrar una muestra ya vista (las consultas de PM se solapan) no la cuenta
+# dos veces.
+
+NIVEL_5M = "5m"
+NIVEL_1H = "1h"
+NIVEL_1D = "1d"
+
+# Nivel -> segundos por intervalo, de fino a grueso
+RESOLUCIONES = {NIVEL_5M: 300, NIVEL_1H: 3600, NIVEL_1D: 86400}
+
+# Puntos máximos que entrega una consulta con resolución automática
+MAX_PUNTOS_AUTO = 1000
+
+class Nivel:
+    """Intervalos de una resolución para un KPI, en columnas ordenadas"""
+
+    __slots__ = ("resolucion", "capacidad", "intervalos", "cuentas", "sumas", "minimos", "maximos")
+
+    def __init__(self, resolucion: int, capacidad: int):
+        self.resolucion = resolucion
+        self.capacidad = capacidad
+        self.intervalos = array("i")   # instante // resolucion
+        self.cuentas = array("H")
+        self.sumas = array("f")
+        self.minimos = array("f")
+        self.maximos = array("f")
+
+    def __len__(self) -> int:
+        return len(self.intervalos)
+
+    def _columnas(self) -> Tuple[array, ...]:
+        return self.intervalos, self.cuentas, self.sumas, self.minimos, self.maximos
+
+    def fijar(self, intervalo: int, cuenta: int, suma: float, minimo: float, maximo: float) -> None:
+        """Escribir (o reemplazar) el agregado de un intervalo"""
+        i = bisect.bisect_left(self.intervalos, intervalo)
+        if i < len(self.intervalos) and self.intervalos[i] == intervalo:
+            self.cuentas[i] = min(cuenta, 0xFFFF)
+            self.sumas[i], self.minimos[i], self.maximos[i] = suma, minimo, maximo
+            return
+        for columna, valor in zip(self._columnas(), (intervalo, min(cuenta, 0xFFFF), suma, minimo, maximo)):
+            columna.insert(i, valor)
+        self._recortar()
+
+    def _recortar(self) -> None:
+        """Descartar lo que excede la retención (por bloques, para no mover los arrays en cada muestra)"""
+        sobrante = len(self.intervalos) - self.capacidad
+        if sobrante > max(self.capacidad // 10, 1):
+            for columna in self._columnas():
+                del columna[:sobrante]
+
+    def rango(self, desde: int, hasta: int) -> Tuple[int, int]:
+        """Índices de los intervalos en [desde, hasta)"""
+        return (
+            bisect.bisect_left(self.intervalos, desde),
+            bisect.bisect_left(self.intervalos, hasta)
+        )
+
+    def agregar(self, desde: int, hasta: int) -> Optional[Tuple[int, float, float, float]]:
+        """(cuenta, suma, mínimo, máximo) de los intervalos en [desde, hasta), o None si no hay"""
+        i, j = self.rango(desde, hasta)
+        if i == j:
+            return None
+        return (
+            sum(self.cuentas[i:j]),
+            sum(self.sumas[i:j]),
+            min(self.minimos[i:j]),
+            max(self.maximos[i:j])
+        )
+
+    def primero(self) -> Optional[int]:
+        """Instante (epoch) del intervalo más antiguo guardado"""
+        return self.intervalos[0] * self.resolucion if self.intervalos else None
+
+    def serializar(self) -> Dict[str, str]:
+        return {
+            nombre: base64.b64encode(columna.tobytes()).decode("ascii")
+            for nombre, columna in zip(("intervalos", "cuentas", "sumas", "minimos", "maximos"), self._columnas())
+        }
+
+    def cargar(self, datos: Dict[str, str], invertir_bytes: bool) -> None:
+        for nombre, columna in zip(("intervalos", "cuentas", "sumas", "minimos", "maximos"), self._columnas()):
+            del columna[:]
+            columna.frombytes(base64.b64decode(datos[nombre]))
+            if invertir_bytes:
+                columna.byteswap()
+        self._recortar()
+
+class SerieKPI:
+    """Un KPI de un gateway en los tres niveles"""
+
+    __slots__ = ("niveles",)
+
+    def __init__(self, capacidades: Dict[str, int]):
+        self.niveles = {
+            nombre: Nivel(resolucion, capacidades[nombre])
+            for nombre, resolucion in RESOLUCIONES.items()
+        }
+
+    def registrar(self, muestras: Dict[int, float]) -> int:
+        """
+        Registrar muestras {epoch: valor} y recalcular las horas y días afectados
+        Retorna cuántas muestras se guardaron (las anteriores a la retención de 5m se ignoran)
+        """
+        fino = self.niveles[NIVEL_5M]
+        hora = self.niveles[NIVEL_1H]
+        dia = self.niveles[NIVEL_1D]
+        limite = None
+        if len(fino) >= fino.capacidad:
+            limite = fino.intervalos[-1] - fino.capacidad
+
+        # En orden, agregando cada hora (y día) al pasar a la siguiente: si una
+        # sola llamada excede la retención, el recorte solo alcanza a
+        # intervalos ya agregados
+        por_dia = dia.resolucion // hora.resolucion
+        hora_actual = None
+        guardadas = 0
+        for instante, valor in sorted(muestras.items()):
+            intervalo = instante // fino.resolucion
+            if limite is not None and intervalo <= limite:
+                continue
+            h = instante // hora.resolucion
+            if hora_actual is not None and h != hora_actual:
+                self._agregar_hora(hora_actual)
+                if h // por_dia != hora_actual // por_dia:
+                    self._agregar_dia(hora_actual // por_dia)
+            hora_actual = h
+            fino.fijar(intervalo, 1, valor, valor, valor)
+            guardadas += 1
+
+        if hora_actual is not None:
+            self._agregar_hora(hora_actual)
+            self._agregar_dia(hora_actual // por_dia)
+        return guardadas
+
+    def _agregar_hora(self, h: int) -> None:
+        fino, hora = self.niveles[NIVEL_5M], self.niveles[NIVEL_1H]
+        por_hora = hora.resolucion // fino.resolucion
+        hora.fijar(h, *fino.agregar(h * por_hora, (h + 1) * por_hora))
+
+    def _agregar_dia(self, d: int) -> None:
+        hora, dia = self.niveles[NIVEL_1H], self.niveles[NIVEL_1D]
+        por_dia = dia.resolucion // hora.resolucion
+        dia.fijar(d, *hora.agregar(d * por_dia, (d + 1) * por_dia))
+
+# ============================================
+# ALMACÉN
+# ============================================
+
+def elegir_nivel(serie: SerieKPI, desde: int, hasta: int) -> str:
+    """
+    Nivel más fino que todavía cubre `desde` y no excede MAX_PUNTOS_AUTO
+    (un nivel que aún no llenó su retención cubre todo lo registrado)
+    """
+    for nombre, nivel in serie.niveles.items():
+        primero = nivel.primero()
+        cubre = primero is not None and (primero <= desde or len(nivel) < nivel.capacidad)
+        if cubre and (hasta - desde) / nivel.resolucion <= MAX_PUNTOS_AUTO:
+            return nombre
+    return NIVEL_1D
+
+def resumir(puntos: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Promedio, extremos y pendiente (unidades por día, mínimos cuadrados sobre
+    los promedios de cada intervalo) de una serie consultada
+    """
+    if not puntos:
+        return {"muestras": 0, "promedio": None, "minimo": None, "maximo": None, "pendiente_por_dia": None}
+
+    muestras = sum(p["muestras"] for p in puntos)
+    resumen = {
+        "muestras": muestras,
+        "promedio": round(sum(p["promedio"] * p["muestras"] for p in puntos) / muestras, 4),
+        "minimo": min(p["minimo"] for p in puntos),
+        "maximo": max(p["maximo"] for p in puntos),
+        "pendiente_por_dia": None
+    }
+    if len(puntos) >= 2:
+        xs = [p["t"].timestamp() / 86400 for p in puntos]
+        ys = [p["promedio"] for p in puntos]
+        media_x, media_y = sum(xs) / len(xs), sum(ys) / len(ys)
+        varianza = sum((x - media_x) ** 2 for x in xs)
+        if varianza > 0:
+            covarianza = sum((x - media_x) * (y - media_y) for x, y in zip(xs, ys))
+            resumen["pendiente_por_dia"] = round(covarianza / varianza, 4)
+    return resumen
+
+class AlmacenKPI:
+    """
+    Series por (MAC, KPI) en memoria, con instantánea opcional a disco
+    Seguro entre hilos: el poller escribe y los endpoints consultan
+    """
+
+    VERSION = 1
+
+    def __init__(self, retencion_dias: Dict[str, int]):
+        # Intervalos a conservar por nivel según los días de retención
+        self.capacidades = {
+            nombre: max(1, retencion_dias[nombre] * 86400 // resolucion)
+            for nombre, resolucion in RESOLUCIONES.items()
+        }
+        self._series: Dict[str, Dict[str, SerieKPI]] = defaultdict(dict)
+        self._lock = threading.Lock()
+        self.cambios = 0
+        # (MAC, KPI) que no entraron por max_kpis (se avisa una vez por serie)
+        self._descartadas: set = set()
+
+    def registrar(self, mac: str, muestras: Dict[str, Dict[int, float]], max_kpis: int = 0) -> int:
+        """
+        Registrar {kpi: {epoch: valor}} de un gateway
+        Con max_kpis > 0 no se crean series nuevas por sobre ese límite
+        """
+        guardadas = 0
+        descartadas = []
+        with self._lock:
+            series = self._series[mac]
+            for kpi, valores in muestras.items():
+                serie = series.get(kpi)
+                if serie is None:
+                    if max_kpis and len(series) >= max_kpis:
+                        if (mac, kpi) not in self._descartadas:
+                            self._descartadas.add((mac, kpi))
+                            descartadas.append(kpi)
+                        continue
+                    serie = series[kpi] = SerieKPI(self.capacidades)
+                guardadas += serie.registrar(valores)
+            self.cambios += guardadas
+        if descartadas:
+            print(
+                f"⚠️ {mac} alcanzó el máximo de {max_kpis} KPIs; no se guardan: {', '.join(sorted(descartadas))} "
+                f"(ajustar FLEET_KPIS o FLEET_MAX_KPIS_PER_GATEWAY)"
+            )
+        return guardadas
+
+    def kpis(self, mac: str) -> List[str]:
+        with self._lock:
+            return sorted(self._series.get(mac, {}))
+
+    def ultimo(self, mac: str) -> Optional[datetime]:
+        """Instante de la muestra más reciente del gateway"""
+        with self._lock:
+            finales = [
+                serie.niveles[NIVEL_5M].intervalos[-1]
+                for serie in self._series.get(mac, {}).values()
+                if len(serie.niveles[NIVEL_5M])
+            ]
+        if not finales:
+            return None
+        return datetime.fromtimestamp(max(finales) * RESOLUCIONES[NIVEL_5M], tz=timezone.utc)
+
+    def consultar(
+        self,
+        mac: str,
+        kpi: str,
+        desde: datetime,
+        hasta: datetime,
+        resolucion: Optional[str] = None
+    ) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Puntos del KPI en [desde, hasta) como (nivel, puntos)
+        Sin resolución se elige la más fina que cubre el rango (ver elegir_nivel)
+        Retorna None si el gateway no tiene ese KPI
+        """
+        inicio, fin = int(desde.timestamp()), int(hasta.timestamp())
+        with self._lock:
+            serie = self._series.get(mac, {}).get(kpi)
+            if serie is None:
+                return None
+            nombre = resolucion or elegir_nivel(serie, inicio, fin)
+            nivel = serie.niveles[nombre]
+            i, j = nivel.rango(inicio // nivel.resolucion, -(-fin // nivel.resolucion))
+            filas = list(zip(
+                nivel.intervalos[i:j], nivel.cuentas[i:j], nivel.sumas[i:j],
+                nivel.minimos[i:j], nivel.maximos[i:j]
+            ))
+
+        puntos = [
+            {
+                "t": datetime.fromtimestamp(intervalo * nivel.resolucion, tz=timezone.utc),
+                "muestras": cuenta,
+                "promedio": round(suma / cuenta, 4),
+                "minimo": round(minimo, 4),
+                "maximo": round(maximo, 4)
+            }
+            for intervalo, cuenta, suma, minimo, maximo in filas
+        ]
+        return nombre, puntos
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            niveles = [
+                nivel for series in self._series.values()
+                for serie in series.values() for nivel in serie.niveles.values()
+            ]
+            gateways = sum(1 for series in self._series.values() if series)
+            total_series = sum(len(series) for series in self._series.values())
+            descartadas = len(self._descartadas)
+        intervalos = sum(len(nivel) for nivel in niveles)
+        return {
+            "gateways": gateways,
+            "series": total_series,
+            "series_descartadas": descartadas,
+            "intervalos": intervalos,
+            # 4 bytes por columna y 2 por la cuenta
+            "bytes_aprox": intervalos * 18,
+            "capacidades": self.capacidades
+        }
+
+    # ========================================
+    # INSTANTÁNEA A DISCO
+    # ========================================
+
+    def guardar(self, ruta: str) -> None:
+        """Escribir todas las series (gzip + JSON con columnas en base64), de forma atómica"""
+        with self._lock:
+            datos = {
+                mac: {
+                    kpi: {nombre: nivel.serializar() for nombre, nivel in serie.niveles.items()}
+                    for kpi, serie in series.items()
+                }
+                for mac, series in self._series.items() if series
+            }
+            self.cambios = 0
+        contenido = {"version": self.VERSION, "byteorder": sys.byteorder, "series": datos}
+
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(directorio, exist_ok=True)
+        temporal = f"{ruta}.tmp"
+        with gzip.open(temporal, "wt", encoding="utf-8") as archivo:
+            json.dump(contenido, archivo)
+        os.replace(temporal, ruta)
+
+    def cargar(self, ruta: str) -> int:
+        """Leer una instantánea de guardar(); retorna cuántas series se cargaron"""
+        with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+            contenido = json.load(archivo)
+        if contenido.get("version") != self.VERSION:
+            raise ValueError(f"Versión de instantánea no soportada: {contenido.get('version')}")
+        invertir = contenido.get("byteorder") != sys.byteorder
+
+        cargadas = 0
+        with self._lock:
+            for mac, series in contenido["series"].items():
+                for kpi, niveles in series.items():
+                    serie = SerieKPI(self.capacidades)
+                    for nombre, datos in niveles.items():
+                        if nombre in serie.niveles:
+                            serie.niveles[nombre].cargar(datos, invertir)
+                    self._series[mac][kpi] = serie
+                    cargadas += 1
+        return cargadas
+
+# ============================================
+# EXTRACCIÓN DE MUESTRAS DE PM
+# ============================================
+# La respuesta de query-history-pm-datas se recorre sin asumir un esquema
+# fijo: cada objeto con una clave de tiempo es un registro, y sus hojas
+# numéricas (también dentro de objetos anidados) son KPIs con el nombre de la
+# hoja. También se aceptan pares {"indicator-name": ..., "indicator-value": ...}.
+# Sin lista de KPIs se ignoran las hojas que identifican en vez de medir
+# (gateway-id, port-index, lan-port...), que si no ocuparían cupos de
+# FLEET_MAX_KPIS_PER_GATEWAY.
+
+CLAVES_TIEMPO = ("collect-time", "collection-time", "start-time", "time", "timestamp", "time-stamp")
+
+# Última palabra de las claves numéricas que no son KPIs
+SUFIJOS_IDENTIFICADOR = ("id", "index", "idx", "port", "no", "sn", "type", "version", "vlan")
+
+def _instante(valor: Any) -> Optional[int]:
+    """Epoch en segundos desde ISO 8601 o epoch (segundos o milisegundos)"""
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)) or (isinstance(valor, str) and valor.isdigit()):
+        numero = float(valor)
+        return int(numero / 1000 if numero > 1e11 else numero)
+    if isinstance(valor, str):
+        try:
+            fecha = datetime.fromisoformat(valor.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=timezone.utc)
+        return int(fecha.timestamp())
+    return None
+
+def _numero(valor: Any) -> Optional[float]:
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        numero = float(valor)
+    elif isinstance(valor, str):
+        try:
+            numero = float(valor)
+        except ValueError:
+            return None
+    else:
+        return None
+    return numero if math.isfinite(numero) else None
+
+def _nombre_kpi(clave: str) -> str:
+    # Sin el prefijo de módulo YANG ("modulo:indicador")
+    return clave.rsplit(":", 1)[-1]
+
+def _es_identificador(kpi: str) -> bool:
+    return kpi.lower().replace("_", "-").rsplit("-", 1)[-1] in SUFIJOS_IDENTIFICADOR
+
+def _par_indicador(nodo: Dict[str, Any]) -> Optional[Tuple[str, float]]:
+    nombre = next((v for k, v in nodo.items() if k.endswith("name") and isinstance(v, str)), None)
+    valor = next((v for k, v in nodo.items() if k.endswith("value")), None)
+    numero = _numero(valor)
+    if nombre is None or numero is None:
+        return None
+    return _nombre_kpi(nombre), numero
+
+def extraer_muestras(datos: Any, kpis: Iterable[str] = ()) -> Dict[str, Dict[int, float]]:
+    """
+    {kpi: {epoch: valor}} desde una respuesta de PM
+    Filtrado a `kpis` si se indican; si no, todas las hojas numéricas menos los identificadores
+    """
+    permitidos = set(kpis)
+    muestras: Dict[str, Dict[int, float]] = defaultdict(dict)
+
+    def anotar_muestra(kpi: str, instante: Optional[int], valor: float) -> None:
+        if instante is None:
+            return
+        if kpi in permitidos if permitidos else not _es_identificador(kpi):
+            muestras[kpi][instante] = valor
+
+    pendientes: List[Tuple[Any, Optional[int]]] = [(datos, None)]
+    while pendientes:
+        nodo, instante = pendientes.pop()
+        if isinstance(nodo, list):
+            pendientes.extend((item, instante) for item in nodo)
+            continue
+        if not isinstance(nodo, dict):
+            continue
+
+        for clave in CLAVES_TIEMPO:
+            if clave in nodo:
+                instante = _instante(nodo[clave]) or instante
+                break
+
+        par = _par_indicador(nodo)
+        if par is not None:
+            anotar_muestra(par[0], instante, par[1])
+            continue
+
+        for clave, valor in nodo.items():
+            if clave in CLAVES_TIEMPO:
+                continue
+            if isinstance(valor, (dict, list)):
+                pendientes.append((valor, instante))
+                continue
+            numero = _numero(valor)
+            if numero is not None:
+                anotar_muestra(_nombre_kpi(clave), instante, numero)
+
+    return dict(muestras)
@@ -0,0 +1,174 @@
+# ============================================
+# TRAZAS.PY - Trazas del pipeline de análisis
+# ============================================
+
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# SPANS
+# ============================================
+# Un span mide una etapa (consulta a NCE, construcción del prompt, llamada al
+# LLM, consulta a Supabase) y apunta a su padre. El span actual viaja en una
+# ContextVar: asyncio la copia a cada tarea y con_contexto() la lleva a los
+# hilos de los ejecutores, por lo que todas las etapas de un análisis quedan
+# en la misma traza.
+
+# Atributos que cada span copia de su padre (para filtrar por MAC o análisis)
+ATRIBUTOS_HEREDADOS = ("mac", "analisis_id", "usuario_id")
+
+@dataclass
+class Span:
+    nombre: str
+    traza_id: str
+    span_id: str
+    padre_id: Optional[str]
+    atributos: Dict[str, Any] = field(default_factory=dict)
+    inicio: float = field(default_factory=time.time)
+    duracion_ms: Optional[float] = None
+    estado: str = "ok"
+    error: Optional[str] = None
+
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            "traza_id": self.traza_id,
+            "span_id": self.span_id,
+            "padre_id": self.padre_id,
+            "nombre": self.nombre,
+            "inicio": self.inicio,
+            "duracion_ms": self.duracion_ms,
+            "estado": self.estado,
+            "error": self.error,
+            "atributos": self.atributos
+        }
+
+_span_actual: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "span_actual", default=None
+)
+
+def span_actual() -> Optional[Span]:
+    return _span_actual.get()
+
+def anotar(**atributos: Any) -> None:
+    """Agregar atributos al span actual (si lo hay)"""
+    actual = _span_actual.get()
+    if actual is not None:
+        actual.atributos.update(atributos)
+
+@contextmanager
+def span(nombre: str, padre: Optional[Span] = None, **atributos: Any) -> Iterator[Span]:
+    """
+    Medir una etapa como hija del span actual (o de `padre`)
+    Sin padre se inicia una traza nueva
+    """
+    padre = padre or _span_actual.get()
+    heredados = {
+        clave: padre.atributos[clave]
+        for clave in ATRIBUTOS_HEREDADOS
+        if padre is not None and clave in padre.atributos
+    }
+    actual = Span(
+        nombre=nombre,
+        traza_id=padre.traza_id if padre else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        padre_id=padre.span_id if padre else None,
+        atributos={**heredados, **atributos}
+    )
+    token = _span_actual.set(actual)
+    inicio = time.monotonic()
+    try:
+        yield actual
+    except (asyncio.CancelledError, GeneratorExit):
+        actual.estado = "cancelado"
+        raise
+    except Exception as e:
+        actual.estado = "error"
+        actual.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        actual.duracion_ms = round((time.monotonic() - inicio) * 1000, 2)
+        try:
+            _span_actual.reset(token)
+        except ValueError:
+            # Generador asíncrono cerrado desde otro contexto (stream cortado)
+            _span_actual.set(padre)
+        _exportador.exportar(actual)
+
+def con_contexto(funcion: Callable) -> Callable:
+    """
+    Envolver una función para que corra en un hilo con el contexto actual
+    (los ThreadPoolExecutor no copian las ContextVar, asyncio.to_thread sí)
+    """
+    return functools.partial(contextvars.copy_context().run, funcion)
+
+# ============================================
+# EXPORTADORES
+# ============================================
+
+class Exportador:
+    """Destino de los spans terminados"""
+
+    def exportar(self, span: Span) -> None:
+        raise NotImplementedError
+
+class ExportadorNulo(Exportador):
+    def exportar(self, span: Span) -> None:
+        pass
+
+class ExportadorConsola(Exportador):
+    """Una línea de log por span"""
+
+    def exportar(self, span: Span) -> None:
+        logger.info(
+            "traza=%s span=%s padre=%s %s %.1f ms %s %s",
+            span.traza_id,
+            span.span_id,
+            span.padre_id or "-",
+            span.nombre,
+            span.duracion_ms,
+            span.estado,
+            json.dumps(span.atributos, default=str, ensure_ascii=False)
+        )
+
+class ExportadorJSONL(Exportador):
+    """Un objeto JSON por línea en un archivo local (ver scripts/ver_traza.py)"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def exportar(self, span: Span) -> None:
+        linea = json.dumps(span.a_dict(), default=str, ensure_ascii=False)
+        with self._lock:
+            with open(self.ruta, "a", encoding="utf-8") as archivo:
+                archivo.write(linea + "\n")
+
+def crear_exportador(tipo: str, ruta: str) -> Exportador:
+    """Exportador según TRACING_EXPORTER: none, console o jsonl"""
+    if tipo == "console":
+        return ExportadorConsola()
+    if tipo == "jsonl":
+        return ExportadorJSONL(ruta)
+    if tipo != "none":
+        logger.warning("TRACING_EXPORTER desconocido (%s), trazas desactivadas", tipo)
+    return ExportadorNulo()
+
+_exportador: Exportador = crear_exportador(settings.TRACING_EXPORTER, settings.TRACING_FILE)
+
+def configurar_exportador(exportador: Exportador) -> None:
+    """Reemplazar el exportador del proceso (p. ej. uno hacia un colector externo)"""
+    global _exportador
+    _exportador = exportador
@@ -0,0 +1,3 @@
+# ============================================
+# BENCH - Pruebas de carga con NCE, LLM y Supabase falsos
+# ============================================
@@ -0,0 +1,429 @@
+# ============================================
+# CARGA.PY - Prueba de carga de /api/analisis y /api/chat
+# ============================================
+#
+# Levanta el NCE falso, lanza la API con sustitutos (bench.servidor) en un
+# subproceso y la somete a carga concurrente durante un tiempo fijo. Reporta
+# throughput, latencias p50/p95/p99 por operación y uso de CPU y memoria del
+# proceso de la API, en consola y en un JSON comparable entre corridas.
+#
+# Con --nce-corpus la API no consulta el NCE falso sino un corpus grabado con
+# scripts/capturar_nce.py (respuestas reales, a la velocidad --nce-velocidad).
+#
+# Uso (desde backend/):
+#     python -m bench.carga --escenario mixto --concurrencia 16 --duracion 30 \
+#         --salida resultados/actual.json --comparar resultados/base.json
+#
+# Operaciones medidas:
+#   - analisis.crear: POST /api/analisis (responde 202 con el análisis pendiente)
+#   - analisis.completo: desde el POST hasta que /estado informa completado
+#   - chat: POST /api/chat sobre un análisis ya completado
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.nce_falso import ServidorNCEFalso
+from bench.servidor import ADMIN_EMAIL, ADMIN_PASSWORD
+
+DIRECTORIO_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PREGUNTAS_CHAT = [
+    "¿Cuántos dispositivos hay conectados?",
+    "¿Cómo está la señal óptica?",
+    "¿Hay interferencia en la banda de 2.4 GHz?",
+    "¿Qué canal usa la red de 5G?",
+    "¿Por qué el cliente tiene internet lento?",
+    "¿Los puertos LAN están funcionando?",
+]
+
+INTERVALO_ESTADO = 0.05
+
+# ============================================
+# MUESTRAS Y ESTADÍSTICAS
+# ============================================
+
+@dataclass
+class Muestra:
+    operacion: str
+    inicio: float
+    segundos: float
+    ok: bool
+    detalle: str = ""
+
+def percentil(ordenados: List[float], p: float) -> Optional[float]:
+    """Percentil con interpolación lineal sobre una lista ya ordenada"""
+    if not ordenados:
+        return None
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+def resumir(muestras: List[Muestra], duracion: float) -> Dict[str, Dict[str, Any]]:
+    por_operacion = defaultdict(list)
+    for muestra in muestras:
+        por_operacion[muestra.operacion].append(muestra)
+
+    resumen = {}
+    for operacion, lista in sorted(por_operacion.items()):
+        latencias = sorted(m.segundos * 1000 for m in lista if m.ok)
+        errores = defaultdict(int)
+        for m in lista:
+            if not m.ok:
+                errores[m.detalle] += 1
+        resumen[operacion] = {
+            "total": len(lista),
+            "ok": len(latencias),
+            "errores": dict(errores),
+            "throughput_por_segundo": round(len(latencias) / duracion, 3),
+            "latencia_ms": {
+                "p50": _redondear(percentil(latencias, 50)),
+                "p95": _redondear(percentil(latencias, 95)),
+                "p99": _redondear(percentil(latencias, 99)),
+                "max": _redondear(latencias[-1] if latencias else None),
+                "promedio": _redondear(sum(latencias) / len(latencias) if latencias else None)
+            }
+        }
+    return resumen
+
+def _redondear(valor: Optional[float]) -> Optional[float]:
+    return round(valor, 1) if valor is not None else None
+
+# ============================================
+# RECURSOS DEL PROCESO DE LA API (Linux /proc)
+# ============================================
+
+def _leer_proc(pid: int) -> Optional[Dict[str, float]]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            estado = dict(linea.split(":", 1) for linea in f if ":" in linea)
+    except OSError:
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return {
+        # utime y stime son los campos 14 y 15 (índices 11 y 12 tras el nombre)
+        "cpu_segundos": (int(campos[11]) + int(campos[12])) / ticks,
+        "rss_mb": int(estado["VmRSS"].split()[0]) / 1024,
+        "rss_max_mb": int(estado["VmHWM"].split()[0]) / 1024,
+        "hilos": int(estado["Threads"])
+    }
+
+class MonitorRecursos:
+    """Muestrea CPU, memoria e hilos de un proceso una vez por segundo"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.inicial = None
+        self.muestras: List[Dict[str, float]] = []
+
+    async def ejecutar(self) -> None:
+        self.inicial = _leer_proc(self.pid)
+        while True:
+            lectura = _leer_proc(self.pid)
+            if lectura:
+                self.muestras.append(lectura)
+            await asyncio.sleep(1)
+
+    def resumen(self, duracion: float) -> Dict[str, Any]:
+        final = _leer_proc(self.pid)
+        if not self.inicial or not final:
+            return {"disponible": False}
+        cpu = final["cpu_segundos"] - self.inicial["cpu_segundos"]
+        return {
+            "disponible": True,
+            "cpu_segundos": round(cpu, 2),
+            "cpu_porcentaje": round(100 * cpu / duracion, 1),
+            "rss_final_mb": round(final["rss_mb"], 1),
+            "rss_max_mb": round(final["rss_max_mb"], 1),
+            "hilos_max": max((m["hilos"] for m in self.muestras), default=final["hilos"])
+        }
+
+# ============================================
+# OPERACIONES
+# ============================================
+
+class Carga:
+    def __init__(self, cliente: httpx.AsyncClient, args: argparse.Namespace):
+        self.cliente = cliente
+        self.args = args
+        self.azar = random.Random(args.semilla)
+        self.macs = [
+            "AA:BB:{:02X}:{:02X}:{:02X}:{:02X}".format(*(i.to_bytes(4, "big")))
+            for i in range(args.macs)
+        ]
+        self.analisis_chat: List[str] = []
+        self.muestras: List[Muestra] = []
+
+    def _registrar(self, operacion: str, inicio: float, ok: bool, detalle: str = "") -> None:
+        self.muestras.append(Muestra(operacion, inicio, time.monotonic() - inicio, ok, detalle))
+
+    async def analisis(self) -> Optional[str]:
+        """Crear un análisis y esperar a que termine; retorna su id si se completó"""
+        inicio = time.monotonic()
+        try:
+            r = await self.cliente.post("/api/analisis", json={
+                "mac_address": self.azar.choice(self.macs),
+                "incluir_eventos": True,
+                "forzar_actualizacion": self.args.forzar_actualizacion
+            })
+        except httpx.HTTPError as e:
+            self._registrar("analisis.crear", inicio, False, type(e).__name__)
+            return None
+        self._registrar("analisis.crear", inicio, r.status_code == 202, str(r.status_code))
+        if r.status_code != 202:
+            return None
+
+        analisis_id = r.json()["id"]
+        while True:
+            await asyncio.sleep(INTERVALO_ESTADO)
+            try:
+                estado = await self.cliente.get(f"/api/analisis/{analisis_id}/estado")
+            except httpx.HTTPError as e:
+                self._registrar("analisis.completo", inicio, False, type(e).__name__)
+                return None
+            if estado.status_code != 200:
+                self._registrar("analisis.completo", inicio, False, str(estado.status_code))
+                return None
+            valor = estado.json()["estado"]
+            if valor in ("completado", "error"):
+                self._registrar("analisis.completo", inicio, valor == "completado", valor)
+                return analisis_id if valor == "completado" else None
+
+    async def chat(self) -> None:
+        inicio = time.monotonic()
+        try:
+            r = await self.cliente.post("/api/chat", json={
+                "analisis_id": self.azar.choice(self.analisis_chat),
+                "pregunta": self.azar.choice(PREGUNTAS_CHAT)
+            })
+            self._registrar("chat", inicio, r.status_code == 200, str(r.status_code))
+        except httpx.HTTPError as e:
+            self._registrar("chat", inicio, False, type(e).__name__)
+
+    async def preparar_chat(self, cantidad: int) -> None:
+        """Completar algunos análisis sobre los que conversar (no se miden)"""
+        ids = await asyncio.gather(*(self.analisis() for _ in range(cantidad)))
+        self.analisis_chat = [i for i in ids if i]
+        self.muestras.clear()
+        if not self.analisis_chat:
+            raise RuntimeError("No se pudo completar ningún análisis para el escenario de chat")
+
+    async def usuario_virtual(self, fin: float) -> None:
+        while time.monotonic() < fin:
+            escenario = self.args.escenario
+            if escenario == "mixto":
+                escenario = "chat" if self.azar.random() < self.args.proporcion_chat else "analisis"
+            if escenario == "chat":
+                await self.chat()
+            else:
+                await self.analisis()
+
+# ============================================
+# ORQUESTACIÓN
+# ============================================
+
+def _lanzar_api(args: argparse.Namespace, nce_url: str) -> subprocess.Popen:
+    entorno = dict(os.environ)
+    if args.nce_corpus:
+        entorno["NCE_REPLAY_FILE"] = os.path.abspath(args.nce_corpus)
+        entorno["NCE_REPLAY_SPEED"] = str(args.nce_velocidad)
+    comando = [
+        sys.executable, "-m", "bench.servidor",
+        "--puerto", str(args.puerto),
+        "--nce-url", nce_url,
+        "--db-latencia-ms", str(args.db_latencia_ms),
+        "--llm-primer-token-ms", str(args.llm_primer_token_ms),
+        "--llm-por-token-ms", str(args.llm_por_token_ms),
+        "--llm-tokens", str(args.llm_tokens),
+    ]
+    return subprocess.Popen(comando, cwd=DIRECTORIO_BACKEND, env=entorno)
+
+async def _esperar_api(cliente: httpx.AsyncClient, proceso: subprocess.Popen, timeout: float = 60) -> None:
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"La API terminó al iniciar (código {proceso.returncode})")
+        try:
+            if (await cliente.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("La API no respondió a tiempo")
+
+def _commit_actual() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=DIRECTORIO_BACKEND, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def ejecutar(args: argparse.Namespace) -> Dict[str, Any]:
+    nce = None
+    if not args.nce_corpus:
+        nce = ServidorNCEFalso(
+            latencia_ms=args.nce_latencia_ms,
+            jitter_ms=args.nce_jitter_ms,
+            tasa_error=args.nce_tasa_error,
+            tasa_lenta=args.nce_tasa_lenta,
+            latencia_lenta_ms=args.nce_latencia_lenta_ms,
+            dispositivos=args.nce_dispositivos,
+            semilla=args.semilla
+        ).iniciar()
+    # Con corpus la URL solo se usa para armar las rutas (no hay red)
+    proceso = _lanzar_api(args, nce.url if nce else "http://nce.reproduccion")
+
+    limites = httpx.Limits(max_connections=args.concurrencia * 2)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.puerto}", timeout=120, limits=limites
+        ) as cliente:
+            await _esperar_api(cliente, proceso)
+            login = await cliente.post("/api/auth/login", json={
+                "email": ADMIN_EMAIL, "password": ADMIN_PASSWORD
+            })
+            login.raise_for_status()
+            cliente.headers["Authorization"] = f"Bearer {login.json()['access_token']}"
+
+            carga = Carga(cliente, args)
+            if args.escenario in ("chat", "mixto"):
+                print("⏳ Preparando análisis para el chat...")
+                await carga.preparar_chat(min(args.concurrencia, 8))
+
+            print(f"🚀 Carga '{args.escenario}': {args.concurrencia} usuarios durante {args.duracion}s")
+            monitor = MonitorRecursos(proceso.pid)
+            inicio = time.monotonic()
+            fin = inicio + args.calentamiento + args.duracion
+            tarea_monitor = asyncio.create_task(monitor.ejecutar())
+            await asyncio.gather(*(carga.usuario_virtual(fin) for _ in range(args.concurrencia)))
+            duracion_real = time.monotonic() - inicio
+            recursos = monitor.resumen(duracion_real)
+            tarea_monitor.cancel()
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+        if nce:
+            nce.detener()
+
+    # Descartar lo iniciado durante el calentamiento
+    desde = inicio + args.calentamiento
+    medidas = [m for m in carga.muestras if m.inicio >= desde]
+
+    return {
+        "version": 1,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_actual(),
+        "python": platform.python_version(),
+        "configuracion": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+        "duracion_medida_segundos": round(duracion_real - args.calentamiento, 2),
+        "operaciones": resumir(medidas, duracion_real - args.calentamiento),
+        "recursos_api": recursos,
+        "nce_solicitudes": dict(nce.solicitudes) if nce else None
+    }
+
+# ============================================
+# REPORTE
+# ============================================
+
+def imprimir(reporte: Dict[str, Any], base: Optional[Dict[str, Any]] = None) -> None:
+    print(f"\n📊 Resultados ({reporte['duracion_medida_segundos']}s medidos, commit {reporte['commit']})\n")
+    print(f"  {'Operación':<20}{'ok/total':>12}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for operacion, datos in reporte["operaciones"].items():
+        latencia = datos["latencia_ms"]
+        print(
+            f"  {operacion:<20}{datos['ok']:>6}/{datos['total']:<5}{datos['throughput_por_segundo']:>9.2f}"
+            + "".join(f"{_formato_ms(latencia[p]):>10}" for p in ("p50", "p95", "p99"))
+        )
+        if datos["errores"]:
+            print(f"  {'':<20}errores: {datos['errores']}")
+
+    recursos = reporte["recursos_api"]
+    if recursos.get("disponible"):
+        print(
+            f"\n  API: CPU {recursos['cpu_porcentaje']}% ({recursos['cpu_segundos']}s), "
+            f"RSS máx {recursos['rss_max_mb']} MB, hilos máx {recursos['hilos_max']}"
+        )
+
+    if base:
+        print(f"\n🔁 Comparación con commit {base.get('commit')} (cambio relativo)\n")
+        print(f"  {'Operación':<20}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for operacion, datos in reporte["operaciones"].items():
+            anterior = base["operaciones"].get(operacion)
+            if not anterior:
+                continue
+            columnas = [_delta(datos["throughput_por_segundo"], anterior["throughput_por_segundo"])]
+            columnas += [
+                _delta(datos["latencia_ms"][p], anterior["latencia_ms"][p])
+                for p in ("p50", "p95", "p99")
+            ]
+            print(f"  {operacion:<20}" + "".join(f"{c:>10}" for c in columnas))
+
+def _formato_ms(valor: Optional[float]) -> str:
+    return "-" if valor is None else f"{valor:.0f}ms"
+
+def _delta(actual: Optional[float], anterior: Optional[float]) -> str:
+    if actual is None or not anterior:
+        return "-"
+    return f"{100 * (actual - anterior) / anterior:+.1f}%"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API con NCE, LLM y Supabase falsos")
+    parser.add_argument("--escenario", choices=["analisis", "chat", "mixto"], default="mixto")
+    parser.add_argument("--proporcion-chat", type=float, default=0.5, help="Fracción de chat en el escenario mixto")
+    parser.add_argument("--concurrencia", type=int, default=16, help="Usuarios virtuales simultáneos")
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos medidos")
+    parser.add_argument("--calentamiento", type=float, default=3, help="Segundos iniciales que no se miden")
+    parser.add_argument("--macs", type=int, default=500, help="Gateways distintos (menos = más aciertos de caché)")
+    parser.add_argument("--forzar-actualizacion", action="store_true", help="Ignorar las cachés de NCE")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--puerto", type=int, default=8100)
+    parser.add_argument("--nce-latencia-ms", type=float, default=80.0)
+    parser.add_argument("--nce-jitter-ms", type=float, default=30.0)
+    parser.add_argument("--nce-tasa-error", type=float, default=0.0)
+    parser.add_argument("--nce-tasa-lenta", type=float, default=0.0)
+    parser.add_argument("--nce-latencia-lenta-ms", type=float, default=3000.0)
+    parser.add_argument("--nce-dispositivos", type=int, default=12)
+    parser.add_argument("--nce-corpus", help="Reproducir un corpus grabado en vez del NCE falso")
+    parser.add_argument("--nce-velocidad", type=float, default=1.0, help="Velocidad de reproducción del corpus (0 = sin esperas)")
+    parser.add_argument("--db-latencia-ms", type=float, default=5.0)
+    parser.add_argument("--llm-primer-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-por-token-ms", type=float, default=5.0)
+    parser.add_argument("--llm-tokens", type=int, default=200)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar el reporte")
+    parser.add_argument("--comparar", help="Reporte JSON anterior contra el cual comparar")
+    args = parser.parse_args()
+
+    reporte = asyncio.run(ejecutar(args))
+
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+    imprimir(reporte, base)
+
+    if args.salida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Reporte guardado en {args.salida}")
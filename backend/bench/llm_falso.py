@@ -0,0 +1,91 @@
+# ============================================
+# LLM_FALSO.PY - Modelo de chat determinista para benchmarks
+# ============================================
+#
+# Responde sin llamar a Gemini: el texto depende solo del prompt (hash), por
+# lo que dos corridas con la misma carga generan las mismas respuestas. La
+# latencia se compone de un tiempo hasta el primer token y un tiempo por
+# token, igual que un modelo real en modo stream.
+
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+PALABRAS = (
+    "gateway señal wifi banda canal potencia dispositivos conectados interferencia "
+    "red estable revisar reiniciar cliente velocidad óptica nivel correcto advertencia"
+).split()
+
+
+class LLMFalso(BaseChatModel):
+    """Modelo de chat local con latencia configurable"""
+
+    primer_token_ms: float = 300.0
+    por_token_ms: float = 5.0
+    tokens_respuesta: int = 200
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-falso"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "".join(str(m.content) for m in messages)
+        semilla = hashlib.sha256(prompt.encode("utf-8")).digest()
+        return [
+            PALABRAS[semilla[i % len(semilla)] % len(PALABRAS)] + " "
+            for i in range(self.tokens_respuesta)
+        ]
+
+    def _demora_total(self) -> float:
+        return (self.primer_token_ms + self.por_token_ms * self.tokens_respuesta) / 1000
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        time.sleep(self._demora_total())
+        texto = "".join(self._tokens(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        await asyncio.sleep(self._demora_total())
+        texto = "".join(self._tokens(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.primer_token_ms / 1000)
+        for token in self._tokens(messages):
+            time.sleep(self.por_token_ms / 1000)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.primer_token_ms / 1000)
+        for token in self._tokens(messages):
+            await asyncio.sleep(self.por_token_ms / 1000)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,305 @@
+# ============================================
+# NCE_FALSO.PY - Servidor RESTCONF local que imita a Huawei NCE
+# ============================================
+#
+# Responde los endpoints que consulta GatewayAnalyzer con datos sintéticos
+# (deterministas por MAC), con latencia y errores inyectables:
+#   - latencia_ms ± jitter_ms por respuesta
+#   - tasa_error: fracción de respuestas 503 (transitorias, se reintentan)
+#   - tasa_lenta: fracción de respuestas que tardan latencia_lenta_ms
+#
+# Uso independiente (desde backend/):
+#     python -m bench.nce_falso --puerto 8443 --latencia-ms 80 --tasa-error 0.02
+
+import argparse
+import calendar
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+# ============================================
+# RESPUESTAS SINTÉTICAS
+# ============================================
+
+def _aleatorio(mac: str, extra: str = "") -> random.Random:
+    """Generador determinista por MAC (y banda) para que las corridas sean comparables"""
+    return random.Random(zlib.crc32(f"{mac}{extra}".encode()))
+
+def _info_basica(mac: str, params: Dict[str, str], dispositivos: int) -> Dict[str, Any]:
+    r = _aleatorio(mac)
+    return {
+        "huawei-nce-resource-activation-configuration-home-gateway:home-gateway-info": {
+            "mac": mac,
+            "device-model": r.choice(["HG8145V5", "HG8245Q2", "EG8145X6"]),
+            "software-version": f"V5R020C10S{r.randint(100, 200)}",
+            "run-status": "online",
+            "up-time": r.randint(3600, 3600 * 24 * 30),
+            "optical-rx-power": round(r.uniform(-27, -15), 2),
+            "optical-tx-power": round(r.uniform(1, 4), 2),
+            "cpu-usage": r.randint(5, 90),
+            "memory-usage": r.randint(20, 85)
+        }
+    }
+
+def _dispositivos(mac: str, params: Dict[str, str], dispositivos: int) -> Dict[str, Any]:
+    r = _aleatorio(mac, "dispositivos")
+    return {
+        "huawei-nce-resource-activation-configuration-home-gateway:sub-devices": {
+            "sub-device": [
+                {
+                    "mac": ":".join(f"{r.randint(0, 255):02X}" for _ in range(6)),
+                    "host-name": f"dispositivo-{i}",
+                    "access-type": r.choice(["2.4G", "5G", "LAN"]),
+                    "rssi": r.randint(-85, -35),
+                    "negotiation-rate": r.choice([72, 144, 300, 433, 866]),
+                    "online-duration": r.randint(60, 86400)
+                }
+                for i in range(r.randint(max(1, dispositivos // 2), max(1, dispositivos)))
+            ]
+        }
+    }
+
+def _rendimiento(mac: str, params: Dict[str, str], dispositivos: int) -> Dict[str, Any]:
+    # Una muestra cada 5 minutos dentro de la ventana pedida (última hora si no viene)
+    fin = _epoch(params.get("end-time")) or time.time()
+    inicio = _epoch(params.get("start-time")) or fin - 3600
+    instantes = range(int(inicio // 300 + 1) * 300, int(fin) + 1, 300)
+    datos = []
+    for instante in instantes:
+        # Determinista por MAC e instante: consultas solapadas repiten los mismos valores
+        r = _aleatorio(mac, f"rendimiento{instante}")
+        datos.append({
+            "collect-time": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(instante)),
+            "indicators": {
+                "wifi-interference": r.randint(0, 100),
+                "wifi-coverage": r.randint(0, 100),
+                "avg-latency": r.randint(5, 120),
+                "packet-loss": round(r.uniform(0, 3), 2)
+            }
+        })
+    return {"huawei-nce-homeinsight-performance-management:output": {"pm-datas": datos}}
+
+def _epoch(valor: Optional[str]) -> Optional[float]:
+    if not valor:
+        return None
+    return calendar.timegm(time.strptime(valor[:19], "%Y-%m-%dT%H:%M:%S"))
+
+def _banda_wifi(mac: str, params: Dict[str, str], dispositivos: int) -> Dict[str, Any]:
+    banda = params.get("radio-type", "2.4G")
+    r = _aleatorio(mac, banda)
+    return {
+        "huawei-nce-resource-activation-configuration-home-gateway:wifi-band": {
+            "radio-type": banda,
+            "enable": True,
+            "channel": r.choice([1, 6, 11] if banda == "2.4G" else [36, 44, 149]),
+            "bandwidth": "20MHz" if banda == "2.4G" else "80MHz",
+            "transmit-power": r.choice([60, 80, 100]),
+            "ssid-name": f"RED-{mac[-4:]}"
+        }
+    }
+
+def _wifi_invitados(mac: str, params: Dict[str, str], dispositivos: int) -> Dict[str, Any]:
+    return {"output": {"guest-ssid": [{"ssid-name": f"INVITADOS-{mac[-4:]}", "enable": False}]}}
+
+def _puertos(mac: str, params: Dict[str, str], dispositivos: int) -> Dict[str, Any]:
+    r = _aleatorio(mac, "puertos")
+    return {
+        "output": {
+            "port": [
+                {"port-id": i, "status": r.choice(["up", "down"]), "rate": r.choice([100, 1000])}
+                for i in range(1, 5)
+            ]
+        }
+    }
+
+def _redes_vecinas(mac: str, params: Dict[str, str], dispositivos: int) -> Dict[str, Any]:
+    banda = params.get("radio-type", "2.4G")
+    r = _aleatorio(mac, f"vecinas{banda}")
+    return {
+        "huawei-nce-resource-activation-configuration-home-gateway:neighbor-ssids": {
+            "neighbor-ssid": [
+                {
+                    "ssid-name": f"VECINO-{i}",
+                    "channel": r.choice([1, 6, 11] if banda == "2.4G" else [36, 44, 149]),
+                    "rssi": r.randint(-90, -40)
+                }
+                for i in range(r.randint(3, 25))
+            ]
+        }
+    }
+
+def _sesiones(mac: str, params: Dict[str, str], dispositivos: int) -> Dict[str, Any]:
+    r = _aleatorio(mac, "sesiones")
+    return {
+        "output": {
+            "session": [{"type": "PPPoE", "ip": f"10.{r.randint(0, 255)}.{r.randint(0, 255)}.1", "status": "connected"}]
+        }
+    }
+
+# Último segmento de la ruta RESTCONF -> generador de la respuesta
+RESPUESTAS: Dict[str, Callable[[str, Dict[str, str], int], Dict[str, Any]]] = {
+    "home-gateway-info": _info_basica,
+    "sub-devices": _dispositivos,
+    "query-history-pm-datas": _rendimiento,
+    "wifi-band": _banda_wifi,
+    "query-gateway-guest-ssid": _wifi_invitados,
+    "query-gateway-downstream-port": _puertos,
+    "neighbor-ssids": _redes_vecinas,
+    "query-session-info": _sesiones,
+}
+
+def _endpoint(ruta: str) -> str:
+    ultimo = ruta.rstrip("/").rsplit("/", 1)[-1]
+    return ultimo.rsplit(":", 1)[-1]
+
+def _mac_de_payload(payload: Dict[str, Any]) -> str:
+    for valor in payload.values():
+        if isinstance(valor, dict):
+            if "mac" in valor:
+                return valor["mac"]
+            for gateway in valor.get("gateway-list", []):
+                return gateway.get("gateway-mac", "")
+    return ""
+
+def _ventana(payload: Dict[str, Any]) -> Dict[str, str]:
+    """start-time / end-time de las consultas de PM"""
+    for valor in payload.values():
+        if isinstance(valor, dict):
+            return {k: valor[k] for k in ("start-time", "end-time") if k in valor}
+    return {}
+
+# ============================================
+# SERVIDOR
+# ============================================
+
+class ServidorNCEFalso:
+    """Servidor HTTP local (un hilo por conexión) con latencia y errores inyectables"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        puerto: int = 0,
+        latencia_ms: float = 50.0,
+        jitter_ms: float = 20.0,
+        tasa_error: float = 0.0,
+        tasa_lenta: float = 0.0,
+        latencia_lenta_ms: float = 2000.0,
+        dispositivos: int = 12,
+        semilla: int = 1
+    ):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self.tasa_lenta = tasa_lenta
+        self.latencia_lenta_ms = latencia_lenta_ms
+        self.dispositivos = dispositivos
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.solicitudes: Counter = Counter()
+        self._servidor = ThreadingHTTPServer((host, puerto), self._handler())
+        self._servidor.daemon_threads = True
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._servidor.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def _sortear(self) -> tuple:
+        """(espera en segundos, si la respuesta es un error)"""
+        with self._lock:
+            if self._azar.random() < self.tasa_lenta:
+                espera = self.latencia_lenta_ms
+            else:
+                espera = max(0.0, self._azar.gauss(self.latencia_ms, self.jitter_ms))
+            return espera / 1000, self._azar.random() < self.tasa_error
+
+    def _registrar(self, endpoint: str, status: int) -> None:
+        with self._lock:
+            self.solicitudes[f"{endpoint} {status}"] += 1
+
+    def _handler(self):
+        nce = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _responder(self, status: int, cuerpo: Dict[str, Any]) -> None:
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/yang-data+json")
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def _atender(self, mac: str, params: Dict[str, str]) -> None:
+                url = urlparse(self.path)
+                endpoint = _endpoint(url.path)
+                generador = RESPUESTAS.get(endpoint)
+                espera, error = nce._sortear()
+                time.sleep(espera)
+
+                if generador is None:
+                    status, cuerpo = 404, {"errors": {"error": [{"error-message": "Recurso no encontrado"}]}}
+                elif error:
+                    status, cuerpo = 503, {"errors": {"error": [{"error-message": "Servicio no disponible"}]}}
+                else:
+                    status, cuerpo = 200, generador(mac, params, nce.dispositivos)
+                nce._registrar(endpoint, status)
+                self._responder(status, cuerpo)
+
+            def do_GET(self) -> None:
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                self._atender(params.get("mac", ""), params)
+
+            def do_POST(self) -> None:
+                largo = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(largo) or b"{}")
+                self._atender(_mac_de_payload(payload), _ventana(payload))
+
+        return Handler
+
+    def iniciar(self) -> "ServidorNCEFalso":
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, name="nce-falso", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self) -> None:
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor NCE falso para pruebas de carga")
+    parser.add_argument("--puerto", type=int, default=8443)
+    parser.add_argument("--latencia-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--tasa-lenta", type=float, default=0.0)
+    parser.add_argument("--latencia-lenta-ms", type=float, default=2000.0)
+    parser.add_argument("--dispositivos", type=int, default=12)
+    args = parser.parse_args()
+
+    servidor = ServidorNCEFalso(
+        puerto=args.puerto,
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        tasa_error=args.tasa_error,
+        tasa_lenta=args.tasa_lenta,
+        latencia_lenta_ms=args.latencia_lenta_ms,
+        dispositivos=args.dispositivos
+    )
+    print(f"🛰️ NCE falso escuchando en {servidor.url}")
+    try:
+        servidor._servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.detener()
@@ -0,0 +1,87 @@
+# ============================================
+# SERVIDOR.PY - API con sustitutos locales para benchmarks
+# ============================================
+#
+# Levanta la API real (app.main) con Supabase en memoria y el LLM falso; NCE
+# se apunta al servidor falso con --nce-url. bench.carga lo lanza como
+# subproceso para medir los recursos de la API por separado.
+#
+# Uso (desde backend/):
+#     python -m bench.servidor --puerto 8100 --nce-url http://127.0.0.1:8443
+
+import argparse
+import os
+
+# Credenciales del administrador inicial (la carga inicia sesión con ellas)
+ADMIN_EMAIL = "bench@smartwifi.cl"
+ADMIN_PASSWORD = "bench-password"
+
+# Configuración necesaria para importar app.config sin un .env real; se
+# asigna siempre para que las variables exportadas en la shell no la pisen
+# (p. ej. otro ADMIN_EMAIL haría fallar el login de la carga)
+ENTORNO_BENCH = {
+    "SUPABASE_URL": "http://supabase.local",
+    "SUPABASE_KEY": "bench",
+    "SUPABASE_SERVICE_KEY": "bench",
+    "GATEWAY_USERNAME": "bench",
+    "GATEWAY_PASSWORD": "bench",
+    "GOOGLE_API_KEY": "bench",
+    "JWT_SECRET_KEY": "bench-secret",
+    "ADMIN_EMAIL": ADMIN_EMAIL,
+    "ADMIN_PASSWORD": ADMIN_PASSWORD,
+    "ENVIRONMENT": "bench",
+}
+
+# Ajustes por defecto que se pueden sobrescribir desde el entorno
+AJUSTES_BENCH = {
+    "LOG_LEVEL": "WARNING",
+    # La carga sale de un solo usuario: sin límite de tasa y bcrypt barato
+    "RATE_LIMIT_PER_MINUTE": "1000000",
+    "BCRYPT_ROUNDS": "4",
+}
+
+
+def preparar(nce_url: str, db_latencia_ms: float, llm_primer_token_ms: float, llm_por_token_ms: float, llm_tokens: int) -> None:
+    """Configurar el entorno y reemplazar Supabase y Gemini antes de importar la app"""
+    os.environ.update(ENTORNO_BENCH)
+    for clave, valor in AJUSTES_BENCH.items():
+        os.environ.setdefault(clave, valor)
+    os.environ["GATEWAY_BASE_URL"] = nce_url
+
+    import supabase
+    from bench.supabase_memoria import ClienteMemoria
+    cliente = ClienteMemoria(latencia_ms=db_latencia_ms)
+    supabase.create_client = lambda *args, **kwargs: cliente
+
+    from app import llm
+    from bench.llm_falso import LLMFalso
+    modelo = LLMFalso(
+        primer_token_ms=llm_primer_token_ms,
+        por_token_ms=llm_por_token_ms,
+        tokens_respuesta=llm_tokens
+    )
+    llm.get_llm = lambda temperature: modelo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API con Supabase en memoria y LLM falso")
+    parser.add_argument("--puerto", type=int, default=8100)
+    parser.add_argument("--nce-url", required=True)
+    parser.add_argument("--db-latencia-ms", type=float, default=5.0)
+    parser.add_argument("--llm-primer-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-por-token-ms", type=float, default=5.0)
+    parser.add_argument("--llm-tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    preparar(
+        args.nce_url,
+        args.db_latencia_ms,
+        args.llm_primer_token_ms,
+        args.llm_por_token_ms,
+        args.llm_tokens
+    )
+
+    import uvicorn
+    from app.main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=args.puerto, log_level="warning")
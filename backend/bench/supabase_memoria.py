@@ -0,0 +1,260 @@
+# ============================================
+# SUPABASE_MEMORIA.PY - Sustituto local de Supabase para benchmarks
+# ============================================
+#
+# Implementa el subconjunto del query builder de postgrest que usa la API
+# (select, eq, gt/lt, in_, or_, order, limit, insert, update, upsert,
+# delete) sobre tablas en memoria. Cada execute() puede esperar una latencia
+# fija para simular el viaje a la base de datos.
+
+import copy
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# Valores por defecto de cada tabla (ver supabase_schema.sql)
+DEFAULTS = {
+    "usuarios": {"rol": "user", "activo": True, "nombre": None, "ultimo_acceso": None},
+    "analisis_gateways": {
+        "informe_ia": None,
+        "informe_desde_cache": False,
+        "estado": "completado",
+        "error_detalle": None
+    },
+    "chat_memoria": {"resumen": "", "turnos_resumidos": 0, "resumido_hasta": None, "resumido_hasta_id": None},
+}
+
+CLAVES_PRIMARIAS = {"chat_memoria": "analisis_id"}
+
+# Tablas con columna updated_at (actualizada por trigger en la base real)
+CON_UPDATED_AT = {"usuarios", "analisis_gateways", "chat_memoria"}
+
+def _ahora() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+# ============================================
+# FILTROS
+# ============================================
+
+OPERADORES: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+}
+
+def _normalizar(valor: Any) -> Any:
+    """Comparar como lo haría postgrest: todo llega como texto"""
+    if isinstance(valor, bool) or valor is None:
+        return valor
+    return str(valor)
+
+def _separar_nivel_superior(texto: str) -> List[str]:
+    """Separar por comas que no están dentro de paréntesis ni comillas"""
+    partes, nivel, comillas, actual = [], 0, False, ""
+    for c in texto:
+        if c == '"':
+            comillas = not comillas
+        elif not comillas and c == "(":
+            nivel += 1
+        elif not comillas and c == ")":
+            nivel -= 1
+        elif not comillas and nivel == 0 and c == ",":
+            partes.append(actual)
+            actual = ""
+            continue
+        actual += c
+    partes.append(actual)
+    return partes
+
+def _filtro_logico(texto: str, conector: Callable) -> Callable[[Dict], bool]:
+    """Interpretar la sintaxis de or_/and de postgrest: a.eq.1,and(b.gt."x",c.lt.2)"""
+    condiciones = []
+    for parte in _separar_nivel_superior(texto):
+        parte = parte.strip()
+        if parte.startswith(("and(", "or(")):
+            interno = parte[parte.index("(") + 1:-1]
+            condiciones.append(_filtro_logico(interno, all if parte.startswith("and") else any))
+            continue
+        columna, op, valor = parte.split(".", 2)
+        valor = valor[1:-1] if valor.startswith('"') and valor.endswith('"') else valor
+        condiciones.append(
+            lambda fila, columna=columna, op=op, valor=valor:
+                OPERADORES[op](_normalizar(fila.get(columna)), valor)
+        )
+    return lambda fila: conector(c(fila) for c in condiciones)
+
+# ============================================
+# QUERY BUILDER
+# ============================================
+
+@dataclass
+class RespuestaMemoria:
+    data: Any
+    count: Optional[int] = None
+
+class ConsultaMemoria:
+    """Query builder con la misma interfaz encadenable que el de postgrest"""
+
+    def __init__(self, base: "ClienteMemoria", tabla: str):
+        self._base = base
+        self._tabla = tabla
+        self._accion = "select"
+        self._columnas: Optional[List[str]] = None
+        self._valores: Any = None
+        self._filtros: List[Callable[[Dict], bool]] = []
+        self._orden: List[tuple] = []
+        self._limite: Optional[int] = None
+        # Usados por app.metricas.etiquetas_consulta
+        self.path = f"/rest/v1/{tabla}"
+        self.http_method = "GET"
+
+    def _con_accion(self, accion: str, metodo: str, valores: Any = None) -> "ConsultaMemoria":
+        self._accion, self.http_method, self._valores = accion, metodo, valores
+        return self
+
+    # Acciones
+    def select(self, columnas: str = "*", **_) -> "ConsultaMemoria":
+        if columnas.strip() != "*":
+            self._columnas = [c.strip() for c in columnas.split(",")]
+        return self
+
+    def insert(self, valores: Any, **_) -> "ConsultaMemoria":
+        return self._con_accion("insert", "POST", valores)
+
+    def upsert(self, valores: Any, **_) -> "ConsultaMemoria":
+        return self._con_accion("upsert", "POST", valores)
+
+    def update(self, valores: Dict[str, Any], **_) -> "ConsultaMemoria":
+        return self._con_accion("update", "PATCH", valores)
+
+    def delete(self, **_) -> "ConsultaMemoria":
+        return self._con_accion("delete", "DELETE")
+
+    # Filtros
+    def _filtro(self, columna: str, op: str, valor: Any) -> "ConsultaMemoria":
+        valor = _normalizar(valor)
+        self._filtros.append(lambda fila: OPERADORES[op](_normalizar(fila.get(columna)), valor))
+        return self
+
+    def eq(self, columna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtro(columna, "eq", valor)
+
+    def neq(self, columna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtro(columna, "neq", valor)
+
+    def gt(self, columna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtro(columna, "gt", valor)
+
+    def gte(self, columna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtro(columna, "gte", valor)
+
+    def lt(self, columna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtro(columna, "lt", valor)
+
+    def lte(self, columna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtro(columna, "lte", valor)
+
+    def in_(self, columna: str, valores: List[Any]) -> "ConsultaMemoria":
+        permitidos = {_normalizar(v) for v in valores}
+        self._filtros.append(lambda fila: _normalizar(fila.get(columna)) in permitidos)
+        return self
+
+    def or_(self, filtros: str, **_) -> "ConsultaMemoria":
+        self._filtros.append(_filtro_logico(filtros, any))
+        return self
+
+    # Orden y límite
+    def order(self, columna: str, desc: bool = False, **_) -> "ConsultaMemoria":
+        self._orden.append((columna, desc))
+        return self
+
+    def limit(self, cantidad: int, **_) -> "ConsultaMemoria":
+        self._limite = cantidad
+        return self
+
+    def execute(self) -> RespuestaMemoria:
+        if self._base.latencia_segundos:
+            time.sleep(self._base.latencia_segundos)
+        with self._base.lock:
+            return RespuestaMemoria(copy.deepcopy(self._ejecutar()))
+
+    def _ejecutar(self) -> List[Dict[str, Any]]:
+        filas = self._base.tablas.setdefault(self._tabla, [])
+        coincide = lambda fila: all(f(fila) for f in self._filtros)
+
+        if self._accion in ("insert", "upsert"):
+            return [self._escribir(filas, v) for v in (
+                self._valores if isinstance(self._valores, list) else [self._valores]
+            )]
+
+        if self._accion == "update":
+            actualizadas = []
+            for fila in filas:
+                if coincide(fila):
+                    fila.update(self._valores)
+                    if self._tabla in CON_UPDATED_AT:
+                        fila["updated_at"] = _ahora()
+                    actualizadas.append(fila)
+            return actualizadas
+
+        if self._accion == "delete":
+            eliminadas = [f for f in filas if coincide(f)]
+            filas[:] = [f for f in filas if not coincide(f)]
+            return eliminadas
+
+        resultado = [f for f in filas if coincide(f)]
+        # Ordenar de la última clave a la primera (orden estable)
+        for columna, desc in reversed(self._orden):
+            resultado.sort(key=lambda f: (f.get(columna) is None, _normalizar(f.get(columna))), reverse=desc)
+        if self._limite is not None:
+            resultado = resultado[:self._limite]
+        if self._columnas:
+            resultado = [{c: f.get(c) for c in self._columnas} for f in resultado]
+        return resultado
+
+    def _escribir(self, filas: List[Dict[str, Any]], valores: Dict[str, Any]) -> Dict[str, Any]:
+        clave = CLAVES_PRIMARIAS.get(self._tabla, "id")
+        if self._accion == "upsert":
+            for fila in filas:
+                if fila.get(clave) == valores.get(clave):
+                    fila.update(valores)
+                    if self._tabla in CON_UPDATED_AT:
+                        fila["updated_at"] = _ahora()
+                    return fila
+
+        ahora = _ahora()
+        fila = {
+            **DEFAULTS.get(self._tabla, {}),
+            "id": str(uuid.uuid4()),
+            "created_at": ahora,
+            **({"updated_at": ahora} if self._tabla in CON_UPDATED_AT else {}),
+            **valores
+        }
+        filas.append(fila)
+        return fila
+
+# ============================================
+# CLIENTE
+# ============================================
+
+class ClienteMemoria:
+    """Reemplazo de supabase.Client con tablas en memoria (seguro entre hilos)"""
+
+    def __init__(self, latencia_ms: float = 0.0):
+        self.latencia_segundos = latencia_ms / 1000
+        self.tablas: Dict[str, List[Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+
+    def table(self, nombre: str) -> ConsultaMemoria:
+        return ConsultaMemoria(self, nombre)
+
+    from_ = table
+
+    def rpc(self, funcion: str, parametros: Optional[Dict[str, Any]] = None) -> Any:
+        raise NotImplementedError(f"Función RPC no soportada en el benchmark: {funcion}")
@@ -0,0 +1,67 @@
+# ============================================
+# CAPTURAR_NCE.PY - Grabación de un corpus de respuestas de NCE
+# ============================================
+#
+# Consulta todas las secciones de los gateways indicados (sin caché) y graba
+# cada intento HTTP en un corpus comprimido. El corpus se reproduce sin red
+# con NCE_REPLAY_FILE (y NCE_REPLAY_SPEED para acelerar o frenar) en la API,
+# en bench.carga (--nce-corpus) o en cualquier script de perfilado.
+#
+# Uso (desde backend/, con acceso a NCE):
+#     python -m scripts.capturar_nce AA:BB:CC:DD:EE:FF 112233445566 --salida corpus/nce.jsonl.gz
+#     python -m scripts.capturar_nce --archivo-macs macs.txt --salida corpus/nce.jsonl.gz
+
+import argparse
+import os
+
+from app.captura_nce import get_grabador, leer_corpus, mac_consultada
+from app.config import settings
+from app.gateway_analyzer import GatewayAnalyzer
+from app.models import normalizar_mac
+
+
+def capturar(macs: list, salida: str, incluir_eventos: bool) -> None:
+    settings.NCE_CAPTURE_FILE = salida
+    get_grabador.cache_clear()
+
+    for i, mac in enumerate(macs, 1):
+        datos = GatewayAnalyzer(forzar_actualizacion=True).analyze_gateway(mac, incluir_eventos)
+        faltantes = datos["secciones_faltantes"]
+        estado = f"⚠️ faltan {', '.join(faltantes)}" if faltantes else "✅"
+        print(f"... [{i}/{len(macs)}] {mac} {estado}")
+
+    registros = list(leer_corpus(salida))
+    gateways = {mac_consultada(r["params"], r["payload"]) for r in registros}
+    sin_comprimir = sum(len(r["cuerpo"] or "") for r in registros)
+    print(
+        f"✅ {salida}: {len(registros)} respuestas de {len(gateways)} gateways, "
+        f"{os.path.getsize(salida) / 1024:.0f} KB ({sin_comprimir / 1024:.0f} KB de cuerpos sin comprimir)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grabar respuestas de NCE para reproducirlas sin red")
+    parser.add_argument("macs", nargs="*", help="MACs a consultar")
+    parser.add_argument("--archivo-macs", help="Archivo con una MAC por línea")
+    parser.add_argument("--salida", default="corpus/nce.jsonl.gz", help="Corpus (se agrega si ya existe)")
+    parser.add_argument("--sin-eventos", action="store_true", help="No consultar eventos")
+    args = parser.parse_args()
+
+    entradas = list(args.macs)
+    if args.archivo_macs:
+        with open(args.archivo_macs) as f:
+            entradas += [linea.strip() for linea in f if linea.strip() and not linea.startswith("#")]
+
+    # Mismo formato que la API, para que el corpus coincida con las consultas reales
+    macs = []
+    for entrada in entradas:
+        try:
+            macs.append(normalizar_mac(entrada))
+        except ValueError:
+            parser.error(f"MAC inválida: {entrada!r}")
+    macs = list(dict.fromkeys(macs))
+    if not macs:
+        parser.error("Indicar al menos una MAC")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+    capturar(macs, args.salida, not args.sin_eventos)
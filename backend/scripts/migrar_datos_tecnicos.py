@@ -0,0 +1,64 @@
+# ============================================
+# MIGRAR_DATOS_TECNICOS.PY - Migración de análisis antiguos
+# ============================================
+#
+# Convierte los datos_tecnicos guardados como texto (JSON re-serializado con
+# encabezados) al formato estructurado por sección.
+#
+# Uso (desde backend/):
+#     python -m scripts.migrar_datos_tecnicos [--dry-run] [--lote 100]
+#
+# La API sigue leyendo las filas antiguas mientras tanto: el renderizado de
+# prompts acepta ambos formatos.
+
+import argparse
+
+from app.database import get_supabase_client
+from app.datos_tecnicos import FORMATO_DATOS, migrar_datos_tecnicos
+
+
+def migrar(lote: int, dry_run: bool) -> None:
+    supabase = get_supabase_client()
+    ultimo_id = None
+    revisadas = 0
+    migradas = 0
+
+    while True:
+        query = supabase.table("analisis_gateways")\
+            .select("id, datos_tecnicos")\
+            .order("id")\
+            .limit(lote)
+        if ultimo_id is not None:
+            query = query.gt("id", ultimo_id)
+        filas = query.execute().data
+
+        if not filas:
+            break
+
+        for fila in filas:
+            revisadas += 1
+            datos = fila["datos_tecnicos"] or {}
+            if not datos or datos.get("formato") == FORMATO_DATOS:
+                continue
+
+            if not dry_run:
+                supabase.table("analisis_gateways")\
+                    .update({"datos_tecnicos": migrar_datos_tecnicos(datos)})\
+                    .eq("id", fila["id"])\
+                    .execute()
+            migradas += 1
+
+        ultimo_id = filas[-1]["id"]
+        print(f"... {revisadas} filas revisadas, {migradas} migradas")
+
+    accion = "a migrar" if dry_run else "migradas"
+    print(f"✅ {revisadas} filas revisadas, {migradas} {accion}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrar datos_tecnicos al formato estructurado")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar filas a migrar")
+    parser.add_argument("--lote", type=int, default=100, help="Filas por consulta")
+    args = parser.parse_args()
+
+    migrar(args.lote, args.dry_run)
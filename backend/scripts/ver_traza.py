@@ -0,0 +1,98 @@
+# ============================================
+# VER_TRAZA.PY - Desglose de una traza exportada
+# ============================================
+#
+# Lee el archivo generado con TRACING_EXPORTER=jsonl y muestra el árbol de
+# spans de una traza: cuándo empezó cada etapa, cuánto tardó y sus atributos.
+#
+# Uso (desde backend/):
+#     python -m scripts.ver_traza <traza_id | analisis_id | mac> [--archivo trazas.jsonl]
+#
+# Con un analisis_id o una MAC se muestran todas las trazas que lo incluyen
+# (la solicitud que creó el análisis y el procesamiento en el worker comparten
+# traza).
+
+import argparse
+import json
+from collections import defaultdict
+from typing import Any, Dict, List
+
+# Atributos que ya se ven en el span padre y solo agregarían ruido
+ATRIBUTOS_OCULTOS = {"mac", "analisis_id", "usuario_id"}
+
+
+def cargar_spans(archivo: str) -> List[Dict[str, Any]]:
+    spans = []
+    with open(archivo, encoding="utf-8") as f:
+        for linea in f:
+            if linea.strip():
+                spans.append(json.loads(linea))
+    return spans
+
+
+def trazas_de(spans: List[Dict[str, Any]], identificador: str) -> List[str]:
+    """Trazas cuyo id coincide o que tienen un span con ese analisis_id o MAC"""
+    trazas = []
+    for s in spans:
+        atributos = s["atributos"]
+        if identificador in (s["traza_id"], atributos.get("analisis_id"), atributos.get("mac")):
+            if s["traza_id"] not in trazas:
+                trazas.append(s["traza_id"])
+    return trazas
+
+
+def imprimir_traza(spans: List[Dict[str, Any]]) -> None:
+    inicio = min(s["inicio"] for s in spans)
+    ids = {s["span_id"] for s in spans}
+    hijos = defaultdict(list)
+    raices = []
+    for s in sorted(spans, key=lambda s: s["inicio"]):
+        if s["padre_id"] in ids:
+            hijos[s["padre_id"]].append(s)
+        else:
+            raices.append(s)
+
+    def imprimir(s: Dict[str, Any], nivel: int) -> None:
+        offset = (s["inicio"] - inicio) * 1000
+        atributos = {
+            k: v for k, v in s["atributos"].items()
+            if k not in ATRIBUTOS_OCULTOS or nivel == 0
+        }
+        marca = "" if s["estado"] == "ok" else f" [{s['estado']}]"
+        print(
+            f"{offset:>9.1f} ms {s['duracion_ms']:>9.1f} ms  "
+            f"{'  ' * nivel}{s['nombre']}{marca}  "
+            f"{json.dumps(atributos, ensure_ascii=False) if atributos else ''}"
+        )
+        if s.get("error"):
+            print(f"{'':>26}{'  ' * nivel}! {s['error']}")
+        for hijo in hijos[s["span_id"]]:
+            imprimir(hijo, nivel + 1)
+
+    for raiz in raices:
+        imprimir(raiz, 0)
+
+    # Tiempo total por tipo de etapa (los spans en paralelo se suman)
+    totales = defaultdict(lambda: [0, 0.0])
+    for s in spans:
+        totales[s["nombre"]][0] += 1
+        totales[s["nombre"]][1] += s["duracion_ms"] or 0
+    print("\n  Etapa                               Spans     Total")
+    for nombre, (cantidad, total) in sorted(totales.items(), key=lambda t: -t[1][1]):
+        print(f"  {nombre:<35} {cantidad:>5} {total:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mostrar el desglose de una traza")
+    parser.add_argument("id", help="traza_id, analisis_id o MAC")
+    parser.add_argument("--archivo", default="trazas.jsonl", help="Archivo JSONL de trazas")
+    args = parser.parse_args()
+
+    spans = cargar_spans(args.archivo)
+    trazas = trazas_de(spans, args.id)
+    if not trazas:
+        print(f"❌ No hay trazas para {args.id} en {args.archivo}")
+
+    for traza_id in trazas:
+        print(f"\n🔎 Traza {traza_id}\n")
+        imprimir_traza([s for s in spans if s["traza_id"] == traza_id])
@@ -0,0 +1,27 @@
+# ============================================
+# CONFTEST.PY - Configuración común de las pruebas
+# ============================================
+#
+# app.config exige las credenciales al importarse; las pruebas unitarias no
+# se conectan a ningún servicio, así que bastan valores de relleno.
+#
+# Uso (desde backend/):
+#     python -m pytest tests
+
+import os
+
+ENTORNO_PRUEBAS = {
+    "SUPABASE_URL": "http://supabase.local",
+    "SUPABASE_KEY": "pruebas",
+    "SUPABASE_SERVICE_KEY": "pruebas",
+    "GATEWAY_BASE_URL": "http://nce.local",
+    "GATEWAY_USERNAME": "pruebas",
+    "GATEWAY_PASSWORD": "pruebas",
+    "GOOGLE_API_KEY": "pruebas",
+    "JWT_SECRET_KEY": "pruebas",
+    "ADMIN_EMAIL": "pruebas@smartwifi.cl",
+    "ADMIN_PASSWORD": "pruebas",
+}
+
+for clave, valor in ENTORNO_PRUEBAS.items():
+    os.environ.setdefault(clave, valor)
@@ -0,0 +1,135 @@
+# ============================================
+# TEST_RESILIENCIA.PY - Circuit breaker y backoff
+# ============================================
+
+from types import SimpleNamespace
+
+import pytest
+
+from app import resiliencia
+from app.resiliencia import CircuitBreaker, espera_reintento
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj manual para app.resiliencia (avanzar con reloj.ahora += segundos)"""
+    falso = SimpleNamespace(ahora=1000.0)
+    falso.monotonic = lambda: falso.ahora
+    monkeypatch.setattr(resiliencia, "time", falso)
+    return falso
+
+
+def abrir(circuito: CircuitBreaker) -> None:
+    for _ in range(circuito.umbral_fallos):
+        assert circuito.permitir()
+        circuito.registrar(False)
+
+
+def test_se_abre_tras_el_umbral_de_fallos(reloj):
+    circuito = CircuitBreaker("nce", umbral_fallos=3, segundos_reapertura=30)
+
+    for _ in range(2):
+        assert circuito.permitir()
+        circuito.registrar(False)
+    assert circuito.estadisticas()["estado"] == CircuitBreaker.CERRADO
+
+    assert circuito.permitir()
+    circuito.registrar(False)
+    assert circuito.estadisticas()["estado"] == CircuitBreaker.ABIERTO
+    assert not circuito.permitir()
+    assert circuito.estadisticas()["rechazadas"] == 1
+    assert circuito.estadisticas()["aperturas"] == 1
+
+
+def test_un_exito_reinicia_los_fallos_consecutivos(reloj):
+    circuito = CircuitBreaker("nce", umbral_fallos=2, segundos_reapertura=30)
+
+    circuito.permitir()
+    circuito.registrar(False)
+    circuito.permitir()
+    circuito.registrar(True)
+    circuito.permitir()
+    circuito.registrar(False)
+
+    estadisticas = circuito.estadisticas()
+    assert estadisticas["estado"] == CircuitBreaker.CERRADO
+    assert estadisticas["fallos_consecutivos"] == 1
+
+
+def test_semiabierto_deja_pasar_una_sola_prueba(reloj):
+    circuito = CircuitBreaker("nce", umbral_fallos=1, segundos_reapertura=30)
+    abrir(circuito)
+
+    reloj.ahora += 29
+    assert not circuito.permitir()
+
+    reloj.ahora += 1
+    assert circuito.estadisticas()["estado"] == CircuitBreaker.SEMIABIERTO
+    assert circuito.permitir()
+    assert not circuito.permitir()
+
+
+def test_prueba_exitosa_cierra_el_circuito(reloj):
+    circuito = CircuitBreaker("nce", umbral_fallos=1, segundos_reapertura=30)
+    abrir(circuito)
+    reloj.ahora += 30
+
+    assert circuito.permitir()
+    circuito.registrar(True)
+
+    assert circuito.estadisticas()["estado"] == CircuitBreaker.CERRADO
+    assert circuito.permitir()
+    assert circuito.permitir()
+
+
+def test_prueba_fallida_vuelve_a_abrir(reloj):
+    circuito = CircuitBreaker("nce", umbral_fallos=3, segundos_reapertura=30)
+    abrir(circuito)
+    reloj.ahora += 30
+
+    # En semiabierto basta un fallo, aunque el umbral sea mayor
+    assert circuito.permitir()
+    circuito.registrar(False)
+
+    assert circuito.estadisticas()["estado"] == CircuitBreaker.ABIERTO
+    assert circuito.estadisticas()["aperturas"] == 2
+    assert not circuito.permitir()
+
+    # La reapertura cuenta desde el último fallo
+    reloj.ahora += 30
+    assert circuito.permitir()
+
+
+def test_devolver_libera_la_prueba_sin_cambiar_el_estado(reloj):
+    circuito = CircuitBreaker("nce", umbral_fallos=1, segundos_reapertura=30)
+    abrir(circuito)
+    reloj.ahora += 30
+
+    assert circuito.permitir()
+    # p. ej. no hubo cupo de concurrencia: la prueba nunca llegó a NCE
+    circuito.devolver()
+
+    estadisticas = circuito.estadisticas()
+    assert estadisticas["estado"] == CircuitBreaker.SEMIABIERTO
+    assert estadisticas["aperturas"] == 1
+    assert circuito.permitir()
+    assert not circuito.permitir()
+
+
+def test_devolver_en_cerrado_no_cuenta_exito_ni_fallo(reloj):
+    circuito = CircuitBreaker("nce", umbral_fallos=2, segundos_reapertura=30)
+    circuito.permitir()
+    circuito.registrar(False)
+
+    circuito.permitir()
+    circuito.devolver()
+
+    estadisticas = circuito.estadisticas()
+    assert estadisticas["estado"] == CircuitBreaker.CERRADO
+    assert estadisticas["fallos_consecutivos"] == 1
+
+
+def test_espera_reintento_acotada():
+    for intento in range(8):
+        espera = espera_reintento(intento, base=0.5, maximo=4.0)
+        assert 0 <= espera <= min(4.0, 0.5 * 2 ** intento)
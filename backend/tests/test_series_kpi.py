@@ -0,0 +1,302 @@
+# ============================================
+# TEST_SERIES_KPI.PY - Series de KPIs de la flota
+# ============================================
+
+import base64
+import gzip
+import json
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.series_kpi import (
+    NIVEL_1D,
+    NIVEL_1H,
+    NIVEL_5M,
+    AlmacenKPI,
+    Nivel,
+    SerieKPI,
+    elegir_nivel,
+    extraer_muestras,
+    resumir,
+)
+
+# Medianoche UTC: las horas y días de las pruebas empiezan en un intervalo exacto
+DIA = int(datetime(2026, 10, 1, tzinfo=timezone.utc).timestamp())
+
+RETENCION = {NIVEL_5M: 2, NIVEL_1H: 30, NIVEL_1D: 365}
+
+
+def cada_5m(inicio: int, cantidad: int, valor=lambda i: float(i)) -> dict:
+    return {inicio + i * 300: valor(i) for i in range(cantidad)}
+
+
+# ============================================
+# AGREGACIÓN POR NIVELES
+# ============================================
+
+def test_agrega_las_muestras_en_horas_y_dias():
+    serie = SerieKPI(AlmacenKPI(RETENCION).capacidades)
+
+    # Dos horas completas: 0..11 y 12..23
+    assert serie.registrar(cada_5m(DIA, 24)) == 24
+
+    hora = serie.niveles[NIVEL_1H]
+    assert list(hora.intervalos) == [DIA // 3600, DIA // 3600 + 1]
+    assert list(hora.cuentas) == [12, 12]
+    assert list(hora.sumas) == [sum(range(12)), sum(range(12, 24))]
+    assert list(hora.minimos) == [0, 12]
+    assert list(hora.maximos) == [11, 23]
+
+    dia = serie.niveles[NIVEL_1D]
+    assert list(dia.cuentas) == [24]
+    assert dia.sumas[0] == sum(range(24))
+    assert (dia.minimos[0], dia.maximos[0]) == (0, 23)
+
+
+def test_muestras_repetidas_no_se_cuentan_dos_veces():
+    serie = SerieKPI(AlmacenKPI(RETENCION).capacidades)
+    serie.registrar(cada_5m(DIA, 12))
+
+    # Las consultas de PM se solapan: la segunda trae parte de la primera
+    serie.registrar(cada_5m(DIA + 6 * 300, 12, valor=lambda i: float(i + 6)))
+
+    hora = serie.niveles[NIVEL_1H]
+    assert list(hora.cuentas) == [12, 6]
+    assert len(serie.niveles[NIVEL_5M]) == 18
+    assert serie.niveles[NIVEL_1D].cuentas[0] == 18
+
+
+def test_reemplazar_una_muestra_recalcula_el_agregado():
+    serie = SerieKPI(AlmacenKPI(RETENCION).capacidades)
+    serie.registrar({DIA: 10.0, DIA + 300: 20.0})
+    serie.registrar({DIA + 300: 40.0})
+
+    hora = serie.niveles[NIVEL_1H]
+    assert (hora.cuentas[0], hora.sumas[0], hora.maximos[0]) == (2, 50.0, 40.0)
+
+
+# ============================================
+# RETENCIÓN
+# ============================================
+
+def test_nivel_recorta_por_bloques_al_exceder_la_capacidad():
+    nivel = Nivel(300, capacidad=20)
+
+    # Se tolera un exceso de hasta el 10% antes de mover los arrays
+    for intervalo in range(22):
+        nivel.fijar(intervalo, 1, 1.0, 1.0, 1.0)
+    assert len(nivel) == 22
+
+    nivel.fijar(22, 1, 1.0, 1.0, 1.0)
+    assert len(nivel) == 20
+    assert nivel.intervalos[0] == 3
+    assert nivel.intervalos[-1] == 22
+    assert all(len(columna) == 20 for columna in nivel._columnas())
+
+
+def test_serie_ignora_muestras_anteriores_a_la_retencion():
+    capacidades = {NIVEL_5M: 12, NIVEL_1H: 24, NIVEL_1D: 30}
+    serie = SerieKPI(capacidades)
+    serie.registrar(cada_5m(DIA, 12))
+
+    # Con el nivel fino lleno, lo que queda fuera de la ventana no se guarda
+    assert serie.registrar({DIA - 3600: 99.0}) == 0
+    assert serie.registrar({DIA + 12 * 300: 12.0}) == 1
+    assert serie.niveles[NIVEL_5M].intervalos[-1] == (DIA + 12 * 300) // 300
+
+
+def test_una_llamada_mayor_que_la_retencion_agrega_todas_las_horas():
+    serie = SerieKPI({NIVEL_5M: 12, NIVEL_1H: 48, NIVEL_1D: 30})
+
+    # Tres horas de una vez (p. ej. el primer ciclo tras un corte) con 1h de retención fina
+    assert serie.registrar(cada_5m(DIA, 36, valor=lambda i: 1.0)) == 36
+
+    assert len(serie.niveles[NIVEL_5M]) <= 12 + 1
+    assert list(serie.niveles[NIVEL_1H].cuentas) == [12, 12, 12]
+    assert serie.niveles[NIVEL_1D].cuentas[0] == 36
+
+
+def test_capacidades_segun_dias_de_retencion():
+    capacidades = AlmacenKPI(RETENCION).capacidades
+    assert capacidades == {NIVEL_5M: 2 * 288, NIVEL_1H: 30 * 24, NIVEL_1D: 365}
+
+
+# ============================================
+# CONSULTAS
+# ============================================
+
+def test_elegir_nivel_usa_el_mas_fino_que_cubre_el_rango():
+    serie = SerieKPI({NIVEL_5M: 12, NIVEL_1H: 48, NIVEL_1D: 30})
+    serie.registrar(cada_5m(DIA, 48))
+
+    fin = DIA + 48 * 300
+    # El nivel de 5m guarda solo la última hora
+    assert elegir_nivel(serie, fin - 3600, fin) == NIVEL_5M
+    assert elegir_nivel(serie, DIA, fin) == NIVEL_1H
+
+
+def test_consultar_y_resumir():
+    almacen = AlmacenKPI(RETENCION)
+    almacen.registrar("AA:BB:CC:DD:EE:FF", {"avg-latency": cada_5m(DIA, 24)})
+
+    desde = datetime.fromtimestamp(DIA, tz=timezone.utc)
+    nivel, puntos = almacen.consultar(
+        "AA:BB:CC:DD:EE:FF", "avg-latency", desde, desde + timedelta(hours=2), NIVEL_1H
+    )
+    assert nivel == NIVEL_1H
+    assert [p["promedio"] for p in puntos] == [5.5, 17.5]
+
+    resumen = resumir(puntos)
+    assert resumen["muestras"] == 24
+    assert resumen["promedio"] == 11.5
+    assert (resumen["minimo"], resumen["maximo"]) == (0, 23)
+    # +12 por hora
+    assert resumen["pendiente_por_dia"] == pytest.approx(12 * 24)
+
+    assert almacen.consultar("AA:BB:CC:DD:EE:FF", "packet-loss", desde, desde) is None
+
+
+def test_max_kpis_no_crea_series_nuevas(capsys):
+    almacen = AlmacenKPI(RETENCION)
+    muestras = {"avg-latency": {DIA: 1.0}, "packet-loss": {DIA: 2.0}, "wifi-coverage": {DIA: 3.0}}
+
+    assert almacen.registrar("AA:BB:CC:DD:EE:FF", muestras, max_kpis=2) == 2
+    assert almacen.kpis("AA:BB:CC:DD:EE:FF") == ["avg-latency", "packet-loss"]
+    assert "wifi-coverage" in capsys.readouterr().out
+
+    # Se avisa una sola vez por serie
+    almacen.registrar("AA:BB:CC:DD:EE:FF", muestras, max_kpis=2)
+    assert capsys.readouterr().out == ""
+    assert almacen.estadisticas()["series_descartadas"] == 1
+
+
+# ============================================
+# INSTANTÁNEA A DISCO
+# ============================================
+
+def poblar(almacen: AlmacenKPI) -> None:
+    almacen.registrar("AA:BB:CC:DD:EE:FF", {
+        "avg-latency": cada_5m(DIA, 30, valor=lambda i: 10.0 + i),
+        "packet-loss": cada_5m(DIA, 30, valor=lambda i: i / 4)
+    })
+    almacen.registrar("11:22:33:44:55:66", {"avg-latency": cada_5m(DIA + 86400, 5)})
+
+
+def series(almacen: AlmacenKPI) -> dict:
+    return {
+        (mac, kpi, nombre): [list(columna) for columna in nivel._columnas()]
+        for mac, kpis in almacen._series.items()
+        for kpi, serie in kpis.items()
+        for nombre, nivel in serie.niveles.items()
+    }
+
+
+def test_instantanea_ida_y_vuelta(tmp_path):
+    ruta = str(tmp_path / "series" / "flota.json.gz")
+    original = AlmacenKPI(RETENCION)
+    poblar(original)
+
+    original.guardar(ruta)
+    assert original.cambios == 0
+
+    restaurado = AlmacenKPI(RETENCION)
+    assert restaurado.cargar(ruta) == 3
+    assert series(restaurado) == series(original)
+    assert restaurado.ultimo("11:22:33:44:55:66") == original.ultimo("11:22:33:44:55:66")
+
+
+def test_instantanea_de_otra_arquitectura(tmp_path):
+    ruta = str(tmp_path / "flota.json.gz")
+    original = AlmacenKPI(RETENCION)
+    poblar(original)
+    original.guardar(ruta)
+
+    # Reescribir las columnas con el orden de bytes contrario
+    with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+        contenido = json.load(archivo)
+    tipos = dict(zip(("intervalos", "cuentas", "sumas", "minimos", "maximos"), "iHfff"))
+    for kpis in contenido["series"].values():
+        for niveles in kpis.values():
+            for columnas in niveles.values():
+                for nombre, datos in columnas.items():
+                    columna = array(tipos[nombre], base64.b64decode(datos))
+                    columna.byteswap()
+                    columnas[nombre] = base64.b64encode(columna.tobytes()).decode("ascii")
+    contenido["byteorder"] = "big" if sys.byteorder == "little" else "little"
+    with gzip.open(ruta, "wt", encoding="utf-8") as archivo:
+        json.dump(contenido, archivo)
+
+    restaurado = AlmacenKPI(RETENCION)
+    restaurado.cargar(ruta)
+    assert series(restaurado) == series(original)
+
+
+def test_instantanea_de_version_desconocida(tmp_path):
+    ruta = str(tmp_path / "flota.json.gz")
+    with gzip.open(ruta, "wt", encoding="utf-8") as archivo:
+        json.dump({"version": 99, "series": {}}, archivo)
+
+    with pytest.raises(ValueError):
+        AlmacenKPI(RETENCION).cargar(ruta)
+
+
+# ============================================
+# EXTRACCIÓN DE MUESTRAS DE PM
+# ============================================
+
+def test_extrae_indicadores_anidados_por_registro():
+    datos = {"huawei-nce-homeinsight-performance-management:output": {"pm-datas": [
+        {"collect-time": "2026-10-01T00:00:00.000Z", "indicators": {"avg-latency": 12, "packet-loss": "0.5"}},
+        {"collect-time": "2026-10-01T00:05:00Z", "indicators": {"avg-latency": 15, "packet-loss": 1}},
+    ]}}
+
+    assert extraer_muestras(datos) == {
+        "avg-latency": {DIA: 12.0, DIA + 300: 15.0},
+        "packet-loss": {DIA: 0.5, DIA + 300: 1.0},
+    }
+
+
+def test_extrae_pares_nombre_valor_y_epoch_en_milisegundos():
+    datos = {"pm-datas": [{
+        "timestamp": (DIA + 600) * 1000,
+        "kpis": [
+            {"indicator-name": "pm:wifi-coverage", "indicator-value": "87"},
+            {"indicator-name": "wifi-interference", "indicator-value": 30},
+        ]
+    }]}
+
+    assert extraer_muestras(datos) == {
+        "wifi-coverage": {DIA + 600: 87.0},
+        "wifi-interference": {DIA + 600: 30.0},
+    }
+
+
+def test_ignora_identificadores_valores_no_numericos_y_registros_sin_tiempo():
+    datos = {"pm-datas": [
+        {
+            "collect-time": str(DIA),
+            "gateway-id": 7,
+            "lan-port": 2,
+            "port-index": 1,
+            "serial-no": "123456",
+            "online": True,
+            "rssi": float("nan"),
+            "estado": "ok",
+            "user-num": 3,
+            "avg-latency": 20,
+        },
+        {"avg-latency": 99},
+    ]}
+
+    assert extraer_muestras(datos) == {"user-num": {DIA: 3.0}, "avg-latency": {DIA: 20.0}}
+
+
+def test_filtra_por_la_lista_de_kpis():
+    datos = {"pm-datas": [{"collect-time": str(DIA), "gateway-id": 7, "avg-latency": 20, "packet-loss": 1}]}
+
+    assert extraer_muestras(datos, ["avg-latency"]) == {"avg-latency": {DIA: 20.0}}
+    # Con lista explícita se respeta aunque el nombre parezca un identificador
+    assert extraer_muestras(datos, ["gateway-id"]) == {"gateway-id": {DIA: 7.0}}
@@ -0,0 +1,167 @@
+'use client'
+
+import { useCallback, useEffect, useRef, useState } from 'react'
+import { useQuery, useQueryClient } from '@tanstack/react-query'
+import { analisis as analisisApi } from '@/lib/api'
+import Link from 'next/link'
+import { AlertCircle, ArrowLeft, FileText, Wifi } from 'lucide-react'
+
+// Estados en los que el worker todavía no termina el análisis
+const EN_CURSO = ['pendiente', 'procesando']
+
+export default function AnalisisDetallePage({ params }: { params: { id: string } }) {
+  const { id } = params
+  const queryClient = useQueryClient()
+  const [informe, setInforme] = useState('')
+  const [transmitiendo, setTransmitiendo] = useState(false)
+  const [terminado, setTerminado] = useState(false)
+  const [errorInforme, setErrorInforme] = useState<string | null>(null)
+  const streamRef = useRef<AbortController | null>(null)
+
+  // Consultar el estado cada 2s mientras el análisis está en la cola o procesándose
+  const { data: estado, isLoading, dataUpdatedAt } = useQuery({
+    queryKey: ['analisis', id, 'estado'],
+    queryFn: () => analisisApi.estado(id),
+    refetchInterval: (query) =>
+      EN_CURSO.includes(query.state.data?.estado) ? 2000 : false,
+  })
+
+  const abrirStream = useCallback(() => {
+    const controller = new AbortController()
+    streamRef.current = controller
+    setInforme('')
+    setErrorInforme(null)
+    setTransmitiendo(true)
+
+    analisisApi
+      .streamInforme(
+        id,
+        (evento, datos) => {
+          if (evento === 'token') {
+            setInforme((previo) => previo + datos.texto)
+          } else if (evento === 'fin') {
+            setTerminado(true)
+            queryClient.invalidateQueries({ queryKey: ['analisis'] })
+          } else if (evento === 'error') {
+            setTerminado(true)
+            setErrorInforme(datos.detail)
+          }
+        },
+        controller.signal
+      )
+      .catch(() => {
+        // 409 mientras no hay datos técnicos: se reintenta con la próxima consulta de estado
+        if (!controller.signal.aborted) streamRef.current = null
+      })
+      .finally(() => setTransmitiendo(false))
+  }, [id, queryClient])
+
+  // Engancharse al informe en cuanto el worker tiene los datos técnicos
+  useEffect(() => {
+    if (!estado || estado.estado === 'pendiente' || estado.estado === 'error') return
+    if (streamRef.current || terminado) return
+    abrirStream()
+  }, [estado, dataUpdatedAt, terminado, abrirStream])
+
+  useEffect(() => () => streamRef.current?.abort(), [])
+
+  if (isLoading) {
+    return (
+      <div className="flex items-center justify-center min-h-screen">
+        <div className="spinner w-8 h-8" />
+      </div>
+    )
+  }
+
+  if (!estado) {
+    return (
+      <div className="card text-center py-12">
+        <p className="text-slate-600 mb-4">Análisis no encontrado</p>
+        <Link href="/analisis" className="btn btn-primary inline-flex">
+          Volver a mis análisis
+        </Link>
+      </div>
+    )
+  }
+
+  return (
+    <div className="max-w-4xl mx-auto space-y-8">
+      {/* Header */}
+      <div>
+        <Link
+          href="/analisis"
+          className="inline-flex items-center gap-2 text-sm text-slate-600 hover:text-slate-900"
+        >
+          <ArrowLeft className="w-4 h-4" />
+          Mis análisis
+        </Link>
+        <div className="flex items-center justify-between mt-4">
+          <div className="flex items-center gap-4">
+            <div className="w-12 h-12 bg-primary-100 rounded-lg flex items-center justify-center">
+              <Wifi className="w-6 h-6 text-primary-600" />
+            </div>
+            <h1 className="text-3xl font-bold text-slate-900 font-mono">
+              {estado.mac_address}
+            </h1>
+          </div>
+          <span className={`badge ${
+            estado.estado === 'completado' ? 'badge-success' : 'badge-warning'
+          }`}>
+            {estado.estado}
+          </span>
+        </div>
+      </div>
+
+      {/* Progreso */}
+      {EN_CURSO.includes(estado.estado) && !informe && (
+        <div className="p-4 bg-yellow-50 border border-yellow-200 rounded-lg">
+          <div className="flex gap-3">
+            <div className="spinner w-5 h-5 text-yellow-600" />
+            <div className="text-sm">
+              <p className="font-medium text-yellow-900 mb-1">
+                {estado.estado === 'pendiente' ? 'Análisis en cola...' : 'Consultando el gateway...'}
+              </p>
+              <p className="text-yellow-700">
+                El informe aparecerá aquí a medida que se genera.
+              </p>
+            </div>
+          </div>
+        </div>
+      )}
+
+      {/* Error */}
+      {(estado.estado === 'error' || errorInforme) && !transmitiendo && (
+        <div className="p-4 bg-red-50 border border-red-200 rounded-lg">
+          <div className="flex gap-3">
+            <AlertCircle className="w-5 h-5 text-red-600 flex-shrink-0 mt-0.5" />
+            <div className="text-sm">
+              <p className="font-medium text-red-900 mb-1">No se pudo completar el análisis</p>
+              <p className="text-red-700">{errorInforme || estado.error_detalle}</p>
+              <button
+                onClick={() => {
+                  setTerminado(false)
+                  abrirStream()
+                }}
+                className="btn btn-secondary mt-3"
+              >
+                Reintentar informe
+              </button>
+            </div>
+          </div>
+        </div>
+      )}
+
+      {/* Informe */}
+      {informe && (
+        <div className="card">
+          <div className="flex items-center gap-2 mb-4">
+            <FileText className="w-5 h-5 text-primary-600" />
+            <h2 className="font-semibold text-slate-900">Informe IA</h2>
+            {transmitiendo && <div className="spinner w-4 h-4" />}
+          </div>
+          <div className="whitespace-pre-wrap text-sm text-slate-700">{informe}</div>
+        </div>
+      )}
+    </div>
+  )
+}
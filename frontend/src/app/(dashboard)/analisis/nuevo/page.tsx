@@ -16,7 +16,7 @@ export default function NuevoAnalisisPage() {
     mutationFn: (data: { mac_address: string; incluir_eventos: boolean }) =>
       analisisApi.crear(data),
     onSuccess: (data) => {
-      toast.success('¡Análisis completado exitosamente!')
+      toast.success('Análisis iniciado. Se está procesando en segundo plano.')
       router.push(`/analisis/${data.id}`)
     },
     onError: (error: any) => {
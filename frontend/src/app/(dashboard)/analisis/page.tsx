@@ -1,6 +1,6 @@
 'use client'
 
-import { useQuery } from '@tanstack/react-query'
+import { useInfiniteQuery } from '@tanstack/react-query'
 import { analisis } from '@/lib/api'
 import Link from 'next/link'
 import { FileText, Clock, Wifi } from 'lucide-react'
@@ -8,11 +8,15 @@ import { formatDistanceToNow } from 'date-fns'
 import { es } from 'date-fns/locale'
 
 export default function AnalisisListPage() {
-  const { data, isLoading } = useQuery({
+  const { data: paginas, isLoading, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
     queryKey: ['analisis'],
-    queryFn: () => analisis.listar({ limit: 50 }),
+    queryFn: ({ pageParam }) => analisis.listar({ limit: 50, cursor: pageParam }),
+    initialPageParam: undefined as string | undefined,
+    getNextPageParam: (ultima) => ultima.next_cursor ?? undefined,
   })
 
+  const data = paginas?.pages.flatMap((pagina) => pagina.items)
+
   if (isLoading) {
     return (
       <div className="flex items-center justify-center min-h-screen">
@@ -73,6 +77,15 @@ export default function AnalisisListPage() {
               </div>
             </Link>
           ))}
+          {hasNextPage && (
+            <button
+              onClick={() => fetchNextPage()}
+              disabled={isFetchingNextPage}
+              className="btn btn-secondary"
+            >
+              {isFetchingNextPage ? 'Cargando...' : 'Cargar más'}
+            </button>
+          )}
         </div>
       )}
     </div>
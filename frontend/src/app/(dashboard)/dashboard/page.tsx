@@ -21,7 +21,7 @@ export default function DashboardPage() {
   // Obtener análisis recientes del usuario
   const { data: analisisRecientes, isLoading: loadingAnalisis } = useQuery({
     queryKey: ['analisis', 'recientes'],
-    queryFn: () => analisis.listar({ limit: 5 }),
+    queryFn: async () => (await analisis.listar({ limit: 5 })).items,
   })
 
   // Obtener estadísticas globales (solo admin)
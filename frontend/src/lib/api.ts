@@ -70,6 +70,60 @@ apiClient.interceptors.response.use(
   }
 )
 
+// ============================================
+// STREAMING (SERVER-SENT EVENTS)
+// ============================================
+
+// EventSource no permite enviar el header Authorization ni usar POST,
+// por eso el stream se consume con fetch
+export const streamSSE = async (
+  path: string,
+  body: unknown,
+  onEvento: (evento: string, datos: any) => void,
+  signal?: AbortSignal
+) => {
+  const { token } = useAuthStore.getState()
+  const response = await fetch(`${API_URL}${path}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    body: JSON.stringify(body ?? {}),
+    signal,
+  })
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Error ${response.status} al iniciar el stream`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    let fin = buffer.indexOf('\n\n')
+    while (fin >= 0) {
+      const bloque = buffer.slice(0, fin)
+      buffer = buffer.slice(fin + 2)
+
+      let evento = 'message'
+      let datos = ''
+      for (const linea of bloque.split('\n')) {
+        if (linea.startsWith('event: ')) evento = linea.slice(7)
+        else if (linea.startsWith('data: ')) datos += linea.slice(6)
+      }
+      onEvento(evento, datos ? JSON.parse(datos) : null)
+
+      fin = buffer.indexOf('\n\n')
+    }
+  }
+}
+
 // ============================================
 // FUNCIONES DE API - AUTH
 // ============================================
@@ -143,7 +197,7 @@ export const analisis = {
   
   listar: async (params?: {
     limit?: number
-    offset?: number
+    cursor?: string
   }) => {
     const response = await apiClient.get('/api/analisis', { params })
     return response.data
@@ -154,6 +208,17 @@ export const analisis = {
     return response.data
   },
   
+  estado: async (id: string) => {
+    const response = await apiClient.get(`/api/analisis/${id}/estado`)
+    return response.data
+  },
+  
+  streamInforme: (
+    id: string,
+    onEvento: (evento: string, datos: any) => void,
+    signal?: AbortSignal
+  ) => streamSSE(`/api/analisis/${id}/informe/stream`, {}, onEvento, signal),
+  
   eliminar: async (id: string) => {
     const response = await apiClient.delete(`/api/analisis/${id}`)
     return response.data
@@ -173,8 +238,20 @@ export const chat = {
     return response.data
   },
   
-  historial: async (analisis_id: string) => {
-    const response = await apiClient.get(`/api/chat/${analisis_id}`)
+  enviarStream: (
+    data: {
+      analisis_id: string
+      pregunta: string
+    },
+    onEvento: (evento: string, datos: any) => void,
+    signal?: AbortSignal
+  ) => streamSSE('/api/chat/stream', data, onEvento, signal),
+  
+  historial: async (analisis_id: string, params?: {
+    limit?: number
+    cursor?: string
+  }) => {
+    const response = await apiClient.get(`/api/chat/${analisis_id}`, { params })
     return response.data
   },
 }
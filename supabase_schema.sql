@@ -33,14 +33,19 @@ CREATE TABLE analisis_gateways (
     mac_address VARCHAR(17) NOT NULL,
     datos_tecnicos JSONB NOT NULL,
     informe_ia TEXT,
+    informe_desde_cache BOOLEAN DEFAULT false,
     estado VARCHAR(50) DEFAULT 'completado',
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    error_detalle TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Índices
 CREATE INDEX idx_analisis_usuario ON analisis_gateways(usuario_id);
 CREATE INDEX idx_analisis_mac ON analisis_gateways(mac_address);
 CREATE INDEX idx_analisis_fecha ON analisis_gateways(created_at DESC);
+-- Paginación por cursor (created_at, id) del listado de cada usuario
+CREATE INDEX idx_analisis_usuario_fecha ON analisis_gateways(usuario_id, created_at DESC, id DESC);
 
 -- ============================================
 -- TABLA: HISTORIAL DE CHAT
@@ -57,6 +62,22 @@ CREATE TABLE chat_historial (
 -- Índices
 CREATE INDEX idx_chat_analisis ON chat_historial(analisis_id);
 CREATE INDEX idx_chat_usuario ON chat_historial(usuario_id);
+-- Paginación por cursor (created_at, id) del historial de cada análisis
+CREATE INDEX idx_chat_analisis_fecha ON chat_historial(analisis_id, created_at, id);
+
+-- ============================================
+-- TABLA: MEMORIA DE CHAT
+-- ============================================
+-- Resumen de los turnos antiguos de cada conversación; los turnos hasta
+-- (resumido_hasta, resumido_hasta_id) ya están incorporados al resumen
+CREATE TABLE chat_memoria (
+    analisis_id UUID PRIMARY KEY REFERENCES analisis_gateways(id) ON DELETE CASCADE,
+    resumen TEXT NOT NULL DEFAULT '',
+    turnos_resumidos INTEGER NOT NULL DEFAULT 0,
+    resumido_hasta TIMESTAMP WITH TIME ZONE,
+    resumido_hasta_id UUID,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
 
 -- ============================================
 -- TABLA: SESIONES
@@ -93,6 +114,18 @@ CREATE TRIGGER trigger_usuarios_updated
     FOR EACH ROW
     EXECUTE FUNCTION actualizar_timestamp();
 
+-- Trigger para análisis (seguimiento de cambios de estado)
+CREATE TRIGGER trigger_analisis_updated
+    BEFORE UPDATE ON analisis_gateways
+    FOR EACH ROW
+    EXECUTE FUNCTION actualizar_timestamp();
+
+-- Trigger para memoria de chat
+CREATE TRIGGER trigger_chat_memoria_updated
+    BEFORE UPDATE ON chat_memoria
+    FOR EACH ROW
+    EXECUTE FUNCTION actualizar_timestamp();
+
 -- ============================================
 -- ROW LEVEL SECURITY (RLS)
 -- ============================================
@@ -101,6 +134,7 @@ CREATE TRIGGER trigger_usuarios_updated
 ALTER TABLE usuarios ENABLE ROW LEVEL SECURITY;
 ALTER TABLE analisis_gateways ENABLE ROW LEVEL SECURITY;
 ALTER TABLE chat_historial ENABLE ROW LEVEL SECURITY;
+ALTER TABLE chat_memoria ENABLE ROW LEVEL SECURITY;
 ALTER TABLE sesiones ENABLE ROW LEVEL SECURITY;
 
 -- Políticas para usuarios (solo admins pueden ver todos)
@@ -141,6 +175,78 @@ VALUES (
     true
 );
 
+-- ============================================
+-- ESTADÍSTICAS AGREGADAS
+-- ============================================
+-- Contadores mantenidos por trigger para que el dashboard de admin no
+-- recorra analisis_gateways. Sentencias idempotentes: en bases existentes
+-- ejecutar esta sección y luego el backfill de MIGRACIONES.
+
+-- Análisis por día (UTC)
+CREATE TABLE IF NOT EXISTS estadisticas_diarias (
+    fecha DATE PRIMARY KEY,
+    total_analisis BIGINT NOT NULL DEFAULT 0
+);
+
+-- Análisis por usuario
+CREATE TABLE IF NOT EXISTS estadisticas_usuarios (
+    usuario_id UUID PRIMARY KEY REFERENCES usuarios(id) ON DELETE CASCADE,
+    total_analisis BIGINT NOT NULL DEFAULT 0,
+    ultimo_analisis TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_estadisticas_usuarios_total
+    ON estadisticas_usuarios(total_analisis DESC);
+
+ALTER TABLE estadisticas_diarias ENABLE ROW LEVEL SECURITY;
+ALTER TABLE estadisticas_usuarios ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION actualizar_estadisticas_analisis()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO estadisticas_diarias (fecha, total_analisis)
+        VALUES ((NEW.created_at AT TIME ZONE 'UTC')::date, 1)
+        ON CONFLICT (fecha) DO UPDATE
+            SET total_analisis = estadisticas_diarias.total_analisis + 1;
+
+        IF NEW.usuario_id IS NOT NULL THEN
+            INSERT INTO estadisticas_usuarios (usuario_id, total_analisis, ultimo_analisis)
+            VALUES (NEW.usuario_id, 1, NEW.created_at)
+            ON CONFLICT (usuario_id) DO UPDATE
+                SET total_analisis = estadisticas_usuarios.total_analisis + 1,
+                    ultimo_analisis = GREATEST(estadisticas_usuarios.ultimo_analisis, NEW.created_at);
+        END IF;
+        RETURN NEW;
+    END IF;
+
+    -- DELETE
+    UPDATE estadisticas_diarias
+        SET total_analisis = total_analisis - 1
+        WHERE fecha = (OLD.created_at AT TIME ZONE 'UTC')::date;
+
+    IF OLD.usuario_id IS NOT NULL THEN
+        UPDATE estadisticas_usuarios
+            SET total_analisis = total_analisis - 1,
+                ultimo_analisis = CASE
+                    WHEN ultimo_analisis > OLD.created_at THEN ultimo_analisis
+                    ELSE (
+                        SELECT MAX(created_at) FROM analisis_gateways
+                        WHERE usuario_id = OLD.usuario_id
+                    )
+                END
+            WHERE usuario_id = OLD.usuario_id;
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS trigger_analisis_estadisticas ON analisis_gateways;
+CREATE TRIGGER trigger_analisis_estadisticas
+    AFTER INSERT OR DELETE ON analisis_gateways
+    FOR EACH ROW
+    EXECUTE FUNCTION actualizar_estadisticas_analisis();
+
 -- ============================================
 -- VISTAS ÚTILES
 -- ============================================
@@ -158,15 +264,102 @@ SELECT
 FROM analisis_gateways a
 JOIN usuarios u ON a.usuario_id = u.id;
 
--- Vista de estadísticas por usuario
+-- Vista de estadísticas por usuario (lee los contadores agregados)
+DROP VIEW IF EXISTS vista_estadisticas_usuario;
 CREATE VIEW vista_estadisticas_usuario AS
 SELECT 
-    u.id,
+    u.id as usuario_id,
     u.email,
     u.nombre,
-    COUNT(a.id) as total_analisis,
-    MAX(a.created_at) as ultimo_analisis,
+    COALESCE(e.total_analisis, 0) as total_analisis,
+    e.ultimo_analisis,
     u.ultimo_acceso
 FROM usuarios u
-LEFT JOIN analisis_gateways a ON u.id = a.usuario_id
-GROUP BY u.id, u.email, u.nombre, u.ultimo_acceso;
+LEFT JOIN estadisticas_usuarios e ON u.id = e.usuario_id;
+
+-- Estadísticas del dashboard de admin en una sola llamada (RPC)
+CREATE OR REPLACE FUNCTION estadisticas_globales(top_n INTEGER DEFAULT 10)
+RETURNS JSON AS $$
+    WITH hoy AS (
+        SELECT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')::date AS fecha
+    )
+    SELECT json_build_object(
+        'total_usuarios', (SELECT COUNT(*) FROM usuarios),
+        'usuarios_activos', (SELECT COUNT(*) FROM usuarios WHERE activo),
+        'total_analisis', (SELECT COALESCE(SUM(total_analisis), 0) FROM estadisticas_diarias),
+        'analisis_hoy', (
+            SELECT COALESCE(SUM(d.total_analisis), 0)
+            FROM estadisticas_diarias d, hoy
+            WHERE d.fecha = hoy.fecha
+        ),
+        'analisis_semana', (
+            SELECT COALESCE(SUM(d.total_analisis), 0)
+            FROM estadisticas_diarias d, hoy
+            WHERE d.fecha >= hoy.fecha - 7
+        ),
+        'top_usuarios', COALESCE((
+            SELECT json_agg(t)
+            FROM (
+                SELECT * FROM vista_estadisticas_usuario
+                ORDER BY total_analisis DESC
+                LIMIT top_n
+            ) t
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- ============================================
+-- MIGRACIONES (bases creadas con versiones anteriores)
+-- ============================================
+
+-- Análisis asíncronos: detalle de error y fecha de último cambio de estado
+ALTER TABLE analisis_gateways ADD COLUMN IF NOT EXISTS error_detalle TEXT;
+ALTER TABLE analisis_gateways ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+DROP TRIGGER IF EXISTS trigger_analisis_updated ON analisis_gateways;
+CREATE TRIGGER trigger_analisis_updated
+    BEFORE UPDATE ON analisis_gateways
+    FOR EACH ROW
+    EXECUTE FUNCTION actualizar_timestamp();
+
+-- Datos técnicos estructurados: las filas antiguas guardan cada sección como
+-- texto. Convertirlas con: python -m scripts.migrar_datos_tecnicos (desde backend/)
+
+-- Informes IA servidos desde la caché de contenido
+ALTER TABLE analisis_gateways ADD COLUMN IF NOT EXISTS informe_desde_cache BOOLEAN DEFAULT false;
+
+-- Estadísticas agregadas: ejecutar la sección ESTADÍSTICAS AGREGADAS y la
+-- vista vista_estadisticas_usuario, y luego poblar los contadores una vez
+INSERT INTO estadisticas_diarias (fecha, total_analisis)
+SELECT (created_at AT TIME ZONE 'UTC')::date, COUNT(*)
+FROM analisis_gateways
+GROUP BY 1
+ON CONFLICT (fecha) DO UPDATE SET total_analisis = EXCLUDED.total_analisis;
+
+INSERT INTO estadisticas_usuarios (usuario_id, total_analisis, ultimo_analisis)
+SELECT usuario_id, COUNT(*), MAX(created_at)
+FROM analisis_gateways
+WHERE usuario_id IS NOT NULL
+GROUP BY usuario_id
+ON CONFLICT (usuario_id) DO UPDATE
+    SET total_analisis = EXCLUDED.total_analisis,
+        ultimo_analisis = EXCLUDED.ultimo_analisis;
+
+-- Paginación por cursor de análisis e historial de chat
+CREATE INDEX IF NOT EXISTS idx_analisis_usuario_fecha ON analisis_gateways(usuario_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_chat_analisis_fecha ON chat_historial(analisis_id, created_at, id);
+
+-- Memoria de chat (resumen incremental de conversaciones largas)
+CREATE TABLE IF NOT EXISTS chat_memoria (
+    analisis_id UUID PRIMARY KEY REFERENCES analisis_gateways(id) ON DELETE CASCADE,
+    resumen TEXT NOT NULL DEFAULT '',
+    turnos_resumidos INTEGER NOT NULL DEFAULT 0,
+    resumido_hasta TIMESTAMP WITH TIME ZONE,
+    resumido_hasta_id UUID,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+ALTER TABLE chat_memoria ENABLE ROW LEVEL SECURITY;
+DROP TRIGGER IF EXISTS trigger_chat_memoria_updated ON chat_memoria;
+CREATE TRIGGER trigger_chat_memoria_updated
+    BEFORE UPDATE ON chat_memoria
+    FOR EACH ROW
+    EXECUTE FUNCTION actualizar_timestamp();